@@ -0,0 +1,114 @@
+"""
+HTTP middleware for request instrumentation
+"""
+import asyncio
+import cProfile
+import time
+import uuid
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..config import PROFILE_ALL_REQUESTS
+from ..services import metrics, profiling
+
+
+class MetricsMiddleware:
+    """
+    Records latency and image bytes read for every HTTP request
+
+    Implemented as plain ASGI middleware so streamed responses are timed
+    until their last body chunk has been sent, and so the per-request
+    image I/O counter is visible to the route and its worker tasks.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stats, token = metrics.start_request()
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            # Use the route template so path parameters do not explode label cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.http_request_duration.observe(
+                time.perf_counter() - start, method=scope["method"], route=route, status=str(status))
+            metrics.http_request_image_bytes.observe(stats.bytes_read, route=route)
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+            metrics.end_request(token)
+
+
+class ProfilingMiddleware:
+    """
+    Runs opted-in requests under cProfile and stores the result
+
+    Only one profiler can be active on the event loop thread, so profiled
+    requests are serialized; anything else the loop runs meanwhile shows up
+    in the profile. Requests without the header pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp, profile_all: bool = PROFILE_ALL_REQUESTS):
+        self.app = app
+        self.profile_all = profile_all
+        self._lock = asyncio.Lock()
+
+    def _requested(self, scope: Scope) -> bool:
+        if self.profile_all:
+            return True
+        for name, value in scope.get("headers", ()):
+            if name == profiling.PROFILE_HEADER.encode():
+                return value.strip().lower() not in (b"", b"0", b"false", b"no", b"off")
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id" and value.decode("latin-1").isalnum():
+                request_id = value.decode("latin-1")
+        profile = profiling.RequestProfile(request_id or uuid.uuid4().hex, scope["method"], scope["path"])
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((profiling.PROFILE_ID_HEADER.lower().encode(), profile.request_id.encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        async with self._lock:
+            token = profiling.activate(profile)
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+                profile.duration = time.perf_counter() - start
+                profile.add(profiler)
+                profiling.deactivate(token)
+                profiling.profile_store.put(profile.request_id, profile)
@@ -0,0 +1,131 @@
+"""
+Content-negotiated encoding of large listing responses
+Records built by the services are trusted, so they are serialized without
+FastAPI's validation pass: row JSON by the Pydantic core serializer, or
+column batches for clients that ask for them, compressed when accepted
+"""
+import gzip
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type, get_args
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
+from ..config import COMPRESS_RESPONSES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Accept this media type to get lists of records as columns
+COLUMNS_MEDIA_TYPE = "application/vnd.forensix.columns+json"
+
+# Smaller bodies are sent uncompressed
+COMPRESS_MIN_SIZE = 4096
+# Fast levels; on listings they compress nearly as well as the defaults
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+@lru_cache(maxsize=None)
+def _adapter(annotation: Any) -> TypeAdapter:
+    return TypeAdapter(annotation)
+
+
+def _is_model(annotation: Any) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def _contains_model(annotation: Any) -> bool:
+    return _is_model(annotation) or any(_contains_model(arg) for arg in get_args(annotation))
+
+
+@lru_cache(maxsize=None)
+def _column_plan(model: Type[BaseModel], prefix: str = "") -> Tuple[Tuple[str, Tuple[str, ...], Optional[TypeAdapter]], ...]:
+    """
+    (column name, attribute path, serializer) per column of a model
+    Nested models become dotted columns; other fields holding models are
+    serialized per value
+    """
+    plan = []
+    for name, field in model.model_fields.items():
+        if _is_model(field.annotation):
+            for column, path, adapter in _column_plan(field.annotation, f"{prefix}{name}."):
+                plan.append((column, (name,) + path, adapter))
+            continue
+        adapter = _adapter(List[field.annotation]) if _contains_model(field.annotation) else None
+        plan.append((prefix + name, (name,), adapter))
+    return tuple(plan)
+
+
+def encode_columns(model: Type[BaseModel], items: Sequence[BaseModel]) -> Dict[str, Any]:
+    """Records of one model as {"length": n, "columns": {name: values}}"""
+    columns = {}
+    for column, path, adapter in _column_plan(model):
+        values = items
+        for attribute in path:
+            values = [getattr(value, attribute) for value in values]
+        columns[column] = adapter.dump_python(values, mode="json") if adapter is not None else values
+    return {"length": len(items), "columns": columns}
+
+
+def _accepts(header: str, token: str) -> bool:
+    """Whether a comma-separated Accept-style header lists token with a non-zero quality"""
+    for part in header.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() == token:
+            quality = params.strip()
+            if not quality.startswith("q="):
+                return True
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def _compress(request: Request, body: bytes, headers: Dict[str, str]) -> bytes:
+    if not COMPRESS_RESPONSES or len(body) < COMPRESS_MIN_SIZE:
+        return body
+    accepted = request.headers.get("accept-encoding", "")
+    if zstandard is not None and _accepts(accepted, "zstd"):
+        headers["Content-Encoding"] = "zstd"
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if _accepts(accepted, "gzip"):
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def encoded_response(request: Request, content: Any, annotation: Any,
+                     columns: Optional[Callable[[], Dict[str, Any]]] = None) -> Response:
+    """
+    Response for content of the given type, negotiated from the request
+
+    Args:
+        request: Incoming request (Accept and Accept-Encoding headers)
+        content: Records as returned by the services
+        annotation: Type of content, as for response_model
+        columns: Column batch form of content, used when the client accepts COLUMNS_MEDIA_TYPE
+    """
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if columns is not None and _accepts(request.headers.get("accept", ""), COLUMNS_MEDIA_TYPE):
+        media_type = COLUMNS_MEDIA_TYPE
+        body = _dumps(columns())
+    else:
+        media_type = "application/json"
+        body = _adapter(annotation).dump_json(content)
+    return Response(_compress(request, body, headers), media_type=media_type, headers=headers)
@@ -1,20 +1,44 @@
 """
 FastAPI routes for disk forensics operations
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse
 from typing import List, Optional
+import itertools
+import json
 import os
-import tempfile
-import shutil
 from pathlib import Path
 
 from ..models.schemas import (
     DiskImageInfo, DiskImageOpenRequest, FileExtractionRequest,
-    FileMetadata, FileAnalysisRequest, HashResult, ProgressUpdate
+    FileMetadata, FileAnalysisRequest, HashResult, ProgressUpdate,
+    DirectoryListingRequest, DirectoryListing, OrphanScanRequest,
+    UploadCreateRequest, UploadStatus, BulkExportRequest, ExportManifest,
+    ContainerSearchRequest, ContainerInfo, FileExtent, FileExtentMap,
+    SpaceRegionRequest, SpaceRegion, VolumeLayout, SimilarityIndexRequest,
+    SimilarityIndexResult, SimilaritySearchRequest, SimilaritySearchResult, SimilarFile,
+    DuplicateSearchRequest, DuplicateSource, DuplicateReport, RuleScanRequest, ScanRule,
+    RiskAssessmentRequest, RiskAssessment, ReportRequest
 )
+from ..config import UPLOAD_BUFFER_SIZE
+from .responses import encode_columns, encoded_response
 from ..services.image_handler import DiskImageHandler
 from ..services.filesystem_analyzer import FilesystemAnalyzer
+from ..services.cache import directory_cache, extent_cache
+from ..services.recovery import OrphanScanner
+from ..services.regions import RegionSource
+from ..services.dedup import DedupSource, DuplicateFinder
+from ..services.rules import BUILTIN_RULES, RuleScanner, compile_rules
+from ..services.exporter import BulkExporter, EXPORT_FORMATS
+from ..services.nested import NestedImageHandler, ContainerFinder, parse_nested_path
+from ..services.upload_manager import upload_manager, UploadOffsetError
+from ..services import metrics
+from ..services.profiling import profile_store
+from ..services.results_store import results_store
+from ..services.similarity import similarity_index
+from ..services.risk import risk_index
+from ..services.report import ReportBuilder
 
 
 router = APIRouter(prefix="/api/forensics", tags=["forensics"])
@@ -23,45 +47,147 @@ router = APIRouter(prefix="/api/forensics", tags=["forensics"])
 active_images = {}
 
 
+def _create_handler(image_path: str) -> DiskImageHandler:
+    """Handler for an image file, or for a container nested in an open image"""
+    nested = parse_nested_path(image_path)
+    if nested:
+        parent_path, partition_id, locator = nested
+        return NestedImageHandler(_get_handler(parent_path), partition_id, locator)
+    return DiskImageHandler(image_path)
+
+
+def _get_handler(image_path: str) -> DiskImageHandler:
+    """Get the active handler for an image, opening it on first use"""
+    handler = active_images.get(image_path)
+    if not handler:
+        handler = _create_handler(image_path)
+        handler.open()
+        active_images[image_path] = handler
+    return handler
+
+
+def _stream_error(error: Exception) -> str:
+    """Last line of an NDJSON stream that failed after it started"""
+    return json.dumps({"error": str(error)}) + "\n"
+
+
 @router.post("/upload-image")
 async def upload_disk_image(file: UploadFile = File(...)):
     """
-    Upload a disk image file
-    Returns the path where the image is stored
+    Upload a disk image file in a single request
+    Returns the path where the image is stored along with its hashes
     """
     try:
-        # Create temporary directory for uploaded images
-        upload_dir = Path(tempfile.gettempdir()) / "forensix_uploads"
-        upload_dir.mkdir(exist_ok=True)
+        session = await upload_manager.create(file.filename)
         
-        # Save uploaded file
-        file_path = upload_dir / file.filename
+        async def chunks():
+            while True:
+                chunk = await file.read(UPLOAD_BUFFER_SIZE)
+                if not chunk:
+                    break
+                yield chunk
         
-        with open(file_path, 'wb') as f:
-            shutil.copyfileobj(file.file, f)
+        await upload_manager.write(session.upload_id, 0, chunks())
+        await upload_manager.complete(session.upload_id)
         
         return {
             "success": True,
-            "file_path": str(file_path),
-            "filename": file.filename,
-            "size": file_path.stat().st_size
+            "file_path": str(session.file_path),
+            "filename": session.filename,
+            "size": session.received,
+            "md5": session.md5,
+            "sha256": session.sha256
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
 
+@router.post("/uploads", response_model=UploadStatus)
+async def create_upload(request: UploadCreateRequest):
+    """
+    Start a resumable chunked upload
+    """
+    try:
+        session = await upload_manager.create(request.filename, request.total_size)
+        return session.status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create upload: {str(e)}")
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadStatus)
+async def get_upload(upload_id: str):
+    """
+    Get the state of an upload; `received` is the offset to resume from
+    """
+    try:
+        session = await upload_manager.get(upload_id)
+        return session.status()
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get upload: {str(e)}")
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadStatus)
+async def upload_part(upload_id: str, offset: int, request: Request):
+    """
+    Write the request body as the part starting at `offset`
+    """
+    try:
+        session = await upload_manager.write(upload_id, offset, request.stream())
+        return session.status()
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "expected_offset": e.expected})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to write upload part: {str(e)}")
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadStatus)
+async def complete_upload(upload_id: str):
+    """
+    Finish an upload and return its stored path and hashes
+    """
+    try:
+        session = await upload_manager.complete(upload_id)
+        return session.status()
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to complete upload: {str(e)}")
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """
+    Abort an upload and delete its data
+    """
+    try:
+        await upload_manager.abort(upload_id)
+        return {"success": True, "message": "Upload aborted"}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {upload_id}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to abort upload: {str(e)}")
+
+
 @router.post("/open-image", response_model=DiskImageInfo)
 async def open_disk_image(request: DiskImageOpenRequest):
     """
     Open a disk image and get its information
-    Supports E01 and raw disk images
+    Supports E01 and raw disk images, and nested images found by find-containers
     """
     try:
-        if not os.path.exists(request.file_path):
+        if not os.path.exists(request.file_path) and not parse_nested_path(request.file_path):
             raise HTTPException(status_code=404, detail=f"Image file not found: {request.file_path}")
         
         # Create image handler
-        handler = DiskImageHandler(request.file_path)
+        handler = _create_handler(request.file_path)
         handler.open()
         
         # Store handler for later use
@@ -71,23 +197,32 @@ async def open_disk_image(request: DiskImageOpenRequest):
         image_info = handler.get_image_info()
         
         return image_info
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to open image: {str(e)}")
 
 
+@router.post("/volume-layout", response_model=VolumeLayout)
+async def get_volume_layout(request: DiskImageOpenRequest):
+    """
+    Get unpartitioned regions and hidden or protective partitions of an image
+    """
+    try:
+        handler = _get_handler(request.file_path)
+        return handler.get_volume_layout()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to analyze volume layout: {str(e)}")
+
+
 @router.post("/extract-files", response_model=List[FileMetadata])
-async def extract_files(request: FileExtractionRequest):
+async def extract_files(request: FileExtractionRequest, http_request: Request):
     """
     Extract file metadata from a partition
+    Sent as column batches to clients accepting application/vnd.forensix.columns+json
     """
     try:
-        # Get the image handler
-        handler = active_images.get(request.image_path)
-        if not handler:
-            # Try to open it
-            handler = DiskImageHandler(request.image_path)
-            handler.open()
-            active_images[request.image_path] = handler
+        handler = _get_handler(request.image_path)
         
         # Create filesystem analyzer
         analyzer = FilesystemAnalyzer(handler)
@@ -95,29 +230,273 @@ async def extract_files(request: FileExtractionRequest):
         # List files from the partition
         files = analyzer.list_files(
             partition_id=request.partition_id,
-            path="/",
+            path=request.path,
             max_files=request.max_files,
             include_deleted=request.include_deleted,
-            include_directories=False
+            include_directories=request.include_directories,
+            include_attributes=request.include_attributes
         )
         
-        return files
+        return encoded_response(http_request, files, List[FileMetadata],
+                                columns=lambda: encode_columns(FileMetadata, files))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to extract files: {str(e)}")
 
 
+@router.post("/list-directory", response_model=DirectoryListing)
+async def list_directory(request: DirectoryListingRequest, http_request: Request):
+    """
+    List the immediate children of one directory by inode
+    Entries are sent as column batches to clients accepting application/vnd.forensix.columns+json
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        analyzer = FilesystemAnalyzer(handler)
+        
+        listing = analyzer.list_directory(
+            partition_id=request.partition_id,
+            inode=request.inode,
+            path=request.path,
+            include_deleted=request.include_deleted
+        )
+        
+        def columns():
+            return {**listing.model_dump(mode="json", exclude={"entries"}),
+                    "entries": encode_columns(FileMetadata, listing.entries)}
+        
+        return encoded_response(http_request, listing, DirectoryListing, columns=columns)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list directory: {str(e)}")
+
+
+@router.post("/recover-orphans")
+async def recover_orphans(request: OrphanScanRequest):
+    """
+    Scan a partition's inode / MFT range for unallocated records
+    Streams one JSON RecoveredFile per line as batches complete
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        scanner = OrphanScanner(handler)
+        records = scanner.scan(
+            partition_id=request.partition_id,
+            batch_size=request.batch_size,
+            min_recoverability=request.min_recoverability,
+            include_named=request.include_named
+        )
+        # Fail before streaming starts on unknown partitions or unreadable filesystems
+        first = next(records, None)
+        
+        def stream():
+            try:
+                if first is None:
+                    return
+                for record in itertools.chain([first], records):
+                    yield record.model_dump_json() + "\n"
+            except Exception as e:
+                print(f"Orphan scan aborted: {e}")
+                yield _stream_error(e)
+        
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to scan for orphans: {str(e)}")
+
+
+@router.get("/scan-rules", response_model=List[ScanRule])
+async def get_scan_rules():
+    """
+    Built-in rules used by rule-scan when a request names none
+    """
+    return BUILTIN_RULES
+
+
+@router.post("/rule-scan")
+async def scan_rules(request: RuleScanRequest):
+    """
+    Scan a partition's files against a set of rules
+    Streams one JSON RuleMatch per line as batches of files complete
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        # Bad rules fail here, before streaming starts
+        rule_set = compile_rules(request.rules)
+        scanner = RuleScanner(handler)
+        matches = scanner.scan(
+            partition_id=request.partition_id,
+            rule_set=rule_set,
+            path=request.path,
+            max_files=request.max_files,
+            include_deleted=request.include_deleted
+        )
+        # Unknown partitions and failed listings also fail before streaming starts
+        first = next(matches, None)
+        
+        def stream():
+            try:
+                if first is None:
+                    return
+                for match in itertools.chain([first], matches):
+                    yield match.model_dump_json() + "\n"
+            except Exception as e:
+                print(f"Rule scan aborted: {e}")
+                yield _stream_error(e)
+        
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to scan files: {str(e)}")
+
+
+@router.post("/risk-assessment", response_model=RiskAssessment)
+async def assess_risk(request: RiskAssessmentRequest):
+    """
+    CIA scores and ATT&CK mapping of a partition, or of all partitions
+    Computed from counters kept up to date by directory walks and rule
+    scans, so the cost does not depend on the number of files
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        partition_ids = [request.partition_id] if request.partition_id else [
+            p.id for p in handler.get_partitions() if not p.filesystem_type.startswith('Unknown')
+        ]
+        return risk_index.assess(handler.get_fingerprint(), partition_ids)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to assess risk: {str(e)}")
+
+
+@router.post("/report")
+async def generate_report(request: ReportRequest):
+    """
+    Generate a forensic report of an image as JSON or text
+    Sections are streamed from the path index, stored hashes and risk
+    counters, so large cases are not held in memory on either side
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        # Bad formats, sections and partitions fail here, before streaming starts
+        builder = ReportBuilder(handler, request)
+        chunks = builder.stream()
+        
+        def stream():
+            try:
+                yield from chunks
+            except Exception as e:
+                print(f"Report aborted: {e}")
+        
+        extension, media_type = ("json", "application/json") if request.format == "json" else ("txt", "text/plain")
+        filename = f"{Path(request.image_path).stem}-report.{extension}"
+        return StreamingResponse(
+            stream(),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
+
+
+@router.post("/space-regions")
+async def list_space_regions(request: SpaceRegionRequest):
+    """
+    List a partition's unallocated runs and file slack in image order
+    Streams one JSON SpaceRegion per line
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        source = RegionSource(handler)
+        regions = source.regions(
+            partition_id=request.partition_id,
+            kinds=request.kinds,
+            min_length=request.min_length,
+            max_files=request.max_files
+        )
+        # Fail before streaming starts on bad kinds or unsupported filesystems
+        first = next(regions, None)
+        
+        def stream():
+            try:
+                if first is None:
+                    return
+                for region in itertools.chain([first], regions):
+                    yield SpaceRegion(**region._asdict()).model_dump_json() + "\n"
+            except Exception as e:
+                print(f"Region listing aborted: {e}")
+        
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list regions: {str(e)}")
+
+
+@router.post("/find-containers", response_model=List[ContainerInfo])
+async def find_containers(request: ContainerSearchRequest):
+    """
+    Find VHD/VHDX, E01, raw image and ZIP containers (and NTFS shadow copies)
+    in a partition; open one by passing its image_path to open-image
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        return ContainerFinder(handler).find(
+            partition_id=request.partition_id,
+            path=request.path,
+            max_files=request.max_files
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to find containers: {str(e)}")
+
+
+@router.post("/export-files")
+async def export_files(request: BulkExportRequest):
+    """
+    Export many files at once with a chain-of-custody manifest
+    format 'zip' or 'tar' streams an archive; 'directory' writes the files
+    under the server's export root and returns the manifest
+    """
+    if request.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {request.format}")
+    try:
+        handler = _get_handler(request.image_path)
+        exporter = BulkExporter(handler)
+        # Listing and copying run off the event loop, which keeps serving other requests
+        items = await run_in_threadpool(exporter.select, request)
+        
+        if request.format == "directory":
+            return await run_in_threadpool(exporter.export_to_directory, request, items)
+        
+        filename = f"{Path(request.image_path).stem}-{request.partition_id}.{request.format}"
+        return StreamingResponse(
+            exporter.stream_archive(request, items),
+            media_type="application/zip" if request.format == "zip" else "application/x-tar",
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"Export destination already exists: {request.destination}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to export files: {str(e)}")
+
+
 @router.post("/read-file")
 async def read_file(request: FileAnalysisRequest):
     """
     Read file contents from a disk image
     """
     try:
-        # Get the image handler
-        handler = active_images.get(request.image_path)
-        if not handler:
-            handler = DiskImageHandler(request.image_path)
-            handler.open()
-            active_images[request.image_path] = handler
+        handler = _get_handler(request.image_path)
         
         # Create filesystem analyzer
         analyzer = FilesystemAnalyzer(handler)
@@ -125,7 +504,9 @@ async def read_file(request: FileAnalysisRequest):
         # Read file
         file_data = analyzer.read_file(
             partition_id=request.partition_id,
-            file_path=request.file_path
+            file_path=request.file_path,
+            inode=request.inode,
+            attr_id=request.attr_id
         )
         
         # Return as streaming response
@@ -146,12 +527,7 @@ async def calculate_file_hash(request: FileAnalysisRequest):
     Calculate hash values for a file
     """
     try:
-        # Get the image handler
-        handler = active_images.get(request.image_path)
-        if not handler:
-            handler = DiskImageHandler(request.image_path)
-            handler.open()
-            active_images[request.image_path] = handler
+        handler = _get_handler(request.image_path)
         
         # Create filesystem analyzer
         analyzer = FilesystemAnalyzer(handler)
@@ -159,7 +535,10 @@ async def calculate_file_hash(request: FileAnalysisRequest):
         # Calculate hashes
         hash_result = analyzer.calculate_file_hash(
             partition_id=request.partition_id,
-            file_path=request.file_path
+            file_path=request.file_path,
+            inode=request.inode,
+            attr_id=request.attr_id,
+            similarity=request.similarity
         )
         
         return hash_result
@@ -167,27 +546,215 @@ async def calculate_file_hash(request: FileAnalysisRequest):
         raise HTTPException(status_code=500, detail=f"Failed to calculate hash: {str(e)}")
 
 
+@router.post("/similarity-index", response_model=SimilarityIndexResult)
+async def index_similarity(request: SimilarityIndexRequest):
+    """
+    Hash a partition's files (reusing stored hashes) and add their
+    similarity digests to the index searched by similar-files
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        analyzer = FilesystemAnalyzer(handler)
+        # Hashing a partition takes long; the event loop keeps serving meanwhile
+        indexed, without_digest, failed = await run_in_threadpool(
+            analyzer.index_similarity,
+            partition_id=request.partition_id,
+            path=request.path,
+            max_files=request.max_files
+        )
+        return SimilarityIndexResult(
+            partition_id=request.partition_id,
+            indexed=indexed,
+            without_digest=without_digest,
+            failed=failed,
+            index_size=len(similarity_index)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to index files: {str(e)}")
+
+
+@router.post("/similar-files", response_model=SimilaritySearchResult)
+async def find_similar_files(request: SimilaritySearchRequest):
+    """
+    Find indexed files similar to a file or a digest, across all indexed images
+    """
+    try:
+        digest = request.digest
+        searched = None
+        if digest is None:
+            if request.image_path is None or (request.file_path is None and request.inode is None):
+                raise HTTPException(status_code=400, detail="Pass a digest, or an image_path with a file_path or inode")
+            handler = _get_handler(request.image_path)
+            analyzer = FilesystemAnalyzer(handler)
+            digest = analyzer.calculate_file_hash(
+                partition_id=request.partition_id,
+                file_path=request.file_path or "",
+                inode=request.inode,
+                similarity=True
+            ).similarity
+            if digest is None:
+                raise HTTPException(status_code=422, detail="The file is too small, too uniform or too large for a similarity digest")
+            # The file itself is not reported as similar to itself
+            searched = (request.image_path, request.partition_id, request.inode, request.file_path)
+        
+        matches = [
+            SimilarFile(image_path=image_path, partition_id=partition_id, inode=inode, path=path, distance=distance)
+            for (image_path, partition_id, inode, path), distance
+            in similarity_index.query(digest, request.threshold)
+            if searched is None or (image_path, partition_id) != searched[:2]
+            or (inode != searched[2] and path != searched[3])
+        ]
+        return SimilaritySearchResult(digest=digest, matches=matches[:request.limit])
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search similar files: {str(e)}")
+
+
+@router.post("/find-duplicates", response_model=DuplicateReport)
+async def find_duplicates(request: DuplicateSearchRequest):
+    """
+    Find identical files across images and partitions
+    Files are grouped by size, then by a hash of their first and last
+    64 KiB, and only files still colliding are hashed in full
+    """
+    try:
+        requested = request.sources or [DuplicateSource(image_path=path) for path in active_images]
+        sources = []
+        for source in requested:
+            handler = _get_handler(source.image_path)
+            partition_ids = [source.partition_id] if source.partition_id else [
+                p.id for p in handler.get_partitions() if not p.filesystem_type.startswith('Unknown')
+            ]
+            sources.extend(DedupSource(source.image_path, handler, partition_id) for partition_id in partition_ids)
+        if not sources:
+            raise HTTPException(status_code=400, detail="No open images to search")
+        
+        finder = DuplicateFinder(sources)
+        # Hashing can take hours on large cases; the event loop keeps serving meanwhile
+        return await run_in_threadpool(finder.find, path=request.path, max_files=request.max_files,
+                                       min_size=request.min_size)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to find duplicates: {str(e)}")
+
+
+@router.post("/file-extents", response_model=FileExtentMap)
+async def get_file_extents(request: FileAnalysisRequest):
+    """
+    Get the extent map of a file: where each piece of its content lies in the image
+    """
+    try:
+        handler = _get_handler(request.image_path)
+        analyzer = FilesystemAnalyzer(handler)
+        inode, attr_id, extent_map = analyzer.get_extent_map(
+            partition_id=request.partition_id,
+            file_path=request.file_path,
+            inode=request.inode,
+            attr_id=request.attr_id
+        )
+        if extent_map is None:
+            raise HTTPException(status_code=404, detail=f"{request.file_path} has no data attribute")
+        
+        return FileExtentMap(
+            inode=inode,
+            attr_id=attr_id,
+            size=extent_map.size,
+            block_size=extent_map.block_size,
+            direct=extent_map.direct,
+            reason=extent_map.reason,
+            extents=[
+                FileExtent(logical_offset=extent.logical_offset, length=extent.length,
+                           physical_offset=extent.physical_offset,
+                           sparse=extent.physical_offset is None)
+                for extent in extent_map.extents
+            ]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to map file extents: {str(e)}")
+
+
 @router.post("/close-image")
 async def close_disk_image(request: DiskImageOpenRequest):
     """
     Close a disk image and free resources
     """
     try:
-        handler = active_images.get(request.file_path)
-        if handler:
-            handler.close()
-            del active_images[request.file_path]
+        # Nested images read through this one are closed with it
+        prefix = request.file_path + "::"
+        paths = [p for p in active_images if p == request.file_path or p.startswith(prefix)]
+        for path in sorted(paths, key=len, reverse=True):
+            active_images.pop(path).close()
+        for cache in (directory_cache, extent_cache, similarity_index):
+            cache.discard_where(lambda key: key[0] == request.file_path or key[0].startswith(prefix))
         
         return {"success": True, "message": "Image closed successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to close image: {str(e)}")
 
 
+@router.delete("/results/{fingerprint}")
+async def forget_results(fingerprint: str):
+    """
+    Drop the stored analysis results of an image so it is analyzed afresh
+    """
+    try:
+        removed = results_store.forget(fingerprint)
+        risk_index.discard(fingerprint)
+        return {"success": True, "removed": removed}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to forget results: {str(e)}")
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    List stored request profiles, most recent last
+    """
+    return [
+        {k: v for k, v in profile.summary(limit=0).items() if k not in ("functions", "native_calls")}
+        for profile in (profile_store.peek(key) for key in profile_store.keys())
+    ]
+
+
+@router.get("/profiles/{request_id}")
+async def get_profile(request_id: str, format: str = "json", sort: str = "cumulative", limit: int = 60):
+    """
+    Download the profile of a request
+    format: json (summary with pytsk3/pyewf breakdown), text (pstats report)
+    or pstats (binary file for pstats / snakeviz)
+    """
+    profile = profile_store.peek(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {request_id}")
+    
+    if format == "json":
+        return profile.summary(limit=limit)
+    if format == "text":
+        try:
+            return PlainTextResponse(profile.text(sort=sort, limit=limit))
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort}")
+    if format == "pstats":
+        return Response(
+            profile.dump(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f"attachment; filename=profile-{request_id}.prof"}
+        )
+    raise HTTPException(status_code=400, detail=f"Unknown profile format: {format}")
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "service": "ForensiX Backend",
-        "active_images": len(active_images)
+        "active_images": len(active_images),
+        "metrics": metrics.snapshot()
     }
@@ -0,0 +1,414 @@
+"""
+Multi-process deployment behind an image-affinity proxy
+Each worker process is a complete backend on a local port. The proxy sends
+every request naming an image to the worker that already has the image
+open, so handles, path indexes and caches stay warm in one process, and
+workers share earlier results through the results store on disk.
+
+    python -m app.cluster --host 0.0.0.0 --port 8000 --workers 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+import httpx
+import uvicorn
+from starlette.types import Receive, Scope, Send
+from .config import WORKERS, WORKER_BASE_PORT
+from .services.cache import LRUCache
+from .services.profiling import PROFILE_ID_HEADER
+
+
+API_PREFIX = "/api/forensics"
+
+# Routes using in-memory indexes that span images; they all go to the first worker
+SHARED_ROUTES = ("/similarity-index", "/similar-files", "/find-duplicates")
+# Routes dropping per-image state, which any worker may hold; sent to every worker
+BROADCAST_ROUTES = ("/close-image", "/results/")
+# Per-process views (GET paths); fetched from every worker and merged
+METRICS_PATH = "/metrics"
+AGGREGATE_PATHS = (METRICS_PATH, API_PREFIX + "/health", API_PREFIX + "/profiles")
+
+# Request bodies up to this size are read to find the image they name;
+# larger ones (uploads) are streamed through
+AFFINITY_BODY_LIMIT = 1024 * 1024
+
+# Profiled requests remembered, so their profiles are fetched from the right worker
+PROFILE_ROUTES_SIZE = 4096
+
+WORKER_HEADER = "X-Forensix-Worker"
+HOP_HEADERS = {
+    b"connection", b"keep-alive", b"proxy-connection", b"te", b"trailer",
+    b"transfer-encoding", b"upgrade", b"host",
+}
+
+# Seconds to wait for a worker to accept connections
+WORKER_START_TIMEOUT = 60
+
+
+def affinity_key(route: str, body: Optional[dict]) -> Optional[str]:
+    """
+    What a request is about: the image it names (the outermost one for
+    nested images), an upload id, or None for requests about no image
+    """
+    if route.startswith("/uploads/"):
+        return "upload:" + route.split("/")[2]
+    if not isinstance(body, dict):
+        return None
+    path = body.get("image_path") or body.get("file_path")
+    sources = body.get("sources")
+    if not path and isinstance(sources, list) and sources and isinstance(sources[0], dict):
+        path = sources[0].get("image_path")
+    return path.split("::")[0] if isinstance(path, str) and path else None
+
+
+def worker_for(key: str, workers: int) -> int:
+    """Worker index of an affinity key, stable across restarts"""
+    return zlib.crc32(key.encode()) % workers
+
+
+def _label_sample(line: str, worker: int) -> str:
+    """A Prometheus sample line with a worker label added"""
+    label = f'worker="{worker}"'
+    name, brace, rest = line.partition("{")
+    if brace:
+        return f"{name}{{{label}{'' if rest.startswith('}') else ','}{rest}"
+    name, _, value = line.partition(" ")
+    return f"{name}{{{label}}} {value}"
+
+
+def merge_metrics(texts: Dict[int, str]) -> str:
+    """
+    Prometheus text from several workers as one exposition: each family's
+    HELP and TYPE once, followed by the samples of every worker with a
+    worker label
+    """
+    headers: Dict[str, List[str]] = {}
+    samples: Dict[str, List[str]] = {}
+    for worker, text in sorted(texts.items()):
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = line.split(" ", 3)[2]
+                if line not in headers.setdefault(family, []):
+                    headers[family].append(line)
+                samples.setdefault(family, [])
+            elif line and not line.startswith("#") and family is not None:
+                samples[family].append(_label_sample(line, worker))
+    lines = []
+    for family, header in headers.items():
+        lines.extend(header)
+        lines.extend(samples[family])
+    return "\n".join(lines) + "\n"
+
+
+class AffinityProxy:
+    """
+    ASGI reverse proxy in front of the worker processes
+
+    Request and response bodies are streamed through unchanged, so NDJSON
+    scans, archive exports and uploads behave as with a single process.
+    The proxy remembers which images were opened, so cross-image requests
+    that default to "all open images" still see images opened on any worker.
+    """
+
+    def __init__(self, ports: List[int]):
+        self.ports = ports
+        self.clients: List[Optional[httpx.AsyncClient]] = [None] * len(ports)
+        self.opened: Set[str] = set()
+        self.profiles = LRUCache(PROFILE_ROUTES_SIZE)
+        self._round_robin = itertools.count()
+
+    def _client(self, worker: int) -> httpx.AsyncClient:
+        if self.clients[worker] is None:
+            self.clients[worker] = httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{self.ports[worker]}",
+                timeout=httpx.Timeout(None, connect=10.0),
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=64))
+        return self.clients[worker]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        route = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+        headers = [(k, v) for k, v in scope["headers"] if k.lower() not in HOP_HEADERS]
+        body, more = await self._read_prefix(receive)
+        parsed = None
+        if not more and body and dict(headers).get(b"content-type", b"").startswith(b"application/json"):
+            try:
+                parsed = json.loads(body)
+            except ValueError:
+                pass
+
+        if route == "/find-duplicates" and isinstance(parsed, dict) and not parsed.get("sources"):
+            # Workers only know the images opened on them
+            parsed["sources"] = [{"image_path": image} for image in sorted(self.opened)]
+            body = json.dumps(parsed).encode()
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+            headers.append((b"content-length", str(len(body)).encode()))
+
+        key = affinity_key(route, parsed)
+        if route.startswith("/profiles/"):
+            worker = self.profiles.get(route.split("/")[2])
+        elif route.startswith(SHARED_ROUTES):
+            worker = 0
+        elif key is not None:
+            worker = worker_for(key, len(self.ports))
+        else:
+            worker = None
+        if worker is None:
+            worker = next(self._round_robin) % len(self.ports)
+
+        if scope["method"] == "GET" and path in AGGREGATE_PATHS:
+            status = await self._aggregate(scope, headers, send)
+        elif route.startswith(BROADCAST_ROUTES):
+            status = await self._broadcast(scope, headers, body, worker, send)
+        else:
+            status = await self._forward(scope, headers, body, more, receive, worker, send)
+
+        if status == 200 and isinstance(parsed, dict) and isinstance(parsed.get("file_path"), str):
+            self._track(route, parsed["file_path"])
+
+    async def _read_prefix(self, receive: Receive) -> Tuple[bytes, bool]:
+        """Read the request body up to AFFINITY_BODY_LIMIT; returns (body read, more to come)"""
+        body = bytearray()
+        more = True
+        while more and len(body) <= AFFINITY_BODY_LIMIT:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+        return bytes(body), more
+
+    def _request(self, scope: Scope, headers: List[Tuple[bytes, bytes]], content, worker: int) -> httpx.Request:
+        path = scope.get("raw_path") or scope["path"].encode()
+        url = path.decode() + ("?" + scope["query_string"].decode() if scope["query_string"] else "")
+        return self._client(worker).build_request(scope["method"], url, headers=headers, content=content)
+
+    async def _forward(self, scope: Scope, headers: List[Tuple[bytes, bytes]], body: bytes, more: bool,
+                       receive: Receive, worker: int, send: Send) -> int:
+        """Stream a request to a worker and its response back; returns the status sent"""
+        async def content():
+            yield body
+            remaining = more
+            while remaining:
+                message = await receive()
+                yield message.get("body", b"")
+                remaining = message.get("more_body", False)
+
+        try:
+            response = await self._client(worker).send(
+                self._request(scope, headers, content() if more else body, worker), stream=True)
+        except httpx.TransportError as e:
+            await _send_error(send, 503, f"Worker {worker} unavailable: {e}")
+            return 503
+
+        try:
+            profile_id = response.headers.get(PROFILE_ID_HEADER)
+            if profile_id:
+                self.profiles.put(profile_id, worker)
+            await send({"type": "http.response.start", "status": response.status_code,
+                        "headers": _response_headers(response, worker)})
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+        return response.status_code
+
+    async def _broadcast(self, scope: Scope, headers: List[Tuple[bytes, bytes]], body: bytes,
+                         worker: int, send: Send) -> int:
+        """
+        Send a request to every worker, the given one first, and answer with
+        its response; returns the status sent
+        """
+        responses: Dict[int, httpx.Response] = {}
+        for index in [worker] + [i for i in range(len(self.ports)) if i != worker]:
+            try:
+                responses[index] = await self._client(index).send(self._request(scope, headers, body, index))
+            except httpx.TransportError as e:
+                print(f"Worker {index} unavailable for {scope['path']}: {e}")
+        response = responses.get(worker) or next(iter(responses.values()), None)
+        if response is None:
+            await _send_error(send, 503, "No worker available")
+            return 503
+        await send({"type": "http.response.start", "status": response.status_code,
+                    "headers": _response_headers(response, worker)})
+        await send({"type": "http.response.body", "body": response.content})
+        return response.status_code
+
+    async def _aggregate(self, scope: Scope, headers: List[Tuple[bytes, bytes]], send: Send) -> int:
+        """
+        Answer a metrics, health or profile listing request from all workers:
+        metrics with a worker label, health per worker with the open image
+        count summed, profiles of every worker in one list
+        """
+        async def fetch(index: int) -> Optional[httpx.Response]:
+            try:
+                response = await self._client(index).send(self._request(scope, headers, b"", index))
+                return response if response.status_code == 200 else None
+            except httpx.TransportError as e:
+                print(f"Worker {index} unavailable for {scope['path']}: {e}")
+                return None
+
+        fetched = await asyncio.gather(*(fetch(index) for index in range(len(self.ports))))
+        responses = {index: response for index, response in enumerate(fetched) if response is not None}
+        if not responses:
+            await _send_error(send, 503, "No worker available")
+            return 503
+
+        path = scope["path"]
+        if path == METRICS_PATH:
+            body = merge_metrics({index: response.text for index, response in responses.items()}).encode()
+            media_type = responses[min(responses)].headers.get("content-type", "text/plain")
+        else:
+            content: Any
+            if path.endswith("/profiles"):
+                content = []
+                for index, response in responses.items():
+                    for profile in response.json():
+                        self.profiles.put(profile["request_id"], index)
+                        content.append(dict(profile, worker=index))
+                content.sort(key=lambda profile: profile.get("started") or 0)
+            else:
+                workers = [dict(responses[index].json(), worker=index) if index in responses
+                           else {"worker": index, "status": "unavailable"} for index in range(len(self.ports))]
+                content = {
+                    "status": "healthy" if len(responses) == len(self.ports) else "degraded",
+                    "service": workers[min(responses)]["service"],
+                    "active_images": sum(w.get("active_images", 0) for w in workers),
+                    "workers": workers,
+                }
+            body = json.dumps(content).encode()
+            media_type = "application/json"
+
+        served = ",".join(str(index) for index in sorted(responses))
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", media_type.encode()),
+                                (b"content-length", str(len(body)).encode()),
+                                (WORKER_HEADER.lower().encode(), served.encode())]})
+        await send({"type": "http.response.body", "body": body})
+        return 200
+
+    def _track(self, route: str, image_path: str):
+        """Keep the set of open images up to date"""
+        if route == "/open-image":
+            self.opened.add(image_path)
+        elif route == "/close-image":
+            prefix = image_path + "::"
+            self.opened = {p for p in self.opened if p != image_path and not p.startswith(prefix)}
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for client in self.clients:
+                    if client is not None:
+                        await client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _response_headers(response: httpx.Response, worker: int) -> List[Tuple[bytes, bytes]]:
+    headers = [(k, v) for k, v in response.headers.raw if k.lower() not in HOP_HEADERS]
+    headers.append((WORKER_HEADER.lower().encode(), str(worker).encode()))
+    return headers
+
+
+async def _send_error(send: Send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class WorkerSupervisor:
+    """Starts the worker processes and restarts any that exit"""
+
+    def __init__(self, workers: int, base_port: int):
+        self.ports = [base_port + i for i in range(workers)]
+        self.processes: List[Optional[subprocess.Popen]] = [None] * workers
+        self._stopping = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, name="forensix-supervisor", daemon=True)
+
+    def _spawn(self, index: int) -> subprocess.Popen:
+        env = dict(os.environ, FORENSIX_WORKERS=str(len(self.ports)), FORENSIX_WORKER_ID=str(index))
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.ports[index])],
+            env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    def start(self):
+        for index in range(len(self.ports)):
+            self.processes[index] = self._spawn(index)
+        self._monitor.start()
+
+    def wait_ready(self, timeout: float = WORKER_START_TIMEOUT):
+        """Block until every worker accepts connections"""
+        deadline = time.monotonic() + timeout
+        for port in self.ports:
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"Worker on port {port} did not start")
+                    time.sleep(0.2)
+
+    def _watch(self):
+        while not self._stopping.wait(1.0):
+            for index, process in enumerate(self.processes):
+                if process is not None and process.poll() is not None and not self._stopping.is_set():
+                    print(f"Worker {index} exited with {process.returncode}, restarting")
+                    self.processes[index] = self._spawn(index)
+
+    def stop(self):
+        self._stopping.set()
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ForensiX backend in one or more processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Backend processes (FORENSIX_WORKERS)")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        uvicorn.run("app.main:app", host=args.host, port=args.port)
+        return
+
+    supervisor = WorkerSupervisor(args.workers, WORKER_BASE_PORT)
+    supervisor.start()
+    try:
+        supervisor.wait_ready()
+        uvicorn.run(AffinityProxy(supervisor.ports), host=args.host, port=args.port)
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Runtime configuration for the ForensiX backend
+Values can be overridden through environment variables
+"""
+import os
+import tempfile
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Maximum number of directory listings kept in memory across all images
+DIRECTORY_CACHE_SIZE = _env_int("FORENSIX_DIRECTORY_CACHE_SIZE", 4096)
+
+# Backend processes started by `python -m app.cluster`; with more than one,
+# an image-affinity proxy listens on the public port
+WORKERS = max(1, _env_int("FORENSIX_WORKERS", 1))
+
+# Local ports of the cluster's worker processes (this one and the next WORKERS - 1)
+WORKER_BASE_PORT = _env_int("FORENSIX_WORKER_BASE_PORT", 8100)
+
+# Threads in the shared worker pool used by parallel scans (cores are split between processes)
+WORKER_THREADS = _env_int("FORENSIX_WORKER_THREADS", min(8, max(1, (os.cpu_count() or 1) // WORKERS)))
+
+# Inodes examined per task by the orphan metadata scan
+ORPHAN_SCAN_BATCH_SIZE = _env_int("FORENSIX_ORPHAN_SCAN_BATCH_SIZE", 4096)
+
+# Files scanned per task by the rule scanner
+RULE_SCAN_BATCH_SIZE = _env_int("FORENSIX_RULE_SCAN_BATCH_SIZE", 64)
+
+# Where uploaded disk images are stored
+UPLOAD_DIR = os.environ.get(
+    "FORENSIX_UPLOAD_DIR",
+    os.path.join(tempfile.gettempdir(), "forensix_uploads")
+)
+
+# Buffer size for upload writes and incremental hashing
+UPLOAD_BUFFER_SIZE = _env_int("FORENSIX_UPLOAD_BUFFER_SIZE", 4 * 1024 * 1024)
+
+# Profile every request instead of only those sending the X-Forensix-Profile header
+PROFILE_ALL_REQUESTS = _env_bool("FORENSIX_PROFILE_ALL_REQUESTS", False)
+
+# Number of request profiles kept for download
+PROFILE_STORE_SIZE = _env_int("FORENSIX_PROFILE_STORE_SIZE", 32)
+
+# Read-ahead for images read through Python handles (E01, split raw)
+READAHEAD_ENABLED = _env_bool("FORENSIX_READAHEAD", True)
+
+# Also read plain raw images through the read-ahead layer instead of libtsk
+# directly; worthwhile on network or spinning storage, slower on local SSDs
+READAHEAD_RAW = _env_bool("FORENSIX_READAHEAD_RAW", False)
+
+# Initial and maximum size of a coalesced read-ahead request
+READAHEAD_MIN_WINDOW = _env_int("FORENSIX_READAHEAD_MIN_WINDOW", 1024 * 1024)
+READAHEAD_MAX_WINDOW = _env_int("FORENSIX_READAHEAD_MAX_WINDOW", 8 * 1024 * 1024)
+
+# Sequential streams tracked per image and background prefetch threads
+READAHEAD_STREAMS = _env_int("FORENSIX_READAHEAD_STREAMS", 4)
+READAHEAD_THREADS = _env_int("FORENSIX_READAHEAD_THREADS", 2)
+
+# File extent maps kept in memory for direct reads
+EXTENT_CACHE_SIZE = _env_int("FORENSIX_EXTENT_CACHE_SIZE", 1024)
+
+# Sample unpartitioned space for hidden data when an image is opened
+VOLUME_SCAN_ON_OPEN = _env_bool("FORENSIX_VOLUME_SCAN", True)
+
+# Largest single read when streaming slack and unallocated regions
+REGION_READ_SIZE = _env_int("FORENSIX_REGION_READ_SIZE", 4 * 1024 * 1024)
+
+# Files up to this size get a similarity digest along with their hashes;
+# the digest is computed in Python and costs far more than the cryptographic
+# hashes, so larger files only get those
+SIMILARITY_MAX_SIZE = _env_int("FORENSIX_SIMILARITY_MAX_SIZE", 16 * 1024 * 1024)
+
+# Compress large listing responses for clients that accept gzip (or zstd,
+# when the zstandard package is installed)
+COMPRESS_RESPONSES = _env_bool("FORENSIX_COMPRESS_RESPONSES", True)
+
+# Root directory for bulk exports written on the server
+EXPORT_DIR = os.environ.get(
+    "FORENSIX_EXPORT_DIR",
+    os.path.join(tempfile.gettempdir(), "forensix_exports")
+)
+
+# Files up to this size are read whole by export workers; larger ones are streamed
+EXPORT_BUFFER_LIMIT = _env_int("FORENSIX_EXPORT_BUFFER_LIMIT", 8 * 1024 * 1024)
+
+# SQLite database of analysis results reused when the same image is opened
+# again (matched by content fingerprint); set to an empty string to disable
+RESULTS_DB = os.environ.get(
+    "FORENSIX_RESULTS_DB",
+    os.path.join(tempfile.gettempdir(), "forensix_results.sqlite3")
+)
@@ -2,15 +2,32 @@
 ForensiX - Real Forensics Application Backend
 Using pytsk3 and libewf for disk image analysis
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api.routes import router
+from fastapi.responses import PlainTextResponse
+from .api.routes import active_images, router
+from .api.middleware import MetricsMiddleware, ProfilingMiddleware
+from .services.metrics import registry
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Closing stores what the open images learned (path indexes) for the next run
+    for path, handler in sorted(active_images.items(), key=lambda item: len(item[0]), reverse=True):
+        try:
+            handler.close()
+        except Exception as e:
+            print(f"Error closing {path}: {e}")
+    active_images.clear()
+
 
 # Create FastAPI application
 app = FastAPI(
     title="ForensiX Backend",
     description="Real forensics application using pytsk3 and libewf for E01 support",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS for frontend
@@ -20,8 +37,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Forensix-Profile-Id"],
 )
 
+# Profile requests that ask for it (X-Forensix-Profile header)
+app.add_middleware(ProfilingMiddleware)
+
+# Record latency and image I/O per request
+app.add_middleware(MetricsMiddleware)
+
 # Include API routes
 app.include_router(router)
 
@@ -41,6 +65,13 @@ async def root():
     }
 
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -14,6 +14,16 @@ class FileTimestamps(BaseModel):
     changed: Optional[str] = None  # MFT change time for NTFS
 
 
+class FileAttribute(BaseModel):
+    """Filesystem attribute of a file (NTFS attributes, including alternate data streams)"""
+    id: int
+    type: int
+    type_name: str
+    name: Optional[str] = None  # Stream name for NTFS alternate data streams
+    size: int
+    resident: bool = False
+
+
 class FileMetadata(BaseModel):
     """File metadata extracted from filesystem"""
     id: str
@@ -30,6 +40,8 @@ class FileMetadata(BaseModel):
     permissions: Optional[str] = None
     owner_uid: Optional[int] = None
     owner_gid: Optional[int] = None
+    child_count: Optional[int] = None  # Directories only, once the directory has been listed
+    attributes: Optional[List[FileAttribute]] = None  # Only when requested
 
 
 class PartitionInfo(BaseModel):
@@ -41,10 +53,46 @@ class PartitionInfo(BaseModel):
     start_sector: int
     end_sector: int
     size: int
+    sector_size: int = 512  # Unit of start_sector / end_sector
     status: str
     description: Optional[str] = None
 
 
+class VolumeGap(BaseModel):
+    """Space not covered by any partition or partition table"""
+    offset: int  # Byte offset within the image
+    length: int
+    start_sector: int
+    end_sector: int
+    location: str  # 'before_first', 'between' or 'after_last'
+    status: str  # 'EMPTY', 'CONTAINS_DATA', 'ENCRYPTED_OR_COMPRESSED' or 'POTENTIAL_HIDDEN_PARTITION'
+    samples: int
+    sampled_bytes: int
+    nonzero_samples: int
+    high_entropy_samples: int
+    max_entropy: float  # Bits per byte
+    first_data_offset: Optional[int] = None  # First non-zero byte seen
+    signature: Optional[str] = None  # Filesystem found inside the gap
+
+
+class FlaggedPartition(BaseModel):
+    """Partition hidden from the operating system by its type or attributes"""
+    partition_id: Optional[str] = None  # None for a protective MBR entry
+    type_code: Optional[str] = None  # MBR type ('0x17') or GPT type GUID
+    reasons: List[str]
+
+
+class VolumeLayout(BaseModel):
+    """Unpartitioned space and hidden partitions of an image"""
+    scheme: str  # 'MBR', 'GPT' or 'none'
+    sector_size: int
+    media_size: int
+    unpartitioned_bytes: int
+    gaps: List[VolumeGap] = []
+    flagged_partitions: List[FlaggedPartition] = []
+    suspicious: bool = False  # Data found in a gap, or a hidden partition
+
+
 class DiskImageInfo(BaseModel):
     """Disk image information"""
     filename: str
@@ -53,6 +101,9 @@ class DiskImageInfo(BaseModel):
     partitions: List[PartitionInfo]
     sector_size: int = 512
     total_sectors: int
+    fingerprint: Optional[str] = None  # Content fingerprint used to reuse earlier results
+    stored_results: List[str] = []  # Analysis stages already stored for this image
+    volume_layout: Optional[VolumeLayout] = None  # Unless disabled with FORENSIX_VOLUME_SCAN=0
 
 
 class HashResult(BaseModel):
@@ -60,6 +111,26 @@ class HashResult(BaseModel):
     md5: str
     sha1: str
     sha256: str
+    similarity: Optional[str] = None  # Similarity digest when requested; None for tiny, uniform or very large files
+
+
+class FileExtent(BaseModel):
+    """A contiguous piece of a file's content"""
+    logical_offset: int
+    length: int
+    physical_offset: Optional[int] = None  # Offset in the image; None for sparse (zero) extents
+    sparse: bool = False
+
+
+class FileExtentMap(BaseModel):
+    """Where a file's content lies in the image"""
+    inode: int
+    attr_id: Optional[int] = None
+    size: int
+    block_size: int
+    direct: bool  # Whether the content can be read straight from the extents
+    reason: Optional[str] = None  # Why not (resident, compressed, encrypted)
+    extents: List[FileExtent] = []
 
 
 class FileAnalysisRequest(BaseModel):
@@ -67,6 +138,9 @@ class FileAnalysisRequest(BaseModel):
     image_path: str
     file_path: str
     partition_id: Optional[str] = None
+    inode: Optional[int] = None  # Skips path resolution when known
+    attr_id: Optional[int] = None  # Attribute / data stream to read (default stream when omitted)
+    similarity: bool = False  # calculate-hash: also compute the similarity digest (much slower)
 
 
 class DiskImageOpenRequest(BaseModel):
@@ -78,9 +152,345 @@ class FileExtractionRequest(BaseModel):
     """Request to extract files from a partition"""
     image_path: str
     partition_id: str
+    path: str = "/"
     max_files: int = 1000
     include_deleted: bool = True
     include_directories: bool = False
+    include_attributes: bool = False
+
+
+class DirectoryListingRequest(BaseModel):
+    """Request to list the immediate children of one directory"""
+    image_path: str
+    partition_id: str
+    inode: Optional[int] = None  # Root directory when omitted
+    path: Optional[str] = None
+    include_deleted: bool = True
+
+
+class DirectoryListing(BaseModel):
+    """Immediate children of a directory"""
+    partition_id: str
+    inode: int
+    path: str
+    entries: List[FileMetadata]
+    cached: bool = False
+
+
+class OrphanScanRequest(BaseModel):
+    """Request to scan a partition's metadata for unallocated records"""
+    image_path: str
+    partition_id: str
+    batch_size: Optional[int] = None  # Inodes per worker task
+    min_recoverability: Optional[float] = None
+    include_named: bool = True  # Include records whose name entry was already found by a walk
+
+
+class RecoveredFile(BaseModel):
+    """Unallocated metadata record found by the orphan scan"""
+    inode: int
+    name: Optional[str] = None
+    parent_inode: Optional[int] = None
+    type: str
+    size: int
+    timestamps: FileTimestamps
+    resident: bool = False
+    named: bool = False  # A directory entry for this inode was seen by a walk
+    total_blocks: int = 0
+    unallocated_blocks: int = 0
+    recoverability: Optional[float] = None  # Share of data blocks still unallocated
+
+
+class SpaceRegionRequest(BaseModel):
+    """Request to list a partition's slack and unallocated regions"""
+    image_path: str
+    partition_id: str
+    kinds: List[str] = ['unallocated', 'slack']
+    min_length: int = 0  # Skip shorter regions (bytes)
+    max_files: int = 1000000  # Files examined for slack
+
+
+class SpaceRegion(BaseModel):
+    """Byte range of the image holding no live file content"""
+    kind: str  # 'unallocated' or 'slack'
+    offset: int  # Byte offset within the image
+    length: int
+    inode: Optional[int] = None  # File whose slack this is
+
+
+class SimilarityIndexRequest(BaseModel):
+    """Request to add a partition's files to the similarity index"""
+    image_path: str
+    partition_id: str
+    path: str = "/"
+    max_files: int = 100000
+
+
+class SimilarityIndexResult(BaseModel):
+    """Outcome of indexing a partition for similarity search"""
+    partition_id: str
+    indexed: int  # Files added to the index
+    without_digest: int  # Too small, too uniform or above FORENSIX_SIMILARITY_MAX_SIZE
+    failed: int
+    index_size: int  # Files in the index across all images
+
+
+class SimilaritySearchRequest(BaseModel):
+    """Request for files similar to a file or to a digest"""
+    digest: Optional[str] = None  # Search for this digest instead of a file's
+    image_path: Optional[str] = None
+    partition_id: Optional[str] = None
+    file_path: Optional[str] = None
+    inode: Optional[int] = None
+    threshold: int = 100  # Largest distance reported (0 = same content profile)
+    limit: int = 100
+
+
+class SimilarFile(BaseModel):
+    """An indexed file close to the searched digest"""
+    image_path: str
+    partition_id: str
+    inode: int
+    path: str
+    distance: int
+
+
+class SimilaritySearchResult(BaseModel):
+    """Indexed files close to a digest, closest first"""
+    digest: str
+    matches: List[SimilarFile]
+
+
+class DuplicateSource(BaseModel):
+    """A partition searched for duplicates"""
+    image_path: str
+    partition_id: Optional[str] = None  # Every partition with a known filesystem when omitted
+
+
+class DuplicateSearchRequest(BaseModel):
+    """Request to find identical files across images"""
+    sources: List[DuplicateSource] = []  # Every open image when empty
+    path: str = "/"
+    max_files: int = 1000000  # Files listed per partition
+    min_size: int = 1  # Ignore smaller files (bytes)
+
+
+class DuplicateLocation(BaseModel):
+    """Where one copy of a duplicated file lies"""
+    image_path: str
+    partition_id: str
+    inode: int
+    path: str
+
+
+class DuplicateCluster(BaseModel):
+    """Files with identical content"""
+    size: int
+    sha256: str
+    count: int
+    duplicate_bytes: int  # size * (count - 1)
+    images: int  # Distinct images holding a copy
+    locations: List[DuplicateLocation]
+
+
+class DuplicateReport(BaseModel):
+    """Duplicate clusters and how much had to be read to find them"""
+    files_considered: int
+    size_groups: int  # Sizes shared by more than one file
+    partial_hashed: int  # Files hashed over their first and last 64 KiB
+    full_hashed: int  # Files hashed in full (or taken from stored hashes)
+    bytes_read: int
+    duplicate_bytes: int
+    clusters: List[DuplicateCluster]
+
+
+class RuleString(BaseModel):
+    """A string a scan rule looks for"""
+    id: str  # Referred to as $id in the condition
+    type: str = 'text'  # 'text', 'hex' or 'regex'
+    value: str
+    nocase: bool = False
+    offset: Optional[int] = None  # Must start at this offset (within the first 4 KiB)
+
+
+class ScanRule(BaseModel):
+    """Strings and a condition over them, matched against file contents"""
+    name: str
+    description: Optional[str] = None
+    severity: str = 'MEDIUM'  # 'LOW', 'MEDIUM', 'HIGH' or 'CRITICAL'
+    tags: List[str] = []
+    strings: List[RuleString]
+    condition: str = 'any of them'  # $id, any/all/<n> of them, and, or, not, parentheses
+    extensions: Optional[List[str]] = None  # Only files with these extensions
+    exclude_extensions: List[str] = []
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+
+
+class RuleScanRequest(BaseModel):
+    """Request to scan a partition's files against rules"""
+    image_path: str
+    partition_id: str
+    rules: Optional[List[ScanRule]] = None  # Built-in rules when omitted
+    path: str = "/"
+    max_files: int = 1000000
+    include_deleted: bool = False
+
+
+class RuleMatch(BaseModel):
+    """A file matching a scan rule"""
+    inode: Optional[int] = None
+    path: str
+    size: int
+    rule: str
+    severity: str
+    tags: List[str] = []
+    strings: List[str] = []  # Ids of the strings found
+
+
+class RiskAssessmentRequest(BaseModel):
+    """Request for the risk assessment of indexed partitions"""
+    image_path: str
+    partition_id: Optional[str] = None  # All partitions of the image when omitted
+
+
+class CIAAssessment(BaseModel):
+    """Confidentiality, integrity and availability scores (0-100)"""
+    confidentiality_score: int
+    integrity_score: int
+    availability_score: int
+    overall_score: float
+    risk_level: str  # 'LOW RISK', 'MEDIUM RISK', 'HIGH RISK' or 'CRITICAL RISK'
+    summary: str
+    confidentiality_findings: List[str] = []
+    integrity_findings: List[str] = []
+    availability_findings: List[str] = []
+    critical_findings: List[str] = []
+    recommendations: List[str] = []
+    timestamp: str
+
+
+class MitreFinding(BaseModel):
+    """An ATT&CK technique indicated by the evidence"""
+    tactic: str
+    technique: str
+    confidence: str  # 'LOW', 'MEDIUM' or 'HIGH'
+    count: int  # Files supporting the finding
+    evidence: List[str] = []  # First few of them
+
+
+class MitreMapping(BaseModel):
+    """ATT&CK techniques indicated by the evidence"""
+    findings: List[MitreFinding] = []
+    attack_chain_summary: str
+    recommended_actions: List[str] = []
+
+
+class RiskAssessment(BaseModel):
+    """Risk assessment over the file index and rule scans of partitions"""
+    files_indexed: int  # Regular files in the walked directories
+    rule_scans: int  # Rule sets whose latest scan contributed
+    updated_at: Optional[str] = None  # When the newest contributing walk or scan finished
+    cia: CIAAssessment
+    mitre: MitreMapping
+
+
+class ReportRequest(BaseModel):
+    """Request for a forensic report streamed from indexed results"""
+    image_path: str
+    partition_id: Optional[str] = None  # All partitions of the image when omitted
+    format: str = "json"  # 'json' or 'text'
+    sections: List[str] = ["case", "image", "partitions", "findings", "timeline", "hashes"]
+    case: Optional[Dict[str, Any]] = None  # Case metadata copied into the report
+    include_deleted: bool = True  # Deleted files in the timeline (never hashed)
+    timeline_limit: int = 1000  # Most recent timeline events included
+    max_files: int = 1000000  # Files per partition
+
+
+class ContainerSearchRequest(BaseModel):
+    """Request to find nested containers in a partition"""
+    image_path: str
+    partition_id: str
+    path: str = "/"
+    max_files: int = 100000
+
+
+class ContainerInfo(BaseModel):
+    """A container inside a partition that can be opened as a nested image"""
+    path: str  # archive!member for ZIP members
+    inode: Optional[int] = None
+    size: int
+    type: str  # 'e01', 'vhd', 'vhdx', 'raw', 'vss', or an unsupported format
+    is_deleted: bool = False
+    member: Optional[str] = None  # Member name inside a ZIP archive
+    image_path: Optional[str] = None  # Pass to open-image and the other endpoints; None if unsupported
+    error: Optional[str] = None
+
+
+class UploadCreateRequest(BaseModel):
+    """Request to start a resumable upload"""
+    filename: str
+    total_size: Optional[int] = None
+
+
+class UploadStatus(BaseModel):
+    """State of a resumable upload"""
+    upload_id: str
+    filename: str
+    total_size: Optional[int] = None
+    received: int  # Offset the next part has to start at
+    complete: bool = False
+    file_path: Optional[str] = None  # Set once the upload is complete
+    md5: Optional[str] = None
+    sha256: Optional[str] = None
+
+
+class ExportFileSpec(BaseModel):
+    """A file selected explicitly for export"""
+    path: str
+    inode: Optional[int] = None
+    attr_id: Optional[int] = None
+
+
+class BulkExportRequest(BaseModel):
+    """Request to export many files at once"""
+    image_path: str
+    partition_id: str
+    files: Optional[List[ExportFileSpec]] = None  # Explicit selection; the filters below apply otherwise
+    path: str = "/"  # Path prefix to export from
+    extensions: Optional[List[str]] = None  # e.g. ["jpg", "pdf"]
+    include_deleted: bool = True
+    deleted_only: bool = False
+    max_files: int = 10000
+    format: str = "zip"  # 'zip', 'tar' or 'directory'
+    destination: Optional[str] = None  # Directory name under the export root (format 'directory')
+
+
+class ExportedFile(BaseModel):
+    """Chain-of-custody record of one exported file"""
+    path: str
+    export_path: str  # Path inside the archive or export directory
+    inode: Optional[int] = None
+    size: int = 0
+    is_deleted: bool = False
+    timestamps: Optional[FileTimestamps] = None
+    md5: Optional[str] = None
+    sha1: Optional[str] = None
+    sha256: Optional[str] = None
+    error: Optional[str] = None
+
+
+class ExportManifest(BaseModel):
+    """Manifest written alongside every export"""
+    image_path: str
+    partition_id: str
+    created: str
+    format: str
+    destination: Optional[str] = None
+    file_count: int = 0
+    total_bytes: int = 0
+    errors: int = 0
+    files: List[ExportedFile] = []
 
 
 class ProgressUpdate(BaseModel):
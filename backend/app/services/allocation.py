@@ -0,0 +1,293 @@
+"""
+Block allocation bitmaps read straight from filesystem structures
+pytsk3 does not expose block walks, so allocation state is parsed from the
+NTFS $Bitmap file, the FAT table or the ext block group bitmaps
+"""
+import struct
+from typing import Generator, Optional, Tuple
+import pytsk3
+
+
+NTFS_BITMAP_INODE = 6
+READ_CHUNK = 4 * 1024 * 1024
+# Bitmap bytes examined at a time when looking for free runs
+RUN_SCAN_BYTES = 512
+
+
+class AllocationBitmap:
+    """
+    Allocation state of every block in a filesystem
+
+    Bits are packed least significant bit first. Each bit covers
+    blocks_per_bit filesystem blocks starting at first_block; blocks before
+    first_block or past the end of the bitmap count as allocated.
+    """
+
+    def __init__(self, bits: bytes, nbits: int, first_block: int = 0, blocks_per_bit: int = 1):
+        self._bits = bytes(bits)
+        self._nbits = nbits
+        self.first_block = first_block
+        self.blocks_per_bit = blocks_per_bit
+
+    @property
+    def last_block(self) -> int:
+        """First block after the range covered by the bitmap"""
+        return self.first_block + self._nbits * self.blocks_per_bit
+
+    def _bit(self, index: int) -> int:
+        return (self._bits[index >> 3] >> (index & 7)) & 1
+
+    def _count_bits(self, start: int, end: int) -> int:
+        """Count set bits in [start, end)"""
+        if end <= start:
+            return 0
+        first_byte, last_byte = start >> 3, (end + 7) >> 3
+        value = int.from_bytes(self._bits[first_byte:last_byte], 'little')
+        value >>= start - (first_byte << 3)
+        value &= (1 << (end - start)) - 1
+        return value.bit_count()
+
+    def is_allocated(self, block: int) -> bool:
+        """Check whether a single block is allocated"""
+        if block < self.first_block or block >= self.last_block:
+            return True
+        return bool(self._bit((block - self.first_block) // self.blocks_per_bit))
+
+    def count_allocated(self, start: int, length: int) -> int:
+        """Count allocated blocks in the run [start, start + length)"""
+        end = start + length
+        allocated = 0
+
+        # Outside the bitmap everything counts as allocated
+        if start < self.first_block:
+            allocated += min(end, self.first_block) - start
+            start = self.first_block
+        if end > self.last_block:
+            allocated += end - max(start, self.last_block)
+            end = self.last_block
+        if start >= end:
+            return allocated
+
+        per_bit = self.blocks_per_bit
+        first_bit = (start - self.first_block) // per_bit
+        last_bit = (end - 1 - self.first_block) // per_bit
+        if per_bit == 1:
+            return allocated + self._count_bits(first_bit, last_bit + 1)
+        if first_bit == last_bit:
+            return allocated + (end - start) * self._bit(first_bit)
+
+        # Partial units at either end, whole units in between
+        head = self.first_block + (first_bit + 1) * per_bit - start
+        tail = end - (self.first_block + last_bit * per_bit)
+        allocated += head * self._bit(first_bit) + tail * self._bit(last_bit)
+        allocated += self._count_bits(first_bit + 1, last_bit) * per_bit
+        return allocated
+
+    def count_unallocated(self, start: int, length: int) -> int:
+        """Count unallocated blocks in the run [start, start + length)"""
+        return length - self.count_allocated(start, length)
+
+    def unallocated_runs(self) -> Generator[Tuple[int, int], None, None]:
+        """
+        Runs of unallocated blocks as (first block, block count), in block order
+        Found in one pass over the bitmap; runs crossing bitmap bytes or scan
+        windows are merged, so each free run is reported once
+        """
+        per_bit = self.blocks_per_bit
+        for start, count in self._clear_runs():
+            yield self.first_block + start * per_bit, count * per_bit
+
+    def _clear_runs(self) -> Generator[Tuple[int, int], None, None]:
+        """Runs of clear bits as (first bit, bit count)"""
+        full = b'\xff' * RUN_SCAN_BYTES
+        run_start, run_end = 0, 0
+        for base in range(0, (self._nbits + 7) >> 3, RUN_SCAN_BYTES):
+            window = self._bits[base:base + RUN_SCAN_BYTES]
+            if window == full[:len(window)]:
+                continue
+            width = min(len(window) * 8, self._nbits - base * 8)
+            free = ~int.from_bytes(window, 'little') & ((1 << width) - 1)
+            position = base * 8
+            while free:
+                skip = (free & -free).bit_length() - 1
+                free >>= skip
+                position += skip
+                # Length of the run of set bits now at the bottom
+                length = ((free + 1) & ~free).bit_length() - 1
+                if position == run_end and run_end > run_start:
+                    run_end += length
+                else:
+                    if run_end > run_start:
+                        yield run_start, run_end - run_start
+                    run_start, run_end = position, position + length
+                free >>= length
+                position += length
+        if run_end > run_start:
+            yield run_start, run_end - run_start
+
+
+def load_allocation_bitmap(fs_info: pytsk3.FS_Info, img_info: pytsk3.Img_Info,
+                           fs_offset: int) -> Optional[AllocationBitmap]:
+    """
+    Build the allocation bitmap for a filesystem starting at fs_offset bytes
+    Returns None for filesystems whose allocation structures are not parsed
+    """
+    ftype = fs_info.info.ftype
+    try:
+        if ftype == pytsk3.TSK_FS_TYPE_NTFS:
+            return _load_ntfs_bitmap(fs_info)
+        if ftype in (pytsk3.TSK_FS_TYPE_FAT12, pytsk3.TSK_FS_TYPE_FAT16, pytsk3.TSK_FS_TYPE_FAT32):
+            return _load_fat_bitmap(img_info, fs_offset)
+        if ftype in (pytsk3.TSK_FS_TYPE_EXT2, pytsk3.TSK_FS_TYPE_EXT3, pytsk3.TSK_FS_TYPE_EXT4):
+            return _load_ext_bitmap(img_info, fs_offset)
+    except Exception as e:
+        print(f"Could not load allocation bitmap: {e}")
+    return None
+
+
+def _load_ntfs_bitmap(fs_info: pytsk3.FS_Info) -> AllocationBitmap:
+    """NTFS keeps one bit per cluster in the $Bitmap metadata file"""
+    bitmap_file = fs_info.open_meta(inode=NTFS_BITMAP_INODE)
+    size = bitmap_file.info.meta.size
+    chunks = []
+    offset = 0
+    while offset < size:
+        chunk = bitmap_file.read_random(offset, min(READ_CHUNK, size - offset))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        offset += len(chunk)
+    bits = b''.join(chunks)
+    nbits = min(len(bits) * 8, fs_info.info.block_count)
+    return AllocationBitmap(bits, nbits)
+
+
+def _load_fat_bitmap(img_info: pytsk3.Img_Info, fs_offset: int) -> AllocationBitmap:
+    """
+    FAT marks free clusters with a zero table entry
+
+    TSK addresses FAT blocks in sectors, so each bit covers one cluster
+    worth of sectors starting at the first data sector.
+    """
+    boot = img_info.read(fs_offset, 512)
+    bytes_per_sector, sectors_per_cluster, reserved, num_fats, root_entries, total16 = \
+        struct.unpack_from('<HBHBHH', boot, 11)
+    fat_size16, = struct.unpack_from('<H', boot, 22)
+    total32, fat_size32 = struct.unpack_from('<II', boot, 32)
+
+    fat_size = fat_size16 or fat_size32
+    total_sectors = total16 or total32
+    root_dir_sectors = (root_entries * 32 + bytes_per_sector - 1) // bytes_per_sector
+    first_data_sector = reserved + num_fats * fat_size + root_dir_sectors
+    clusters = (total_sectors - first_data_sector) // sectors_per_cluster
+
+    fat = img_info.read(fs_offset + reserved * bytes_per_sector, fat_size * bytes_per_sector)
+    bits = bytearray((clusters + 7) // 8)
+
+    if clusters < 4085:
+        # FAT12 packs two 12-bit entries into three bytes
+        for index in range(clusters):
+            cluster = index + 2
+            pos = cluster * 3 // 2
+            value = fat[pos] | (fat[pos + 1] << 8)
+            value = value >> 4 if cluster & 1 else value & 0x0FFF
+            if value:
+                bits[index >> 3] |= 1 << (index & 7)
+    else:
+        is_fat16 = clusters < 65525
+        width = 2 if is_fat16 else 4
+        mask = 0xFFFF if is_fat16 else 0x0FFFFFFF
+        usable = len(fat) // width * width
+        entries = memoryview(fat[:usable]).cast('H' if is_fat16 else 'I')
+        for index in range(min(clusters, len(entries) - 2)):
+            if entries[index + 2] & mask:
+                bits[index >> 3] |= 1 << (index & 7)
+
+    return AllocationBitmap(bits, clusters, first_block=first_data_sector,
+                            blocks_per_bit=sectors_per_cluster)
+
+
+def _load_ext_bitmap(img_info: pytsk3.Img_Info, fs_offset: int) -> AllocationBitmap:
+    """ext2/3/4 keep one block bitmap per block group"""
+    sb = img_info.read(fs_offset + 1024, 1024)
+    blocks_lo, = struct.unpack_from('<I', sb, 0x04)
+    first_data_block, log_block_size = struct.unpack_from('<II', sb, 0x14)
+    blocks_per_group, = struct.unpack_from('<I', sb, 0x20)
+    incompat, = struct.unpack_from('<I', sb, 0x60)
+    desc_size, = struct.unpack_from('<H', sb, 0xFE)
+    blocks_hi, = struct.unpack_from('<I', sb, 0x150)
+
+    block_size = 1024 << log_block_size
+    is_64bit = bool(incompat & 0x80)
+    blocks_count = blocks_lo | (blocks_hi << 32 if is_64bit else 0)
+    desc_size = desc_size if is_64bit and desc_size >= 64 else 32
+    groups = (blocks_count - first_data_block + blocks_per_group - 1) // blocks_per_group
+
+    gdt_offset = fs_offset + (first_data_block + 1) * block_size
+    gdt = img_info.read(gdt_offset, groups * desc_size)
+
+    inodes_per_group, = struct.unpack_from('<I', sb, 0x28)
+    inode_size, = struct.unpack_from('<H', sb, 0x58)
+    ro_compat, = struct.unpack_from('<I', sb, 0x64)
+    reserved_gdt, = struct.unpack_from('<H', sb, 0xCE)
+    sparse_super = bool(ro_compat & 0x1)
+    gdt_blocks = (groups * desc_size + block_size - 1) // block_size
+    inode_table_blocks = (inodes_per_group * (inode_size or 128) + block_size - 1) // block_size
+
+    group_bytes = blocks_per_group // 8
+    bits = bytearray(groups * group_bytes)
+    locations = []
+    for group in range(groups):
+        desc = gdt[group * desc_size:(group + 1) * desc_size]
+        bitmap_block, inode_bitmap, inode_table = struct.unpack_from('<III', desc, 0x00)
+        flags, = struct.unpack_from('<H', desc, 0x12)
+        if desc_size >= 64:
+            bitmap_block |= struct.unpack_from('<I', desc, 0x20)[0] << 32
+            inode_bitmap |= struct.unpack_from('<I', desc, 0x24)[0] << 32
+            inode_table |= struct.unpack_from('<I', desc, 0x28)[0] << 32
+        if not flags & 0x2:
+            locations.append((bitmap_block, group))
+            continue
+
+        # BLOCK_UNINIT groups have no bitmap on disk; only their metadata is in use
+        group_start = first_data_block + group * blocks_per_group
+        group_end = group_start + blocks_per_group
+        used = [(bitmap_block, 1), (inode_bitmap, 1), (inode_table, inode_table_blocks)]
+        if _ext_group_has_super(group, sparse_super):
+            used.append((group_start, 1 + gdt_blocks + reserved_gdt))
+        for start, length in used:
+            for block in range(max(start, group_start), min(start + length, group_end)):
+                index = block - first_data_block
+                bits[index >> 3] |= 1 << (index & 7)
+
+    # flex_bg stores bitmaps back to back, so adjacent blocks are read together
+    locations.sort()
+    run_start = 0
+    while run_start < len(locations):
+        run_end = run_start + 1
+        while (run_end < len(locations)
+               and locations[run_end][0] == locations[run_end - 1][0] + 1
+               and (run_end - run_start) * block_size < READ_CHUNK):
+            run_end += 1
+        first_block = locations[run_start][0]
+        data = img_info.read(fs_offset + first_block * block_size, (run_end - run_start) * block_size)
+        for block, group in locations[run_start:run_end]:
+            start = (block - first_block) * block_size
+            chunk = data[start:start + group_bytes].ljust(group_bytes, b'\xff')
+            bits[group * group_bytes:(group + 1) * group_bytes] = chunk
+        run_start = run_end
+
+    return AllocationBitmap(bits, blocks_count - first_data_block, first_block=first_data_block)
+
+
+def _ext_group_has_super(group: int, sparse_super: bool) -> bool:
+    """Groups 0, 1 and powers of 3, 5 and 7 carry superblock backups with sparse_super"""
+    if not sparse_super or group < 2:
+        return True
+    for base in (3, 5, 7):
+        value = base
+        while value < group:
+            value *= base
+        if value == group:
+            return True
+    return False
@@ -0,0 +1,72 @@
+"""
+Bounded in-memory caches shared by the analysis services
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+from ..config import DIRECTORY_CACHE_SIZE, EXTENT_CACHE_SIZE
+from .metrics import register_cache
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with a fixed number of entries
+    Tracks hits and misses so callers can report cache effectiveness
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def keys(self) -> List[Hashable]:
+        """Keys from least to most recently used"""
+        return list(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value and mark it as recently used"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value without affecting recency or hit statistics"""
+        return self._data.get(key, default)
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove all entries whose key matches the predicate"""
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def hit_ratio(self) -> Optional[float]:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+
+# Directory listings keyed by (image path, partition id, directory inode)
+directory_cache = LRUCache(DIRECTORY_CACHE_SIZE)
+register_cache("directory", directory_cache)
+
+# File extent maps keyed by (image path, partition id, inode, attribute id)
+extent_cache = LRUCache(EXTENT_CACHE_SIZE)
+register_cache("extent", extent_cache)
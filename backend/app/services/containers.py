@@ -0,0 +1,254 @@
+"""
+Readers for image containers that can be found inside other evidence
+Each reader presents a container's virtual disk through read(offset, size)
+on top of a positional read function, so the same code serves image files
+on disk (pread) and containers nested in a filesystem (TSK read_random)
+"""
+import io
+import struct
+import threading
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+
+ReadFunction = Callable[[int, int], bytes]
+
+VHD_COOKIE = b"conectix"
+VHD_SPARSE_COOKIE = b"cxsparse"
+VHD_FOOTER_SIZE = 512
+VHD_SECTOR_SIZE = 512
+VHD_UNUSED_ENTRY = 0xFFFFFFFF
+VHD_DISK_TYPES = {2: "fixed", 3: "dynamic", 4: "differencing"}
+
+VHDX_SIGNATURE = b"vhdxfile"
+VHDX_HEADER_OFFSETS = (64 * 1024, 128 * 1024)
+VHDX_REGION_TABLE_OFFSET = 192 * 1024
+VHDX_BAT_REGION = uuid.UUID("2DC27766-F623-4200-9D64-115E9BFD4A08").bytes_le
+VHDX_METADATA_REGION = uuid.UUID("8B7CA206-4790-4B9A-B8FE-575F050F886E").bytes_le
+VHDX_FILE_PARAMETERS = uuid.UUID("CAA16737-FA36-4D43-B3B6-33F0AA44E76B").bytes_le
+VHDX_VIRTUAL_DISK_SIZE = uuid.UUID("2FA54224-CD1B-4876-B211-5DBED83BF4B8").bytes_le
+VHDX_LOGICAL_SECTOR_SIZE = uuid.UUID("8141BF1D-A96F-4709-BA47-F233A8FAAB5F").bytes_le
+VHDX_BLOCK_FULLY_PRESENT = 6
+VHDX_BLOCK_PARTIALLY_PRESENT = 7
+VHDX_BAT_OFFSET_UNIT = 1024 * 1024
+
+
+class SliceReader:
+    """A byte range of another reader (a partition, or a stored archive member)"""
+
+    def __init__(self, read_fn: ReadFunction, offset: int, size: int):
+        self._read_fn = read_fn
+        self.offset = offset
+        self.size = size
+
+    def read(self, offset: int, size: int) -> bytes:
+        size = max(0, min(size, self.size - offset))
+        return self._read_fn(self.offset + offset, size) if size else b""
+
+
+class ReaderFile(io.RawIOBase):
+    """
+    Seekable file object over a reader
+    For libraries that want a file (pyewf, pyvshadow, zipfile)
+    """
+
+    def __init__(self, read_fn: ReadFunction, size: int):
+        super().__init__()
+        self._read_fn = read_fn
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def get_size(self) -> int:
+        return self._size
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = offset
+        return offset
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._size - self._position
+        size = max(0, min(size, self._size - self._position))
+        data = self._read_fn(self._position, size) if size else b""
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class VHDReader:
+    """
+    Virtual disk of a fixed or dynamic VHD
+    Dynamic disks are mapped through the block allocation table; blocks
+    never written read as zeros. Differencing disks need their parent and
+    are rejected.
+    """
+
+    def __init__(self, read_fn: ReadFunction, file_size: int):
+        self._read_fn = read_fn
+        footer = read_fn(file_size - VHD_FOOTER_SIZE, VHD_FOOTER_SIZE)
+        if not footer.startswith(VHD_COOKIE):
+            # Dynamic disks keep a copy of the footer at the start
+            footer = read_fn(0, VHD_FOOTER_SIZE)
+        if not footer.startswith(VHD_COOKIE):
+            raise ValueError("Not a VHD image (footer cookie missing)")
+
+        data_offset, = struct.unpack_from(">Q", footer, 16)
+        self.size, = struct.unpack_from(">Q", footer, 48)
+        disk_type, = struct.unpack_from(">I", footer, 60)
+        self.disk_type = VHD_DISK_TYPES.get(disk_type, f"unknown ({disk_type})")
+
+        self._bat: Optional[Tuple[int, ...]] = None
+        if self.disk_type == "fixed":
+            return
+        if self.disk_type != "dynamic":
+            raise ValueError(f"{self.disk_type.capitalize()} VHD images are not supported")
+
+        header = read_fn(data_offset, 1024)
+        if not header.startswith(VHD_SPARSE_COOKIE):
+            raise ValueError("VHD dynamic disk header missing")
+        table_offset, = struct.unpack_from(">Q", header, 16)
+        entries, self.block_size = struct.unpack_from(">II", header, 28)
+        self._bat = struct.unpack(f">{entries}I", read_fn(table_offset, entries * 4))
+        # Each block starts with a sector bitmap padded to whole sectors
+        bitmap = self.block_size // VHD_SECTOR_SIZE // 8
+        self._bitmap_size = -(-bitmap // VHD_SECTOR_SIZE) * VHD_SECTOR_SIZE
+
+    def read(self, offset: int, size: int) -> bytes:
+        size = max(0, min(size, self.size - offset))
+        if not size:
+            return b""
+        if self._bat is None:
+            return self._read_fn(offset, size)
+
+        pieces = []
+        end = offset + size
+        while offset < end:
+            block, within = divmod(offset, self.block_size)
+            length = min(end - offset, self.block_size - within)
+            sector = self._bat[block] if block < len(self._bat) else VHD_UNUSED_ENTRY
+            if sector == VHD_UNUSED_ENTRY:
+                pieces.append(bytes(length))
+            else:
+                pieces.append(self._read_fn(sector * VHD_SECTOR_SIZE + self._bitmap_size + within, length))
+            offset += length
+        return b"".join(pieces)
+
+
+class VHDXReader:
+    """
+    Virtual disk of a fixed or dynamic VHDX
+    Blocks not present in the BAT read as zeros. Differencing disks and
+    disks with an unreplayed log (not cleanly closed) are rejected, as
+    their data cannot be presented faithfully without the parent or log.
+    """
+
+    def __init__(self, read_fn: ReadFunction):
+        self._read_fn = read_fn
+        if not read_fn(0, 8).startswith(VHDX_SIGNATURE):
+            raise ValueError("Not a VHDX image (file identifier missing)")
+
+        # The current header is the valid one with the higher sequence number
+        headers = []
+        for offset in VHDX_HEADER_OFFSETS:
+            header = read_fn(offset, 4096)
+            if header.startswith(b"head"):
+                sequence, = struct.unpack_from("<Q", header, 8)
+                headers.append((sequence, header))
+        if not headers:
+            raise ValueError("VHDX headers missing")
+        header = max(headers)[1]
+        if header[48:64] != bytes(16):
+            raise ValueError("VHDX image has an unreplayed log; open and close it in its hypervisor first")
+
+        regions = self._read_regions()
+        metadata = self._read_metadata(*regions[VHDX_METADATA_REGION])
+        self.block_size, flags = struct.unpack_from("<II", metadata[VHDX_FILE_PARAMETERS])
+        if flags & 0x2:
+            raise ValueError("Differencing VHDX images are not supported")
+        self.size, = struct.unpack_from("<Q", metadata[VHDX_VIRTUAL_DISK_SIZE])
+        self.sector_size, = struct.unpack_from("<I", metadata[VHDX_LOGICAL_SECTOR_SIZE])
+
+        # Every chunk_ratio payload entries are followed by one sector bitmap entry
+        self._chunk_ratio = (2 ** 23 * self.sector_size) // self.block_size
+        bat_offset, bat_length = regions[VHDX_BAT_REGION]
+        raw = read_fn(bat_offset, bat_length)
+        self._bat = struct.unpack(f"<{len(raw) // 8}Q", raw[:len(raw) // 8 * 8])
+
+    def _read_regions(self) -> Dict[bytes, Tuple[int, int]]:
+        table = self._read_fn(VHDX_REGION_TABLE_OFFSET, 64 * 1024)
+        if not table.startswith(b"regi"):
+            raise ValueError("VHDX region table missing")
+        count, = struct.unpack_from("<I", table, 8)
+        regions = {}
+        for i in range(count):
+            entry = 16 + i * 32
+            offset, length = struct.unpack_from("<QI", table, entry + 16)
+            regions[bytes(table[entry:entry + 16])] = (offset, length)
+        for region in (VHDX_BAT_REGION, VHDX_METADATA_REGION):
+            if region not in regions:
+                raise ValueError("VHDX region table lacks the BAT or metadata region")
+        return regions
+
+    def _read_metadata(self, offset: int, length: int) -> Dict[bytes, bytes]:
+        region = self._read_fn(offset, length)
+        if not region.startswith(b"metadata"):
+            raise ValueError("VHDX metadata region missing")
+        count, = struct.unpack_from("<H", region, 10)
+        items = {}
+        for i in range(count):
+            entry = 32 + i * 32
+            item_offset, item_length = struct.unpack_from("<II", region, entry + 16)
+            items[bytes(region[entry:entry + 16])] = region[item_offset:item_offset + item_length]
+        for item in (VHDX_FILE_PARAMETERS, VHDX_VIRTUAL_DISK_SIZE, VHDX_LOGICAL_SECTOR_SIZE):
+            if item not in items:
+                raise ValueError("VHDX metadata is incomplete")
+        return items
+
+    def read(self, offset: int, size: int) -> bytes:
+        size = max(0, min(size, self.size - offset))
+        pieces = []
+        end = offset + size
+        while offset < end:
+            block, within = divmod(offset, self.block_size)
+            length = min(end - offset, self.block_size - within)
+            index = block + block // self._chunk_ratio
+            entry = self._bat[index] if index < len(self._bat) else 0
+            if entry & 0x7 in (VHDX_BLOCK_FULLY_PRESENT, VHDX_BLOCK_PARTIALLY_PRESENT):
+                block_offset = (entry >> 20) * VHDX_BAT_OFFSET_UNIT
+                pieces.append(self._read_fn(block_offset + within, length))
+            else:
+                # Not present, zero, unmapped or undefined
+                pieces.append(bytes(length))
+            offset += length
+        return b"".join(pieces)
+
+
+class LockedReader:
+    """Serializes reads from a source that keeps a file position (TSK files, libewf)"""
+
+    def __init__(self, read_fn: ReadFunction):
+        self._read_fn = read_fn
+        self._lock = threading.Lock()
+
+    def read(self, offset: int, size: int) -> bytes:
+        with self._lock:
+            return self._read_fn(offset, size)
@@ -0,0 +1,205 @@
+"""
+Duplicate files across evidence images
+Candidates are narrowed in stages: files are grouped by size from the file
+listings, files sharing a size are hashed over their first and last
+PARTIAL_HASH_SIZE bytes, and only files still colliding are hashed in full,
+so most files are never read beyond their ends
+"""
+import hashlib
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from ..models.schemas import DuplicateCluster, DuplicateLocation, DuplicateReport
+from .filesystem_analyzer import FilesystemAnalyzer
+from .image_handler import DiskImageHandler
+from .results_store import results_store
+from .workers import worker_pool
+
+
+# Bytes hashed at each end of a file by the partial stage; files up to twice
+# this size are read whole there and need no full stage
+PARTIAL_HASH_SIZE = 64 * 1024
+
+
+class DedupSource(NamedTuple):
+    """A partition to search, with the handler of its image"""
+    image_path: str
+    handler: DiskImageHandler
+    partition_id: str
+
+
+class _Candidate(NamedTuple):
+    source: DedupSource
+    inode: int
+    path: str
+    size: int
+
+
+class DuplicateFinder:
+    """
+    Staged duplicate detection over the file listings of several partitions
+
+    Each stage hashes its candidates on the shared worker pool; a stage only
+    starts once the previous one has settled which groups still collide.
+    """
+
+    def __init__(self, sources: Iterable[DedupSource]):
+        self.sources = list(sources)
+        self.bytes_read = 0  # File content read by the last find()
+
+    def find(self, path: str = "/", max_files: int = 1000000, min_size: int = 1) -> DuplicateReport:
+        """
+        Clusters of identical files, largest reclaimable size first
+
+        Args:
+            path: Directory searched in every partition
+            max_files: Files listed per partition
+            min_size: Ignore files smaller than this many bytes
+        """
+        self.bytes_read = 0
+        candidates = self._list_candidates(path, max_files, max(min_size, 1))
+
+        by_size: Dict[int, List[_Candidate]] = defaultdict(list)
+        for candidate in candidates:
+            by_size[candidate.size].append(candidate)
+        size_groups = [group for group in by_size.values() if len(group) > 1]
+
+        # Partial stage: both ends of every file that shares its size
+        partial_inputs = [candidate for group in size_groups for candidate in group]
+        partial = self._hash_all(partial_inputs, self._partial_hash)
+        partial_groups = _regroup(partial_inputs, partial, lambda c: (c.size, partial[c]))
+
+        # Full stage: files longer than both ends that still collide
+        full_inputs = [
+            candidate for group in partial_groups if group[0].size > 2 * PARTIAL_HASH_SIZE
+            for candidate in group
+        ]
+        full = self._hash_all(full_inputs, self._full_hash)
+
+        clusters = []
+        for group in partial_groups:
+            if group[0].size > 2 * PARTIAL_HASH_SIZE:
+                # Files read whole by the partial stage are already settled
+                for members in _regroup(group, full, lambda c: full[c]):
+                    clusters.append(self._cluster(members, full[members[0]]))
+            else:
+                clusters.append(self._cluster(group, partial[group[0]]))
+        clusters.sort(key=lambda cluster: (-cluster.duplicate_bytes, cluster.sha256))
+
+        return DuplicateReport(
+            files_considered=len(candidates),
+            size_groups=len(size_groups),
+            partial_hashed=len(partial),
+            full_hashed=len(full),
+            bytes_read=self.bytes_read,
+            duplicate_bytes=sum(cluster.duplicate_bytes for cluster in clusters),
+            clusters=clusters
+        )
+
+    def _list_candidates(self, path: str, max_files: int, min_size: int) -> List[_Candidate]:
+        """
+        Allocated regular files of every source, hard links counted once
+        A partition reached twice (the same evidence opened under two paths, as
+        told by an exact fingerprint) is listed once
+        """
+        candidates = []
+        listed = set()
+        for source in self.sources:
+            key = (source.handler.get_content_fingerprint() or source.image_path, source.partition_id)
+            if key in listed:
+                continue
+            listed.add(key)
+            analyzer = FilesystemAnalyzer(source.handler)
+            seen = set()
+            for f in analyzer.list_files(source.partition_id, path, max_files, include_deleted=False):
+                if f.type != 'file' or f.inode is None or f.size < min_size or f.inode in seen:
+                    continue
+                seen.add(f.inode)
+                candidates.append(_Candidate(source, f.inode, f.path, f.size))
+        return candidates
+
+    def _hash_all(self, candidates: List[_Candidate],
+                  hash_file: Callable[[_Candidate], Tuple[str, int]]) -> Dict[_Candidate, str]:
+        """Hash candidates on the worker pool; files that cannot be read are left out"""
+        def run(candidate: _Candidate) -> Tuple[_Candidate, Optional[str], int]:
+            try:
+                return (candidate, *hash_file(candidate))
+            except Exception as e:
+                print(f"Error hashing {candidate.path} in {candidate.source.image_path}: {e}")
+                return candidate, None, 0
+
+        hashed = {}
+        for candidate, digest, read in worker_pool.map_unordered(run, candidates):
+            self.bytes_read += read
+            if digest is not None:
+                hashed[candidate] = digest
+        return hashed
+
+    def _partial_hash(self, candidate: _Candidate) -> Tuple[str, int]:
+        """
+        SHA-256 of the first and last PARTIAL_HASH_SIZE bytes (of the whole
+        file if that covers it), and the bytes read
+        """
+        fs_info = candidate.source.handler.get_thread_filesystem(candidate.source.partition_id)
+        file_obj = fs_info.open_meta(inode=candidate.inode)
+        size = candidate.size
+        if size <= 2 * PARTIAL_HASH_SIZE:
+            pieces = [file_obj.read_random(0, size)]
+        else:
+            pieces = [file_obj.read_random(0, PARTIAL_HASH_SIZE),
+                      file_obj.read_random(size - PARTIAL_HASH_SIZE, PARTIAL_HASH_SIZE)]
+        read = sum(len(piece) for piece in pieces)
+        if read < min(size, 2 * PARTIAL_HASH_SIZE):
+            raise IOError("Short read")
+        digest = hashlib.sha256()
+        for piece in pieces:
+            digest.update(piece)
+        return digest.hexdigest(), read
+
+    def _full_hash(self, candidate: _Candidate) -> Tuple[str, int]:
+        """
+        SHA-256 of the whole file and the bytes read; nothing is read when
+        the file was hashed before and its hashes are stored
+        """
+        source = candidate.source
+        fingerprint = source.handler.get_content_fingerprint() if results_store.enabled else None
+        if fingerprint:
+            stored = results_store.get(fingerprint, 'hash', key=f"{source.partition_id}:{candidate.inode}:")
+            if stored is not None:
+                return stored['sha256'], 0
+
+        analyzer = FilesystemAnalyzer(source.handler)
+        fs_info = source.handler.get_thread_filesystem(source.partition_id)
+        digest = hashlib.sha256()
+        length = 0
+        for chunk in analyzer.iter_file_chunks(source.partition_id, candidate.path, candidate.inode,
+                                               fs_info=fs_info):
+            digest.update(chunk)
+            length += len(chunk)
+        if length < candidate.size:
+            raise IOError("Short read")
+        return digest.hexdigest(), length
+
+    def _cluster(self, members: List[_Candidate], sha256: str) -> DuplicateCluster:
+        size = members[0].size
+        locations = sorted(
+            (DuplicateLocation(image_path=c.source.image_path, partition_id=c.source.partition_id,
+                               inode=c.inode, path=c.path) for c in members),
+            key=lambda location: (location.image_path, location.partition_id, location.path))
+        return DuplicateCluster(
+            size=size,
+            sha256=sha256,
+            count=len(members),
+            duplicate_bytes=size * (len(members) - 1),
+            images=len({c.source.image_path for c in members}),
+            locations=locations
+        )
+
+
+def _regroup(candidates: List[_Candidate], hashed: Dict[_Candidate, str],
+             key: Callable[[_Candidate], object]) -> List[List[_Candidate]]:
+    """Groups of more than one hashed candidate sharing a key"""
+    groups: Dict[object, List[_Candidate]] = defaultdict(list)
+    for candidate in candidates:
+        if candidate in hashed:
+            groups[key(candidate)].append(candidate)
+    return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,381 @@
+"""
+Bulk export of files to a directory or a streamed ZIP/TAR archive
+Files are read on the shared worker pool and hashed while they are copied,
+producing a chain-of-custody manifest for every export
+"""
+import hashlib
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Generator, Iterable, List, NamedTuple, Optional, Set, Tuple
+from ..config import EXPORT_DIR, EXPORT_BUFFER_LIMIT
+from ..models.schemas import (
+    BulkExportRequest, ExportedFile, ExportManifest, FileMetadata, FileTimestamps
+)
+from .filesystem_analyzer import FilesystemAnalyzer
+from .image_handler import DiskImageHandler
+from .workers import worker_pool
+
+
+EXPORT_FORMATS = ("zip", "tar", "directory")
+MANIFEST_NAME = "manifest.json"
+
+# Upper bound on files listed when filters are applied after the walk
+FILTERED_LISTING_LIMIT = 1_000_000
+
+# Zeros written per chunk in place of data that could not be read
+PADDING_CHUNK_SIZE = 1024 * 1024
+
+# ZIP cannot represent dates before 1980
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class ExportItem(NamedTuple):
+    """A file to export and where it goes"""
+    path: str
+    export_path: str
+    inode: Optional[int]
+    attr_id: Optional[int]
+    metadata: Optional[FileMetadata]
+
+
+class _Hashes:
+    """MD5, SHA1 and SHA256 updated together while data is copied"""
+
+    def __init__(self):
+        self.md5, self.sha1, self.sha256 = hashlib.md5(), hashlib.sha1(), hashlib.sha256()
+        self.size = 0
+
+    def update(self, chunk: bytes):
+        self.md5.update(chunk)
+        self.sha1.update(chunk)
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+
+    def record(self, item: ExportItem) -> ExportedFile:
+        record = _base_record(item)
+        record.size = self.size
+        record.md5 = self.md5.hexdigest()
+        record.sha1 = self.sha1.hexdigest()
+        record.sha256 = self.sha256.hexdigest()
+        return record
+
+
+class _Sink:
+    """Write-only file object whose contents are drained by the response generator"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _base_record(item: ExportItem) -> ExportedFile:
+    metadata = item.metadata
+    return ExportedFile(
+        path=item.path,
+        export_path=item.export_path,
+        inode=item.inode,
+        size=metadata.size if metadata else 0,
+        is_deleted=metadata.is_deleted if metadata else False,
+        timestamps=metadata.timestamps if metadata else None
+    )
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def _safe_component(name: str) -> str:
+    # NTFS stream separators and path tricks must not leave the export root
+    name = name.replace(":", "_").replace("\\", "_")
+    return "_" if name in ("", ".", "..") else name
+
+
+def _export_path(path: str, inode: Optional[int], used: Set[str]) -> str:
+    """Relative output path for a file, made unique within the export"""
+    parts = [_safe_component(part) for part in path.strip("/").split("/")]
+    candidate = "/".join(parts)
+    if candidate.lower() in used or candidate == MANIFEST_NAME:
+        # Deleted entries often share a name with a live file
+        stem, dot, ext = parts[-1].rpartition(".")
+        suffix = f"~{inode}" if inode is not None else f"~{len(used)}"
+        parts[-1] = f"{stem}{suffix}.{ext}" if dot and stem else f"{parts[-1]}{suffix}"
+        candidate = "/".join(parts)
+    used.add(candidate.lower())
+    return candidate
+
+
+class BulkExporter:
+    """Exports selections of files from one partition"""
+
+    def __init__(self, image_handler: DiskImageHandler):
+        self.image_handler = image_handler
+        self.analyzer = FilesystemAnalyzer(image_handler)
+
+    def select(self, request: BulkExportRequest) -> List[ExportItem]:
+        """Resolve the request's explicit file list or filters into export items"""
+        used: Set[str] = set()
+        items = []
+
+        if request.files:
+            index = self.image_handler.get_path_index(request.partition_id)
+            for spec in request.files[:request.max_files]:
+                entry = index.lookup(spec.path)
+                inode = spec.inode if spec.inode is not None else (entry.inode if entry else None)
+                attr_id = spec.attr_id if spec.attr_id is not None else (entry.attr_id if entry else None)
+                metadata = entry.metadata if entry else None
+                items.append(ExportItem(spec.path, _export_path(spec.path, inode, used),
+                                        inode, attr_id, metadata))
+            return items
+
+        extensions = {ext.lower().lstrip(".") for ext in request.extensions or []}
+        filtered = bool(extensions) or request.deleted_only
+        files = self.analyzer.list_files(
+            request.partition_id,
+            path=request.path,
+            max_files=FILTERED_LISTING_LIMIT if filtered else request.max_files,
+            include_deleted=request.include_deleted or request.deleted_only
+        )
+        for metadata in files:
+            if metadata.type != "file":
+                continue
+            if request.deleted_only and not metadata.is_deleted:
+                continue
+            if extensions and metadata.extension.lower().lstrip(".") not in extensions:
+                continue
+            items.append(ExportItem(metadata.path, _export_path(metadata.path, metadata.inode, used),
+                                    metadata.inode, None, metadata))
+            if len(items) >= request.max_files:
+                break
+        return items
+
+    def _new_manifest(self, request: BulkExportRequest, destination: Optional[str] = None) -> ExportManifest:
+        return ExportManifest(
+            image_path=self.image_handler.image_path,
+            partition_id=request.partition_id,
+            created=datetime.now().isoformat(),
+            format=request.format,
+            destination=destination
+        )
+
+    def _add_record(self, manifest: ExportManifest, record: ExportedFile):
+        manifest.files.append(record)
+        manifest.file_count += 1
+        manifest.total_bytes += record.size
+        if record.error:
+            manifest.errors += 1
+
+    def _chunks(self, partition_id: str, item: ExportItem, fs_info=None) -> Iterable[bytes]:
+        return self.analyzer.iter_file_chunks(partition_id, item.path, item.inode, item.attr_id,
+                                              fs_info=fs_info)
+
+    # Directory export -----------------------------------------------------
+
+    def export_to_directory(self, request: BulkExportRequest, items: List[ExportItem]) -> ExportManifest:
+        """Copy files into a new directory under the export root, in parallel"""
+        name = _safe_component(Path(request.destination or "").name) if request.destination else \
+            f"export-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        root = Path(EXPORT_DIR) / name
+        root.parent.mkdir(parents=True, exist_ok=True)
+        root.mkdir()  # Never mix two exports in one directory
+
+        manifest = self._new_manifest(request, str(root))
+        partition_id = request.partition_id
+
+        def copy(item: ExportItem) -> ExportedFile:
+            target = root / item.export_path
+            hashes = _Hashes()
+            try:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                fs_info = self.image_handler.get_thread_filesystem(partition_id)
+                with open(target, "wb") as f:
+                    for chunk in self._chunks(partition_id, item, fs_info):
+                        hashes.update(chunk)
+                        f.write(chunk)
+                record = hashes.record(item)
+                self._preserve_timestamps(target, record.timestamps)
+                return record
+            except Exception as e:
+                record = hashes.record(item)
+                record.error = str(e)
+                return record
+
+        for record in worker_pool.map_unordered(copy, items):
+            self._add_record(manifest, record)
+
+        with open(root / MANIFEST_NAME, "w") as f:
+            f.write(manifest.model_dump_json(indent=2))
+        return manifest
+
+    def _preserve_timestamps(self, target: Path, timestamps: Optional[FileTimestamps]):
+        if timestamps is None:
+            return
+        modified = _timestamp(timestamps.modified)
+        if modified is None:
+            return
+        accessed = _timestamp(timestamps.accessed) or modified
+        os.utime(target, (accessed, modified))
+
+    # Archive export -------------------------------------------------------
+
+    def _read_parallel(self, partition_id: str, items: List[ExportItem]
+                       ) -> Generator[Tuple[ExportItem, Optional[List[bytes]], Optional[ExportedFile]], None, None]:
+        """
+        Read small files on the worker pool, yielding them as they complete
+
+        Files larger than EXPORT_BUFFER_LIMIT are yielded without data and
+        streamed by the caller, so memory stays bounded by the pool size.
+        """
+        def read(item: ExportItem):
+            if item.metadata is not None and item.metadata.size > EXPORT_BUFFER_LIMIT:
+                return item, None, None
+            hashes = _Hashes()
+            chunks = []
+            try:
+                fs_info = self.image_handler.get_thread_filesystem(partition_id)
+                for chunk in self._chunks(partition_id, item, fs_info):
+                    hashes.update(chunk)
+                    chunks.append(chunk)
+                    if hashes.size > EXPORT_BUFFER_LIMIT:
+                        # Size was unknown up front and turned out large
+                        return item, None, None
+                return item, chunks, hashes.record(item)
+            except Exception as e:
+                record = hashes.record(item)
+                record.error = str(e)
+                return item, [], record
+
+        return worker_pool.map_unordered(read, items)
+
+    def stream_archive(self, request: BulkExportRequest, items: List[ExportItem]) -> Generator[bytes, None, None]:
+        """Stream a ZIP or TAR archive with the manifest as its last member"""
+        writer = _ZipWriter() if request.format == "zip" else _TarWriter()
+        manifest = self._new_manifest(request)
+        partition_id = request.partition_id
+        # Large files are streamed from this generator, which Starlette may resume on
+        # different threads, so they get a filesystem object of their own
+        stream_fs = None
+
+        for item, chunks, record in self._read_parallel(partition_id, items):
+            if chunks is None:
+                if stream_fs is None:
+                    stream_fs = self.image_handler.open_filesystem(partition_id)
+                record = yield from self._stream_large(writer, partition_id, item, stream_fs)
+            else:
+                yield from writer.add(item.export_path, record.size, record.timestamps, chunks)
+            self._add_record(manifest, record)
+
+        data = manifest.model_dump_json(indent=2).encode()
+        yield from writer.add(MANIFEST_NAME, len(data), None, [data])
+        yield writer.close()
+
+    def _stream_large(self, writer, partition_id: str, item: ExportItem, fs_info):
+        hashes = _Hashes()
+        error = None
+        # TAR headers need the size up front: that of the attribute exported,
+        # which for a named stream is not the size in the file's metadata
+        file_obj, attr_id = self.analyzer._open_file(partition_id, item.path, item.inode, item.attr_id, fs_info)
+        _, _, size = self.analyzer._resolve_attribute(file_obj, attr_id)
+
+        def chunks():
+            # Exactly size bytes are written and hashed; a short read is padded with zeros
+            nonlocal error
+            try:
+                for chunk in self.analyzer._iter_open_file(partition_id, fs_info, file_obj, attr_id):
+                    chunk = chunk[:size - hashes.size]
+                    if not chunk:
+                        break
+                    hashes.update(chunk)
+                    yield chunk
+            except Exception as e:
+                error = str(e)
+            if hashes.size < size:
+                error = error or f"Short read: {size - hashes.size} bytes padded with zeros"
+            while hashes.size < size:
+                padding = bytes(min(PADDING_CHUNK_SIZE, size - hashes.size))
+                hashes.update(padding)
+                yield padding
+
+        timestamps = item.metadata.timestamps if item.metadata else None
+        yield from writer.add(item.export_path, size, timestamps, chunks())
+        record = hashes.record(item)
+        record.error = error
+        return record
+
+
+class _ZipWriter:
+    """Streams ZIP members (stored, with data descriptors) to a sink"""
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def add(self, name: str, size: int, timestamps: Optional[FileTimestamps],
+            chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+        info = zipfile.ZipInfo(name, date_time=self._date_time(timestamps))
+        info.compress_type = zipfile.ZIP_STORED
+        with self._zip.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        yield self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+    @staticmethod
+    def _date_time(timestamps: Optional[FileTimestamps]):
+        modified = _timestamp(timestamps.modified) if timestamps else None
+        if modified is None:
+            return ZIP_EPOCH
+        return max(ZIP_EPOCH, time.localtime(modified)[:6])
+
+
+class _TarWriter:
+    """Streams TAR members (PAX format) without buffering whole files"""
+
+    def add(self, name: str, size: int, timestamps: Optional[FileTimestamps],
+            chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        modified = _timestamp(timestamps.modified) if timestamps else None
+        info.mtime = int(modified) if modified is not None else 0
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+
+        written = 0
+        for chunk in chunks:
+            chunk = chunk[:size - written]
+            written += len(chunk)
+            if chunk:
+                yield chunk
+        if written < size:
+            yield bytes(size - written)
+        padding = -size % tarfile.BLOCKSIZE
+        if padding:
+            yield bytes(padding)
+
+    def close(self) -> bytes:
+        return bytes(tarfile.BLOCKSIZE * 2)
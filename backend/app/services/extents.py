@@ -0,0 +1,311 @@
+"""
+Extent maps for reading file data straight from the image
+A file's block runs are resolved once from its TSK attribute runs; reads
+are then issued against the image per extent, bypassing TSK's per-call
+run lookup, which is costly on heavily fragmented files
+"""
+import bisect
+import struct
+from typing import Callable, Generator, List, NamedTuple, Optional, Tuple
+import pytsk3
+
+
+# Attribute types that hold file content (ext indirect/extent attributes are metadata)
+DATA_ATTR_TYPES = {
+    int(getattr(pytsk3, name)) for name in (
+        'TSK_FS_ATTR_TYPE_DEFAULT',
+        'TSK_FS_ATTR_TYPE_NTFS_DATA',
+        'TSK_FS_ATTR_TYPE_HFS_DATA',
+    ) if hasattr(pytsk3, name)
+}
+
+NTFS_MFT_INODE = 0
+NTFS_DATA_TYPE = 0x80
+NTFS_END_MARKER = 0xFFFFFFFF
+# Update sequence fixups protect every 512 bytes whatever the sector size
+NTFS_FIXUP_STRIDE = 512
+
+# Runs whose content is zeros rather than on disk
+ZERO_RUN_FLAGS = pytsk3.TSK_FS_ATTR_RUN_FLAG_SPARSE | pytsk3.TSK_FS_ATTR_RUN_FLAG_FILLER
+# Attributes whose on-disk bytes are not the file content
+TRANSFORMED_ATTR_FLAGS = pytsk3.TSK_FS_ATTR_COMP | pytsk3.TSK_FS_ATTR_ENC
+# Extents at most this far apart in the image are fetched with one read
+COALESCE_GAP = 64 * 1024
+# Mean extent length from which streaming along the extents beats TSK
+STREAM_MIN_EXTENT = 256 * 1024
+
+
+class Extent(NamedTuple):
+    """A contiguous piece of file content"""
+    logical_offset: int  # Byte offset within the file
+    length: int
+    physical_offset: Optional[int]  # Byte offset within the image; None for sparse (zero) extents
+
+
+class ExtentMap(NamedTuple):
+    """
+    Where a file's content lies in the image
+    direct is False when the content cannot be read from the extents
+    (resident, compressed or encrypted data); extents are still listed
+    where TSK reports them, but reads have to go through TSK
+    """
+    size: int
+    block_size: int
+    extents: List[Extent]
+    direct: bool
+    reason: Optional[str] = None
+
+
+def build_extent_map(file_obj, attr, fs_info: pytsk3.FS_Info, fs_offset: int,
+                     img_read: Callable[[int, int], bytes]) -> ExtentMap:
+    """
+    Build the extent map of one attribute of an open file
+
+    Gaps between runs and sparse runs become zero extents, the last run
+    is clipped to the attribute size, and NTFS data past the initialized
+    size (which TSK reads as zeros) is mapped as zeros too.
+    """
+    info = attr.info
+    size = info.size
+    block_size = fs_info.info.block_size
+
+    if info.flags & pytsk3.TSK_FS_ATTR_RES:
+        return ExtentMap(size, block_size, [], False, "resident")
+
+    runs = sorted(attr, key=lambda run: run.offset)
+    extents: List[Extent] = []
+    position = 0
+    for run in runs:
+        start = run.offset * block_size
+        if start >= size:
+            break
+        if start > position:
+            extents.append(Extent(position, start - position, None))
+        length = min(run.len * block_size, size - start)
+        if run.flags & pytsk3.TSK_FS_ATTR_RUN_FLAG_ENCRYPTED:
+            return ExtentMap(size, block_size, extents, False, "encrypted")
+        physical = None if run.flags & ZERO_RUN_FLAGS else fs_offset + run.addr * block_size
+        extents.append(Extent(start, length, physical))
+        position = start + length
+    if position < size:
+        extents.append(Extent(position, size - position, None))
+
+    if info.flags & TRANSFORMED_ATTR_FLAGS:
+        return ExtentMap(size, block_size, extents, False,
+                         "compressed" if info.flags & pytsk3.TSK_FS_ATTR_COMP else "encrypted")
+
+    if fs_info.info.ftype == pytsk3.TSK_FS_TYPE_NTFS and int(info.type) == NTFS_DATA_TYPE:
+        initialized = _ntfs_initialized_size(fs_info, file_obj.info.meta.addr, info.id, fs_offset, img_read)
+        if initialized is None:
+            return ExtentMap(size, block_size, extents, False, "initialized size unknown")
+        extents = _zero_from(extents, initialized)
+
+    return ExtentMap(size, block_size, _merge(extents), True)
+
+
+def slack_extents(attr, fs_info: pytsk3.FS_Info, fs_offset: int) -> List[Extent]:
+    """
+    Where an attribute's slack lies: the allocated bytes past the end of its data
+    Logical offsets continue past the attribute size. Empty for resident,
+    compressed or encrypted data, and for sparse tails.
+    """
+    info = attr.info
+    if info.flags & (pytsk3.TSK_FS_ATTR_RES | TRANSFORMED_ATTR_FLAGS):
+        return []
+    block_size = fs_info.info.block_size
+    size = info.size
+
+    extents = []
+    for run in sorted(attr, key=lambda run: run.offset):
+        if run.flags & (ZERO_RUN_FLAGS | pytsk3.TSK_FS_ATTR_RUN_FLAG_ENCRYPTED):
+            continue
+        start = run.offset * block_size
+        end = start + run.len * block_size
+        if end <= size:
+            continue
+        begin = max(start, size)
+        extents.append(Extent(begin, end - begin, fs_offset + run.addr * block_size + begin - start))
+    return _merge(extents)
+
+
+def _zero_from(extents: List[Extent], offset: int) -> List[Extent]:
+    """Map everything from offset onwards as zeros"""
+    result = []
+    for extent in extents:
+        end = extent.logical_offset + extent.length
+        if end <= offset or extent.physical_offset is None:
+            result.append(extent)
+        elif extent.logical_offset >= offset:
+            result.append(extent._replace(physical_offset=None))
+        else:
+            head = offset - extent.logical_offset
+            result.append(extent._replace(length=head))
+            result.append(Extent(offset, end - offset, None))
+    return result
+
+
+def _merge(extents: List[Extent]) -> List[Extent]:
+    """Join extents that are adjacent both in the file and in the image"""
+    merged: List[Extent] = []
+    for extent in extents:
+        if not extent.length:
+            continue
+        if merged:
+            last = merged[-1]
+            contiguous = (last.physical_offset is None and extent.physical_offset is None) or (
+                last.physical_offset is not None and extent.physical_offset is not None
+                and last.physical_offset + last.length == extent.physical_offset)
+            if contiguous:
+                merged[-1] = last._replace(length=last.length + extent.length)
+                continue
+        merged.append(extent)
+    return merged
+
+
+def _ntfs_initialized_size(fs_info: pytsk3.FS_Info, inode: int, attr_id: int, fs_offset: int,
+                           img_read: Callable[[int, int], bytes]) -> Optional[int]:
+    """
+    Initialized size of a non-resident NTFS attribute from its MFT record
+    pytsk3 does not expose it. Returns None when the attribute is not in
+    the base record (attribute lists) or the record cannot be parsed.
+    """
+    try:
+        boot = img_read(fs_offset, 512)
+        bytes_per_sector, sectors_per_cluster = struct.unpack_from("<HB", boot, 0x0B)
+        clusters_per_record, = struct.unpack_from("<b", boot, 0x40)
+        record_size = (clusters_per_record * bytes_per_sector * sectors_per_cluster
+                       if clusters_per_record > 0 else 1 << -clusters_per_record)
+
+        mft = fs_info.open_meta(inode=NTFS_MFT_INODE)
+        record = bytearray(mft.read_random(inode * record_size, record_size))
+        if len(record) < record_size or record[0:4] != b"FILE":
+            return None
+
+        # Undo the update sequence fixups
+        usa_offset, usa_count = struct.unpack_from("<HH", record, 0x04)
+        usn = record[usa_offset:usa_offset + 2]
+        for i in range(1, usa_count):
+            end = i * NTFS_FIXUP_STRIDE
+            if end > record_size or record[end - 2:end] != usn:
+                return None
+            record[end - 2:end] = record[usa_offset + 2 * i:usa_offset + 2 * i + 2]
+
+        offset, = struct.unpack_from("<H", record, 0x14)
+        while offset + 16 <= record_size:
+            attr_type, length = struct.unpack_from("<II", record, offset)
+            if attr_type == NTFS_END_MARKER or length == 0:
+                break
+            non_resident = record[offset + 8]
+            instance, = struct.unpack_from("<H", record, offset + 0x0E)
+            if attr_type == NTFS_DATA_TYPE and instance == attr_id and non_resident:
+                initialized, = struct.unpack_from("<Q", record, offset + 0x38)
+                return initialized
+            offset += length
+    except Exception:
+        return None
+    return None
+
+
+def data_attribute(file_obj, attr_id: Optional[int] = None):
+    """The attribute read_random reads: attr_id, or the default (unnamed) data attribute"""
+    for attr in file_obj:
+        info = attr.info
+        if attr_id is not None:
+            if info.id == attr_id:
+                return attr
+        elif int(info.type) in DATA_ATTR_TYPES and not info.name:
+            return attr
+    return None
+
+
+def streams_directly(extent_map: Optional[ExtentMap]) -> bool:
+    """
+    Whether streaming a file along its extents beats TSK
+    Sequential TSK reads in large pieces are cheap; per-extent slicing in
+    Python only pays off once extents are large (or reads small and random)
+    """
+    if extent_map is None or not extent_map.direct:
+        return False
+    mapped = sum(1 for extent in extent_map.extents if extent.physical_offset is not None)
+    return not mapped or extent_map.size // mapped >= STREAM_MIN_EXTENT
+
+
+class ExtentReader:
+    """
+    Random access to a file's content through its extent map
+    Each read locates its extents by bisection instead of walking the run
+    list, which is what makes TSK slow for small reads into fragmented
+    files (images nested inside a filesystem are read this way)
+    """
+
+    def __init__(self, img_read: Callable[[int, int], bytes], extent_map: ExtentMap):
+        if not extent_map.direct:
+            raise ValueError(f"File content cannot be read from its extents ({extent_map.reason})")
+        self._img_read = img_read
+        self._extents = extent_map.extents
+        self._starts = [extent.logical_offset for extent in extent_map.extents]
+        self.size = extent_map.size
+
+    def read(self, offset: int, size: int) -> bytes:
+        size = max(0, min(size, self.size - offset))
+        if not size:
+            return b""
+        pieces: List[Tuple[Optional[int], int]] = []
+        index = bisect.bisect_right(self._starts, offset) - 1
+        end = offset + size
+        while offset < end:
+            extent = self._extents[index]
+            within = offset - extent.logical_offset
+            length = min(end - offset, extent.length - within)
+            physical = None if extent.physical_offset is None else extent.physical_offset + within
+            pieces.append((physical, length))
+            offset += length
+            index += 1
+        return _read_pieces(self._img_read, pieces)
+
+
+def iter_extents(img_read: Callable[[int, int], bytes], extent_map: ExtentMap,
+                 chunk_size: int) -> Generator[bytes, None, None]:
+    """Read a file's content in chunks of chunk_size (the last may be shorter)"""
+    reader = ExtentReader(img_read, extent_map)
+    for offset in range(0, extent_map.size, chunk_size):
+        yield reader.read(offset, chunk_size)
+
+
+def _read_pieces(img_read: Callable[[int, int], bytes], pieces: List[Tuple[Optional[int], int]]) -> bytes:
+    """
+    Content of consecutive pieces of a file
+    Pieces that lie close together in the image are fetched with one read
+    and sliced, so a fragmented range costs a few reads rather than one
+    per block
+    """
+    if len(pieces) == 1 and pieces[0][0] is not None:
+        physical, length = pieces[0]
+        data = img_read(physical, length)
+        if len(data) < length:
+            raise IOError(f"Short read at image offset {physical}")
+        return data
+
+    out = bytearray()
+    i = 0
+    while i < len(pieces):
+        physical, length = pieces[i]
+        if physical is None:
+            out += bytes(length)
+            i += 1
+            continue
+        start, end, j = physical, physical + length, i + 1
+        while j < len(pieces):
+            next_physical, next_length = pieces[j]
+            if next_physical is None or not end <= next_physical <= end + COALESCE_GAP:
+                break
+            end = next_physical + next_length
+            j += 1
+        data = img_read(start, end - start)
+        if len(data) < end - start:
+            raise IOError(f"Short read at image offset {start}")
+        view = memoryview(data)
+        for piece_physical, piece_length in pieces[i:j]:
+            out += view[piece_physical - start:piece_physical - start + piece_length]
+        i = j
+    return bytes(out)
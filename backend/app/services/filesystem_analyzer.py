@@ -4,10 +4,47 @@ Extracts files, metadata, and performs analysis
 """
 import pytsk3
 import hashlib
-from typing import List, Optional, Generator, Tuple
+from typing import Iterable, List, Optional, Generator, Tuple
 from datetime import datetime
-from ..models.schemas import FileMetadata, FileTimestamps, HashResult
+from ..config import SIMILARITY_MAX_SIZE
+from ..models.schemas import FileMetadata, FileTimestamps, HashResult, DirectoryListing, FileAttribute
+from .cache import directory_cache, extent_cache
+from .extents import ExtentMap, build_extent_map, data_attribute, iter_extents, streams_directly
+from .metrics import path_index_lookups
 from .image_handler import DiskImageHandler
+from .results_store import results_store
+from .risk import risk_index
+from .similarity import SimilarityHasher, similarity_index
+from .path_index import PathIndex, normalize_path
+from .workers import worker_pool
+
+
+# Attribute type names (NTFS attribute types plus TSK's generic types)
+ATTRIBUTE_TYPE_NAMES = {
+    0x01: 'DEFAULT',
+    0x10: '$STANDARD_INFORMATION',
+    0x20: '$ATTRIBUTE_LIST',
+    0x30: '$FILE_NAME',
+    0x40: '$OBJECT_ID',
+    0x50: '$SECURITY_DESCRIPTOR',
+    0x60: '$VOLUME_NAME',
+    0x70: '$VOLUME_INFORMATION',
+    0x80: '$DATA',
+    0x90: '$INDEX_ROOT',
+    0xA0: '$INDEX_ALLOCATION',
+    0xB0: '$BITMAP',
+    0xC0: '$REPARSE_POINT',
+    0xD0: '$EA_INFORMATION',
+    0xE0: '$EA',
+    0x100: '$LOGGED_UTILITY_STREAM',
+    0x1001: 'INDIRECT',
+    0x1003: 'EXTENTS',
+    0x1100: 'HFS_DATA',
+}
+NTFS_DATA_TYPE = 0x80
+
+# Size of individual read_random calls when reading file contents
+READ_CHUNK_SIZE = 1024 * 1024
 
 
 class FilesystemAnalyzer:
@@ -21,7 +58,8 @@ class FilesystemAnalyzer:
     def list_files(self, partition_id: str, path: str = "/", 
                    max_files: int = 1000, 
                    include_deleted: bool = True,
-                   include_directories: bool = False) -> List[FileMetadata]:
+                   include_directories: bool = False,
+                   include_attributes: bool = False) -> List[FileMetadata]:
         """
         List files in a partition
         
@@ -31,26 +69,40 @@ class FilesystemAnalyzer:
             max_files: Maximum number of files to return
             include_deleted: Include deleted files
             include_directories: Include directories in results
+            include_attributes: Enumerate every attribute (e.g. NTFS ADS) per file
         """
+        # Serve fully walked subtrees straight from the path index
+        index = self.image_handler.get_path_index(partition_id)
+        indexed = index.list_prefix(path, max_files, include_deleted, include_directories)
+        if indexed is not None and (not include_attributes or all(f.attributes is not None for f in indexed)):
+            path_index_lookups.inc(result='hit')
+            return indexed
+        path_index_lookups.inc(result='miss')
+        
         fs_info = self.image_handler.get_filesystem(partition_id)
         files = []
+        index.discard_subtree(path)
         
         try:
             directory = fs_info.open_dir(path)
             self._recurse_directory(
                 fs_info, directory, path, files, 
-                max_files, include_deleted, include_directories
+                max_files, include_deleted, include_directories, index=index,
+                include_attributes=include_attributes
             )
         except Exception as e:
             print(f"Error listing files in {path}: {e}")
         
+        risk_index.update_files(self.image_handler.get_fingerprint(), partition_id, index)
         return files[:max_files]
     
     def _recurse_directory(self, fs_info: pytsk3.FS_Info, directory, 
                           current_path: str, files: List[FileMetadata],
                           max_files: int, include_deleted: bool, 
-                          include_directories: bool, depth: int = 0):
-        """Recursively traverse directory tree"""
+                          include_directories: bool, depth: int = 0,
+                          index: Optional[PathIndex] = None,
+                          include_attributes: bool = False):
+        """Recursively traverse directory tree, indexing every entry seen"""
         if len(files) >= max_files or depth > 10:  # Limit depth to prevent infinite recursion
             return
         
@@ -70,40 +122,154 @@ class FilesystemAnalyzer:
                 continue
             
             # Check if it's a directory
-            is_dir = entry.info.meta and entry.info.meta.type == pytsk3.TSK_FS_META_TYPE_DIR
-            
-            if is_dir and not include_directories:
-                # Recurse into directory but don't add to list
-                try:
-                    sub_dir = fs_info.open_dir(inode=entry.info.meta.addr)
-                    new_path = f"{current_path}/{name}".replace('//', '/')
-                    self._recurse_directory(
-                        fs_info, sub_dir, new_path, files,
-                        max_files, include_deleted, include_directories, depth + 1
-                    )
-                except Exception:
-                    pass
-                continue
+            is_dir = bool(entry.info.meta and entry.info.meta.type == pytsk3.TSK_FS_META_TYPE_DIR)
             
-            # Extract file metadata
-            file_meta = self._extract_file_metadata(entry, current_path, is_deleted)
+            # Extract file metadata (directories too, so they can be listed from the index)
+            file_meta = self._extract_file_metadata(entry, current_path, is_deleted, include_attributes)
             if file_meta:
-                files.append(file_meta)
+                if index is not None:
+                    self._index_entry(index, file_meta, is_dir, is_deleted)
+                if include_directories or not is_dir:
+                    files.append(file_meta)
             
             # Recurse into directories
             if is_dir:
+                new_path = f"{current_path}/{name}".replace('//', '/')
                 try:
                     sub_dir = fs_info.open_dir(inode=entry.info.meta.addr)
-                    new_path = f"{current_path}/{name}".replace('//', '/')
+                except Exception:
+                    # Unreadable (e.g. reallocated) directories have nothing to walk
+                    if index is not None:
+                        index.mark_complete(new_path, include_deleted)
+                    continue
+                try:
                     self._recurse_directory(
                         fs_info, sub_dir, new_path, files,
-                        max_files, include_deleted, include_directories, depth + 1
+                        max_files, include_deleted, include_directories, depth + 1,
+                        index=index, include_attributes=include_attributes
                     )
                 except Exception:
                     pass
+        
+        if index is not None:
+            index.mark_complete(current_path, include_deleted)
+    
+    def _index_entry(self, index: PathIndex, file_meta: FileMetadata,
+                     is_dir: bool, is_deleted: bool):
+        """Index a file plus each of its named data streams as path:stream"""
+        index.add(file_meta.path, file_meta.inode, is_directory=is_dir,
+                  is_deleted=is_deleted, metadata=file_meta)
+        for attr in file_meta.attributes or []:
+            if attr.name and attr.type == NTFS_DATA_TYPE:
+                index.add(f"{file_meta.path}:{attr.name}", file_meta.inode,
+                          attr_id=attr.id, is_deleted=is_deleted)
+    
+    def list_directory(self, partition_id: str, inode: Optional[int] = None,
+                       path: Optional[str] = None,
+                       include_deleted: bool = True) -> DirectoryListing:
+        """
+        List the immediate children of a single directory
+        
+        Listings are cached per (image, partition, directory inode), so
+        expanding a folder costs at most one directory read. Child counts of
+        subdirectories are filled in lazily from listings already cached.
+        
+        Args:
+            partition_id: Partition identifier
+            inode: Directory inode (root directory when omitted)
+            path: Directory path, used to build child paths
+            include_deleted: Include deleted entries
+        """
+        index = self.image_handler.get_path_index(partition_id)
+        if inode is None:
+            entry = index.lookup(path or "/")
+            if entry is not None:
+                inode = entry.inode
+        
+        listing = None
+        if inode is not None:
+            listing = directory_cache.get(self._directory_key(partition_id, inode))
+        cached = listing is not None
+        if listing is None:
+            listing = self._read_directory(partition_id, inode, path, index)
+            directory_cache.put(self._directory_key(partition_id, listing.inode), listing)
+        
+        entries = [
+            self._with_child_count(partition_id, entry)
+            for entry in listing.entries
+            if include_deleted or not entry.is_deleted
+        ]
+        return DirectoryListing(
+            partition_id=partition_id,
+            inode=listing.inode,
+            path=listing.path,
+            entries=entries,
+            cached=cached
+        )
+    
+    def _directory_key(self, partition_id: str, inode: int) -> tuple:
+        return (self.image_handler.image_path, partition_id, inode)
+    
+    def _read_directory(self, partition_id: str, inode: Optional[int],
+                        path: Optional[str], index: PathIndex) -> DirectoryListing:
+        """Read one directory, preferring the path index over the filesystem"""
+        fs_info = self.image_handler.get_filesystem(partition_id)
+        root_inum = fs_info.info.root_inum
+        
+        if inode is None:
+            if normalize_path(path or "/") == "/":
+                inode = root_inum
+            else:
+                inode = fs_info.open(path).info.meta.addr
+        if path is None:
+            path = "/" if inode == root_inum else index.path_for_inode(inode)
+            if path is None:
+                raise ValueError(f"Path of directory inode {inode} is unknown, pass it with the request")
+        path = normalize_path(path)
+        if path == "/":
+            index.add("/", inode, is_directory=True)
+        
+        # A directory already fully walked needs no filesystem read at all
+        if index.is_complete(path, include_deleted=True):
+            entries = [child.metadata for child in index.children(path) if child.metadata]
+            return DirectoryListing(partition_id=partition_id, inode=inode, path=path, entries=entries)
+        
+        directory = fs_info.open_dir(inode=inode)
+        index.reset_directory(path)
+        entries = []
+        
+        for entry in directory:
+            if not hasattr(entry, 'info') or entry.info is None:
+                continue
+            
+            name = entry.info.name.name.decode('utf-8', errors='ignore')
+            if name in ['.', '..']:
+                continue
+            
+            is_deleted = entry.info.name.flags == pytsk3.TSK_FS_NAME_FLAG_UNALLOC
+            is_dir = bool(entry.info.meta and entry.info.meta.type == pytsk3.TSK_FS_META_TYPE_DIR)
+            
+            file_meta = self._extract_file_metadata(entry, path, is_deleted)
+            if file_meta:
+                self._index_entry(index, file_meta, is_dir, is_deleted)
+                entries.append(file_meta)
+        
+        index.mark_complete(path, include_deleted=True)
+        risk_index.update_files(self.image_handler.get_fingerprint(), partition_id, index)
+        return DirectoryListing(partition_id=partition_id, inode=inode, path=path, entries=entries)
+    
+    def _with_child_count(self, partition_id: str, entry: FileMetadata) -> FileMetadata:
+        """Attach a child count to directories whose listing is already cached"""
+        if entry.type != 'directory' or entry.inode is None:
+            return entry
+        child = directory_cache.peek(self._directory_key(partition_id, entry.inode))
+        if child is None:
+            return entry
+        return entry.model_copy(update={'child_count': len(child.entries)})
     
-    def _extract_file_metadata(self, entry, current_path: str, is_deleted: bool) -> Optional[FileMetadata]:
-        """Extract metadata from a file entry"""
+    def _extract_file_metadata(self, entry, current_path: str, is_deleted: bool,
+                               include_attributes: bool = False) -> Optional[FileMetadata]:
+        """Extract metadata from a file entry (the already-open File object)"""
         try:
             if not entry.info or not entry.info.meta:
                 return None
@@ -152,12 +318,34 @@ class FilesystemAnalyzer:
                 inode=meta.addr,
                 permissions=self._get_permissions(meta) if hasattr(meta, 'mode') else None,
                 owner_uid=meta.uid if hasattr(meta, 'uid') else None,
-                owner_gid=meta.gid if hasattr(meta, 'gid') else None
+                owner_gid=meta.gid if hasattr(meta, 'gid') else None,
+                attributes=self._extract_attributes(entry) if include_attributes else None
             )
         except Exception as e:
             print(f"Error extracting metadata: {e}")
             return None
     
+    def _extract_attributes(self, file_obj) -> List[FileAttribute]:
+        """Enumerate every attribute of an open file, including alternate data streams"""
+        attributes = []
+        try:
+            for attr in file_obj:
+                info = attr.info
+                name = info.name
+                if isinstance(name, bytes):
+                    name = name.decode('utf-8', errors='ignore')
+                attributes.append(FileAttribute(
+                    id=info.id,
+                    type=int(info.type),
+                    type_name=ATTRIBUTE_TYPE_NAMES.get(int(info.type), f'0x{int(info.type):x}'),
+                    name=name or None,
+                    size=info.size,
+                    resident=bool(info.flags & pytsk3.TSK_FS_ATTR_RES)
+                ))
+        except Exception as e:
+            print(f"Error enumerating attributes: {e}")
+        return attributes
+    
     def _extract_timestamps(self, meta) -> FileTimestamps:
         """Extract file timestamps"""
         timestamps = FileTimestamps()
@@ -220,51 +408,227 @@ class FilesystemAnalyzer:
         except Exception:
             return None
     
-    def read_file(self, partition_id: str, file_path: str, inode: Optional[int] = None) -> bytes:
+    def read_file(self, partition_id: str, file_path: str, inode: Optional[int] = None,
+                  attr_id: Optional[int] = None) -> bytes:
         """
         Read file contents from the filesystem
         
         Args:
             partition_id: Partition identifier
-            file_path: Path to the file
+            file_path: Path to the file (path:stream selects an NTFS data stream)
             inode: Optional inode number for faster access
+            attr_id: Optional attribute id (default data stream when omitted)
         """
-        fs_info = self.image_handler.get_filesystem(partition_id)
-        
         try:
-            if inode:
-                # Open by inode (faster)
-                file_obj = fs_info.open_meta(inode=inode)
-            else:
-                # Open by path
-                file_obj = fs_info.open(file_path)
-            
-            # Read file data
-            size = file_obj.info.meta.size
-            offset = 0
-            data = b''
-            
-            # Read in chunks
-            chunk_size = 1024 * 1024  # 1MB chunks
-            while offset < size:
-                read_size = min(chunk_size, size - offset)
-                chunk = file_obj.read_random(offset, read_size)
-                if not chunk:
-                    break
-                data += chunk
-                offset += len(chunk)
-            
-            return data
+            return b''.join(self.iter_file_chunks(partition_id, file_path, inode, attr_id))
         except Exception as e:
             print(f"Error reading file {file_path}: {e}")
             raise
     
-    def calculate_file_hash(self, partition_id: str, file_path: str, inode: Optional[int] = None) -> HashResult:
-        """Calculate hashes for a file"""
-        data = self.read_file(partition_id, file_path, inode)
+    def iter_file_chunks(self, partition_id: str, file_path: str, inode: Optional[int] = None,
+                         attr_id: Optional[int] = None, chunk_size: int = READ_CHUNK_SIZE,
+                         fs_info: Optional[pytsk3.FS_Info] = None) -> Generator[bytes, None, None]:
+        """
+        Read file contents chunk by chunk
+        Pass a thread-private fs_info when reading from worker threads
+        """
+        if fs_info is None:
+            fs_info = self.image_handler.get_filesystem(partition_id)
+        file_obj, attr_id = self._open_file(partition_id, file_path, inode, attr_id, fs_info)
+        return self._iter_open_file(partition_id, fs_info, file_obj, attr_id, chunk_size)
+    
+    def _iter_open_file(self, partition_id: str, fs_info: pytsk3.FS_Info, file_obj,
+                        attr_id: Optional[int],
+                        chunk_size: int = READ_CHUNK_SIZE) -> Generator[bytes, None, None]:
+        """
+        Read an already opened file chunk by chunk
+        Data is read straight from the image along the file's extent map
+        when possible, and through TSK otherwise
+        """
+        extent_map = self._load_extent_map(partition_id, fs_info, file_obj, attr_id)
+        if streams_directly(extent_map):
+            yield from iter_extents(self.image_handler.img_info.read, extent_map, chunk_size)
+            return
+        
+        attr_type, attr_id, size = self._resolve_attribute(file_obj, attr_id)
+        
+        offset = 0
+        while offset < size:
+            read_size = min(chunk_size, size - offset)
+            if attr_id is None:
+                chunk = file_obj.read_random(offset, read_size)
+            else:
+                chunk = file_obj.read_random(offset, read_size, attr_type, attr_id)
+            if not chunk:
+                break
+            yield chunk
+            offset += len(chunk)
+    
+    def _open_file(self, partition_id: str, file_path: str, inode: Optional[int],
+                   attr_id: Optional[int], fs_info: Optional[pytsk3.FS_Info] = None):
+        """Open a file by inode, path index entry or path; returns (file, attr_id)"""
+        if fs_info is None:
+            fs_info = self.image_handler.get_filesystem(partition_id)
+        stream_name = None
+        
+        if inode is None:
+            # Resolve through the path index when the file was seen by a walk
+            entry = self.image_handler.get_path_index(partition_id).lookup(file_path)
+            if entry is not None:
+                inode = entry.inode
+                if attr_id is None:
+                    attr_id = entry.attr_id
+            elif fs_info.info.ftype == pytsk3.TSK_FS_TYPE_NTFS:
+                # Only NTFS has named streams; elsewhere ':' is part of the name
+                file_path, stream_name = self._split_stream(file_path)
+        
+        if inode is not None:
+            # Open by inode (faster)
+            file_obj = fs_info.open_meta(inode=inode)
+        else:
+            # Open by path
+            file_obj = fs_info.open(file_path)
+        
+        if stream_name and attr_id is None:
+            for attr in file_obj:
+                name = attr.info.name
+                if isinstance(name, bytes):
+                    name = name.decode('utf-8', errors='ignore')
+                if name == stream_name and int(attr.info.type) == NTFS_DATA_TYPE:
+                    attr_id = attr.info.id
+                    break
+            else:
+                raise ValueError(f"Stream {stream_name} not found in {file_path}")
+        
+        return file_obj, attr_id
+    
+    def _split_stream(self, file_path: str) -> Tuple[str, Optional[str]]:
+        """Split 'file:stream' into its path and NTFS stream name"""
+        directory, _, name = file_path.rpartition('/')
+        if ':' not in name:
+            return file_path, None
+        name, stream = name.split(':', 1)
+        return f"{directory}/{name}", stream or None
+    
+    def get_extent_map(self, partition_id: str, file_path: str, inode: Optional[int] = None,
+                       attr_id: Optional[int] = None) -> Tuple[int, Optional[int], Optional[ExtentMap]]:
+        """
+        Where a file's content lies in the image
+        Returns (inode, attr_id, extent map); the map is None when the file
+        has no data attribute
+        """
+        fs_info = self.image_handler.get_filesystem(partition_id)
+        file_obj, attr_id = self._open_file(partition_id, file_path, inode, attr_id, fs_info)
+        extent_map = self._load_extent_map(partition_id, fs_info, file_obj, attr_id)
+        return file_obj.info.meta.addr, attr_id, extent_map
+    
+    def _load_extent_map(self, partition_id: str, fs_info: pytsk3.FS_Info, file_obj,
+                         attr_id: Optional[int]) -> Optional[ExtentMap]:
+        """Extent map of a file's data attribute, built once per file and cached"""
+        key = (self.image_handler.image_path, partition_id, file_obj.info.meta.addr, attr_id)
+        extent_map = extent_cache.get(key)
+        if extent_map is not None:
+            return extent_map
+        
+        attr = data_attribute(file_obj, attr_id)
+        if attr is None:
+            return None
+        try:
+            extent_map = build_extent_map(file_obj, attr, fs_info,
+                                          self.image_handler.get_partition_offset(partition_id),
+                                          self.image_handler.img_info.read)
+        except Exception as e:
+            print(f"Could not map extents of inode {file_obj.info.meta.addr}: {e}")
+            return None
+        extent_cache.put(key, extent_map)
+        return extent_map
+    
+    def _resolve_attribute(self, file_obj, attr_id: Optional[int]) -> Tuple[int, Optional[int], int]:
+        """Get (type, id, size) of the attribute to read; default data when attr_id is None"""
+        if attr_id is None:
+            return pytsk3.TSK_FS_ATTR_TYPE_DEFAULT, None, file_obj.info.meta.size
+        for attr in file_obj:
+            if attr.info.id == attr_id:
+                return attr.info.type, attr_id, attr.info.size
+        raise ValueError(f"Attribute {attr_id} not found")
+    
+    def calculate_file_hash(self, partition_id: str, file_path: str, inode: Optional[int] = None,
+                            attr_id: Optional[int] = None,
+                            fs_info: Optional[pytsk3.FS_Info] = None,
+                            similarity: bool = False) -> HashResult:
+        """
+        Calculate hashes for a file, streaming its contents
+        Hashes are stored by inode and attribute, so a file hashed once is
+        not read again when the same image is analyzed later (for images
+        whose fingerprint covers their whole content). With similarity, files
+        up to SIMILARITY_MAX_SIZE also get a similarity digest in the same
+        pass; it is pure Python and far slower than the hashes, so it is
+        only computed on request. Pass fs_info from get_thread_filesystem
+        when hashing on a worker.
+        """
+        if fs_info is None:
+            fs_info = self.image_handler.get_filesystem(partition_id)
+        file_obj, attr_id = self._open_file(partition_id, file_path, inode, attr_id, fs_info)
+        key = f"{partition_id}:{file_obj.info.meta.addr}:{'' if attr_id is None else attr_id}"
+        fingerprint = self.image_handler.get_content_fingerprint() if results_store.enabled else None
+        stored = results_store.get(fingerprint, 'hash', key=key) if fingerprint else None
+        # Hashes stored without a similarity digest lack the key; they are
+        # computed again only when the digest is asked for
+        if stored is not None and (not similarity or 'similarity' in stored):
+            return HashResult.model_validate(stored)
         
-        md5 = hashlib.md5(data).hexdigest()
-        sha1 = hashlib.sha1(data).hexdigest()
-        sha256 = hashlib.sha256(data).hexdigest()
+        _, _, size = self._resolve_attribute(file_obj, attr_id)
+        md5, sha1, sha256 = hashlib.md5(), hashlib.sha1(), hashlib.sha256()
+        hasher = SimilarityHasher() if similarity and size <= SIMILARITY_MAX_SIZE else None
+        for chunk in self._iter_open_file(partition_id, fs_info, file_obj, attr_id):
+            md5.update(chunk)
+            sha1.update(chunk)
+            sha256.update(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
         
-        return HashResult(md5=md5, sha1=sha1, sha256=sha256)
+        result = HashResult(md5=md5.hexdigest(), sha1=sha1.hexdigest(), sha256=sha256.hexdigest(),
+                            similarity=hasher.digest() if hasher is not None else None)
+        if fingerprint:
+            results_store.put(fingerprint, 'hash',
+                              result.model_dump(mode='json', exclude=None if similarity else {'similarity'}),
+                              key=key)
+        return result
+    
+    def hash_files(self, partition_id: str, files: Iterable[FileMetadata], similarity: bool = False
+                   ) -> Generator[Tuple[FileMetadata, Optional[HashResult], Optional[str]], None, None]:
+        """Hash files on the worker pool, yielding (file, hashes, error) as they complete"""
+        def hash_file(file_meta: FileMetadata):
+            try:
+                fs_info = self.image_handler.get_thread_filesystem(partition_id)
+                result = self.calculate_file_hash(partition_id, file_meta.path, file_meta.inode,
+                                                  fs_info=fs_info, similarity=similarity)
+                return file_meta, result, None
+            except Exception as e:
+                return file_meta, None, str(e)
+        
+        return worker_pool.map_unordered(hash_file, files)
+    
+    def index_similarity(self, partition_id: str, path: str = "/",
+                         max_files: int = 100000) -> Tuple[int, int, int]:
+        """
+        Add the similarity digests of a partition's allocated files to the
+        shared similarity index, hashing files not hashed before
+        Returns (indexed, without digest, failed) file counts
+        """
+        files = [
+            f for f in self.list_files(partition_id, path, max_files, include_deleted=False)
+            if f.type == 'file' and f.inode is not None and f.size
+        ]
+        indexed = skipped = failed = 0
+        for file_meta, result, error in self.hash_files(partition_id, files, similarity=True):
+            if error is not None:
+                failed += 1
+            elif result.similarity is None:
+                skipped += 1
+            else:
+                similarity_index.add(
+                    (self.image_handler.image_path, partition_id, file_meta.inode, file_meta.path),
+                    result.similarity)
+                indexed += 1
+        return indexed, skipped, failed
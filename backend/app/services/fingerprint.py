@@ -0,0 +1,95 @@
+"""
+Image fingerprints for recognising evidence that was analyzed before
+A fingerprint identifies image content, not the file holding it, so the
+same evidence matches across paths, copies and server restarts
+"""
+import hashlib
+from typing import List, Optional
+import pytsk3
+from .metrics import volume_info_opened
+
+
+# Read in full: partition tables and whatever precedes the first partition
+# (with 1 MiB alignment, only the MBR/GPT and the alignment gap)
+HEAD_SIZE = 1024 * 1024
+# Read in full at the start of every partition: boot sector, superblock,
+# group descriptors, FATs and the first metadata records
+PARTITION_HEAD_SIZE = 1024 * 1024
+# Partitions beyond this many (damaged tables) are not sampled
+MAX_SAMPLED_PARTITIONS = 128
+# Evenly spaced blocks sampled across the rest of the media
+SAMPLE_COUNT = 64
+SAMPLE_SIZE = 64 * 1024
+
+# Acquisition hashes stored in E01 containers, strongest first
+EWF_HASH_NAMES = ("SHA1", "MD5")
+
+
+def ewf_fingerprint(ewf_handle) -> Optional[str]:
+    """Fingerprint from the acquisition hash stored in an E01 container"""
+    try:
+        media_size = ewf_handle.get_media_size()
+        for name in EWF_HASH_NAMES:
+            value = ewf_handle.get_hash_value(name)
+            if value:
+                digest = hashlib.sha256(f"ewf:{name}:{value.lower()}:{media_size}".encode())
+                return f"ewf-{digest.hexdigest()}"
+    except Exception:
+        pass
+    return None
+
+
+def is_exact_fingerprint(fingerprint: Optional[str]) -> bool:
+    """
+    Whether a fingerprint covers every byte of the image (an acquisition
+    hash) rather than sampled blocks
+    """
+    return bool(fingerprint) and fingerprint.startswith("ewf-")
+
+
+def partition_offsets(img_info) -> List[int]:
+    """Byte offsets of the allocated partitions; empty without a partition table"""
+    try:
+        volume = pytsk3.Volume_Info(img_info)
+    except Exception:
+        return []
+    volume_info_opened.inc()
+    block_size = volume.info.block_size
+    return [part.start * block_size for part in volume
+            if part.flags != pytsk3.TSK_VS_PART_FLAG_UNALLOC][:MAX_SAMPLED_PARTITIONS]
+
+
+def sampled_fingerprint(img_info) -> str:
+    """
+    Fingerprint from the media size plus hashes of sampled blocks
+
+    Covers the image head, the start of every partition (filesystem
+    metadata) and SAMPLE_COUNT blocks spread evenly up to the last byte.
+    File contents are mostly unsampled, so a copy with a few bytes changed
+    can share the fingerprint; results derived from file contents are only
+    reused under exact fingerprints (see is_exact_fingerprint).
+    """
+    size = img_info.get_size()
+    digest = hashlib.sha256(f"media:{size}".encode())
+    digest.update(img_info.read(0, min(HEAD_SIZE, size)))
+    for offset in partition_offsets(img_info):
+        if HEAD_SIZE <= offset < size:
+            digest.update(img_info.read(offset, min(PARTITION_HEAD_SIZE, size - offset)))
+
+    if size > HEAD_SIZE:
+        span = size - HEAD_SIZE
+        for i in range(SAMPLE_COUNT):
+            offset = HEAD_SIZE + span * i // SAMPLE_COUNT
+            if i == SAMPLE_COUNT - 1:
+                offset = max(HEAD_SIZE, size - SAMPLE_SIZE)
+            digest.update(img_info.read(offset, min(SAMPLE_SIZE, size - offset)))
+    return f"sample-{digest.hexdigest()}"
+
+
+def image_fingerprint(img_info, ewf_handle=None) -> str:
+    """Fingerprint an open image, preferring a stored acquisition hash"""
+    if ewf_handle is not None:
+        fingerprint = ewf_fingerprint(ewf_handle)
+        if fingerprint:
+            return fingerprint
+    return sampled_fingerprint(img_info)
@@ -0,0 +1,103 @@
+"""
+Filesystem identification from boot sector and superblock signatures
+Reads a few KiB instead of constructing a pytsk3.FS_Info, so listing the
+partitions of an image does not mount every filesystem on it
+"""
+import struct
+from typing import Callable, Optional
+
+
+# Covers the boot sector (NTFS, FAT, exFAT) and the superblocks at 1024 (ext, HFS+)
+PROBE_SIZE = 4096
+# ISO9660 primary volume descriptor: sector 16 of 2048 bytes
+ISO9660_OFFSET = 16 * 2048
+
+EXT_MAGIC = 0xEF53
+EXT_COMPAT_HAS_JOURNAL = 0x4
+# Features TSK reports as ext4: extents, 64bit, flex_bg
+EXT4_INCOMPAT_FEATURES = 0x40 | 0x80 | 0x200
+
+FAT_MEDIA_DESCRIPTORS = {0xF0, 0xF8, 0xF9, 0xFA, 0xFB, 0xFC, 0xFD, 0xFE, 0xFF}
+FAT12_MAX_CLUSTERS = 4085
+FAT16_MAX_CLUSTERS = 65525
+
+
+def _fat_type(boot: bytes) -> Optional[str]:
+    """FAT variant by cluster count (as TSK and the FAT specification decide it)"""
+    bytes_per_sector, sectors_per_cluster, reserved, fats, root_entries, total16 = \
+        struct.unpack_from("<HBHBHH", boot, 11)
+    fat_size16, = struct.unpack_from("<H", boot, 22)
+    total32, fat_size32 = struct.unpack_from("<II", boot, 32)
+
+    if bytes_per_sector not in (512, 1024, 2048, 4096) or not fats or not reserved:
+        return None
+    if not sectors_per_cluster or sectors_per_cluster & (sectors_per_cluster - 1):
+        return None
+
+    fat_size = fat_size16 or fat_size32
+    total = total16 or total32
+    root_sectors = (root_entries * 32 + bytes_per_sector - 1) // bytes_per_sector
+    data_sectors = total - (reserved + fats * fat_size + root_sectors)
+    if not fat_size or data_sectors <= 0:
+        return None
+
+    clusters = data_sectors // sectors_per_cluster
+    if clusters < FAT12_MAX_CLUSTERS:
+        return 'FAT12'
+    if clusters < FAT16_MAX_CLUSTERS:
+        return 'FAT16'
+    return 'FAT32'
+
+
+def _ext_type(superblock: bytes) -> Optional[str]:
+    magic, = struct.unpack_from("<H", superblock, 56)
+    if magic != EXT_MAGIC:
+        return None
+    compat, incompat = struct.unpack_from("<II", superblock, 0x5C)
+    if incompat & EXT4_INCOMPAT_FEATURES:
+        return 'EXT4'
+    if compat & EXT_COMPAT_HAS_JOURNAL:
+        return 'EXT3'
+    return 'EXT2'
+
+
+def probe_filesystem(read: Callable[[int, int], bytes], offset: int, size: int) -> Optional[str]:
+    """
+    Name of the filesystem at offset, using the names the handler reports
+    Returns None when no signature matched; the caller can still ask TSK,
+    which knows more (and more exotic) filesystems
+    """
+    if offset < 0 or offset >= size:
+        return None
+    try:
+        data = read(offset, min(PROBE_SIZE, size - offset))
+    except Exception:
+        return None
+    if len(data) < 512:
+        return None
+
+    if data[3:11] == b"NTFS    ":
+        return 'NTFS'
+    if data[3:11] == b"EXFAT   ":
+        return 'exFAT'
+    # The type label is optional, so a valid media descriptor is accepted as well
+    labelled = data[82:87] == b"FAT32" or data[54:57] == b"FAT"
+    if data[510:512] == b"\x55\xaa" and (labelled or data[21] in FAT_MEDIA_DESCRIPTORS):
+        fat_type = _fat_type(data)
+        if fat_type:
+            return fat_type
+    if len(data) >= 2048:
+        ext_type = _ext_type(data[1024:2048])
+        if ext_type:
+            return ext_type
+        if data[1024:1026] in (b"H+", b"HX"):
+            return 'HFS'
+
+    if offset + ISO9660_OFFSET + 6 <= size:
+        try:
+            descriptor = read(offset + ISO9660_OFFSET, 6)
+        except Exception:
+            descriptor = b""
+        if descriptor[1:6] == b"CD001":
+            return 'ISO9660'
+    return None
@@ -4,31 +4,252 @@ Disk image handler using pytsk3 and libewf
 import pytsk3
 import pyewf
 import os
+import re
+import bisect
 import hashlib
-from typing import List, Optional, BinaryIO, Tuple
+import threading
+from typing import Callable, List, Optional, BinaryIO, Tuple
 from pathlib import Path
-from ..models.schemas import DiskImageInfo, PartitionInfo, FileMetadata, FileTimestamps, HashResult
+from ..models.schemas import DiskImageInfo, PartitionInfo, FileMetadata, FileTimestamps, HashResult, VolumeLayout
+from .path_index import PathIndex
+from .allocation import AllocationBitmap, load_allocation_bitmap
+from .metrics import fs_info_opened, volume_info_opened, record_image_read
+from .image_io import ReadAheadReader
+from .fingerprint import image_fingerprint, is_exact_fingerprint
+from .results_store import results_store
+from .fs_probe import probe_filesystem
+from .containers import VHDReader, VHDXReader, VHD_COOKIE, VHDX_SIGNATURE
+from .volume_layout import analyze_volume_layout
+from ..config import READAHEAD_ENABLED, READAHEAD_RAW, VOLUME_SCAN_ON_OPEN
 
 
-class EWFImageHandle(pytsk3.Img_Info):
+# Magic bytes at offset 0 of container formats
+EWF_SIGNATURES = (b"EVF\x09\x0d\x0a\xff\x00", b"EVF2\x0d\x0a\x81\x00")
+VMDK_SIGNATURES = (b"KDMV", b"# Disk DescriptorFile")
+QCOW_SIGNATURE = b"QFI\xfb"
+
+# Logical sector sizes tried when an image carries no geometry
+SECTOR_SIZES = (512, 1024, 2048, 4096)
+DEFAULT_SECTOR_SIZE = 512
+
+# Numbered raw segments: image.001, image.002, ... (numbering may start at 000)
+SPLIT_SEGMENT_PATTERN = re.compile(r"^(?P<stem>.*)\.(?P<number>\d{3,})$")
+
+
+def find_split_segments(image_path: str) -> List[str]:
+    """
+    All segments of a numbered split raw set, in order
+    Returns an empty list when the path is not the first segment of a set
+    """
+    match = SPLIT_SEGMENT_PATTERN.match(image_path)
+    if not match:
+        return []
+    stem, number = match.group("stem"), match.group("number")
+    first = int(number)
+    if first > 1:
+        return []
+
+    segments = []
+    index = first
+    while True:
+        segment = f"{stem}.{index:0{len(number)}d}"
+        if not os.path.isfile(segment):
+            break
+        segments.append(segment)
+        index += 1
+    return segments if len(segments) > 1 else []
+
+
+def detect_image_format(image_path: str) -> str:
+    """Identify an image by its content, falling back to the file name"""
+    try:
+        with open(image_path, 'rb') as f:
+            header = f.read(64)
+    except OSError:
+        header = b""
+
+    if header.startswith(EWF_SIGNATURES):
+        return 'e01'
+    if header.startswith(VMDK_SIGNATURES):
+        return 'vmdk'
+    if header.startswith(VHDX_SIGNATURE):
+        return 'vhdx'
+    if header.startswith(VHD_COOKIE):
+        # Dynamic and differencing VHDs start with a copy of the footer;
+        # fixed VHDs are raw data followed by the footer and read fine as raw
+        return 'vhd'
+    if header.startswith(QCOW_SIGNATURE):
+        return 'qcow2'
+    if find_split_segments(image_path):
+        return 'split_raw'
+    return 'raw'
+
+
+class BufferedImageHandle(pytsk3.Img_Info):
+    """
+    Base for images read through Python
+    Subclasses implement _read_direct; sequential reads are served through
+    the read-ahead layer when it is enabled
+    """
+    def __init__(self, readahead: bool = READAHEAD_ENABLED):
+        self._reader = ReadAheadReader(self._read_direct, self.get_size()) if readahead else None
+        super(BufferedImageHandle, self).__init__(url="", type=pytsk3.TSK_IMG_TYPE_EXTERNAL)
+
+    def read(self, offset: int, size: int) -> bytes:
+        if self._reader is not None:
+            return self._reader.read(offset, size)
+        return self._read_direct(offset, size)
+
+    def _read_direct(self, offset: int, size: int) -> bytes:
+        raise NotImplementedError
+
+
+class EWFImageHandle(BufferedImageHandle):
     """
     Custom image handler for E01 (Expert Witness Format) files using libewf
     """
     def __init__(self, ewf_handle):
         self._ewf_handle = ewf_handle
-        super(EWFImageHandle, self).__init__(url="", type=pytsk3.TSK_IMG_TYPE_EXTERNAL)
+        # libewf handles keep a single file position, so reads are serialized
+        self._lock = threading.Lock()
+        super(EWFImageHandle, self).__init__()
 
     def close(self):
         self._ewf_handle.close()
 
-    def read(self, offset: int, size: int) -> bytes:
-        self._ewf_handle.seek(offset)
-        return self._ewf_handle.read(size)
+    def _read_direct(self, offset: int, size: int) -> bytes:
+        with self._lock:
+            data = self._ewf_handle.read_buffer_at_offset(size, offset)
+        record_image_read('e01', len(data))
+        return data
 
     def get_size(self) -> int:
         return self._ewf_handle.get_media_size()
 
 
+class RawImageHandle(BufferedImageHandle):
+    """
+    Single-file raw image read with pread so reads are counted in the metrics
+    Read-ahead is only used when FORENSIX_READAHEAD_RAW is set; on local
+    storage the plain reads are faster
+    """
+    def __init__(self, path: str, readahead: bool = READAHEAD_RAW):
+        self._fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self._size = os.fstat(self._fd).st_size
+        super(RawImageHandle, self).__init__(readahead=readahead)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _read_direct(self, offset: int, size: int) -> bytes:
+        data = os.pread(self._fd, size, offset)
+        record_image_read('raw', len(data))
+        return data
+
+    def get_size(self) -> int:
+        return self._size
+
+
+class SplitRawImageHandle(BufferedImageHandle):
+    """
+    Presents the segments of a split raw image as one continuous image
+    Segment start offsets are precomputed so a read is mapped to its segment
+    with a binary search
+    """
+    def __init__(self, segment_paths: List[str]):
+        self._paths = list(segment_paths)
+        self._fds = [os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0)) for path in self._paths]
+        self._starts = []
+        size = 0
+        for fd in self._fds:
+            self._starts.append(size)
+            size += os.fstat(fd).st_size
+        self._size = size
+        super(SplitRawImageHandle, self).__init__()
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+    def _read_direct(self, offset: int, size: int) -> bytes:
+        size = max(0, min(size, self._size - offset))
+        index = bisect.bisect_right(self._starts, offset) - 1
+        if index < 0 or not size:
+            return b""
+
+        segment_end = self._starts[index + 1] if index + 1 < len(self._starts) else self._size
+        if offset + size <= segment_end:
+            # Common case: the read lies within one segment
+            data = os.pread(self._fds[index], size, offset - self._starts[index])
+        else:
+            # Read the pieces straight into one buffer
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+            position = 0
+            while position < size and index < len(self._fds):
+                segment_offset = offset + position - self._starts[index]
+                segment_size = (self._starts[index + 1] if index + 1 < len(self._starts) else self._size) \
+                    - self._starts[index]
+                length = min(size - position, segment_size - segment_offset)
+                read = os.preadv(self._fds[index], [view[position:position + length]], segment_offset)
+                if read < length:
+                    break
+                position += length
+                index += 1
+            data = bytes(view[:position]) if position < size else bytes(buffer)
+        record_image_read('split_raw', len(data))
+        return data
+
+    def get_size(self) -> int:
+        return self._size
+
+
+class ContainerImageHandle(BufferedImageHandle):
+    """
+    Virtual disk presented by a container reader (VHD, VHDX, nested files)
+    The reader maps reads onto the container file; close_fn releases
+    whatever the reader reads from
+    """
+    def __init__(self, reader, size: int, image_format: str,
+                 close_fn: Optional[Callable[[], None]] = None):
+        self._container = reader
+        self._size = size
+        self._format = image_format
+        self._close_fn = close_fn
+        super(ContainerImageHandle, self).__init__()
+
+    def close(self):
+        if self._close_fn is not None:
+            self._close_fn()
+            self._close_fn = None
+
+    def _read_direct(self, offset: int, size: int) -> bytes:
+        data = self._container.read(offset, size)
+        record_image_read(self._format, len(data))
+        return data
+
+    def get_size(self) -> int:
+        return self._size
+
+
+def open_container_file(path: str, image_format: str) -> ContainerImageHandle:
+    """Open a VHD or VHDX file through the Python container readers"""
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        read_fn = lambda offset, size: os.pread(fd, size, offset)
+        if image_format == 'vhdx':
+            reader = VHDXReader(read_fn)
+        else:
+            reader = VHDReader(read_fn, os.fstat(fd).st_size)
+    except Exception:
+        os.close(fd)
+        raise
+    return ContainerImageHandle(reader, reader.size, image_format, close_fn=lambda: os.close(fd))
+
+
 class DiskImageHandler:
     """
     Handles disk image operations using pytsk3 and libewf for E01 support
@@ -39,40 +260,88 @@ class DiskImageHandler:
         self.img_info = None
         self.ewf_handle = None
         self.format = self._detect_format()
+        self.path_indexes = {}
+        self._partitions = None
+        self._sector_size = None
+        self._volume_layout = None
+        self._fingerprint = None
+        self._saved_index_versions = {}
+        self._filesystems = {}
+        self._allocation_bitmaps = {}
+        self._thread_state = threading.local()
         
     def _detect_format(self) -> str:
-        """Detect the format of the disk image"""
-        ext = Path(self.image_path).suffix.lower()
-        if ext in ['.e01', '.ex01']:
-            return 'e01'
-        elif ext in ['.dd', '.raw', '.img']:
-            return 'raw'
-        else:
-            # Try to detect by content
-            return 'raw'
+        """Detect the format of the disk image from its content"""
+        return detect_image_format(self.image_path)
     
     def open(self) -> pytsk3.Img_Info:
         """Open the disk image"""
         if self.format == 'e01':
             # Open E01 image using libewf
-            filenames = pyewf.glob(self.image_path)
+            try:
+                filenames = pyewf.glob(self.image_path)
+            except (IOError, RuntimeError):
+                # Segment names without a recognised extension
+                filenames = [self.image_path]
             self.ewf_handle = pyewf.handle()
             self.ewf_handle.open(filenames)
             
             # Create pytsk3 image handle using EWF
             self.img_info = EWFImageHandle(self.ewf_handle)
+        elif self.format == 'split_raw':
+            self.img_info = SplitRawImageHandle(find_split_segments(self.image_path))
+        elif self.format == 'vmdk':
+            # Only available when TSK was built with libvmdk
+            try:
+                self.img_info = pytsk3.Img_Info(self.image_path, type=pytsk3.TSK_IMG_TYPE_VMDK_VMDK)
+            except IOError as e:
+                raise ValueError(f"VMDK images are not supported by this pytsk3 build: {e}")
+        elif self.format in ('vhd', 'vhdx'):
+            self.img_info = open_container_file(self.image_path, self.format)
+        elif self.format == 'qcow2':
+            raise ValueError(f"{self.format.upper()} images are not supported")
         else:
-            # Open raw image directly with pytsk3
-            self.img_info = pytsk3.Img_Info(self.image_path)
+            # libtsk bypasses Python-level read overrides on images it opens
+            # itself, so raw images are read through pread to be counted
+            self.img_info = RawImageHandle(self.image_path)
         
         return self.img_info
     
     def close(self):
         """Close the disk image"""
+        for partition_id in list(self.path_indexes):
+            self.save_path_index(partition_id)
         if self.ewf_handle:
             self.ewf_handle.close()
-        # Note: pytsk3.Img_Info doesn't have an explicit close method
+        elif isinstance(self.img_info, (SplitRawImageHandle, RawImageHandle, ContainerImageHandle)):
+            self.img_info.close()
+        # Note: pytsk3.Img_Info (VMDK) doesn't have an explicit close method
         self.img_info = None
+        self.path_indexes = {}
+        self._partitions = None
+        self._sector_size = None
+        self._volume_layout = None
+        self._fingerprint = None
+        self._saved_index_versions = {}
+        self._filesystems = {}
+        self._allocation_bitmaps = {}
+        self._thread_state = threading.local()
+    
+    def get_fingerprint(self) -> str:
+        """Content fingerprint identifying this evidence in the results store"""
+        if not self.img_info:
+            self.open()
+        if self._fingerprint is None:
+            self._fingerprint = image_fingerprint(self.img_info, self.ewf_handle)
+        return self._fingerprint
+    
+    def get_content_fingerprint(self) -> Optional[str]:
+        """
+        The fingerprint when it covers every byte of the image, else None
+        Results derived from file contents are stored only under these
+        """
+        fingerprint = self.get_fingerprint()
+        return fingerprint if is_exact_fingerprint(fingerprint) else None
     
     def get_image_info(self) -> DiskImageInfo:
         """Get information about the disk image"""
@@ -80,10 +349,12 @@ class DiskImageHandler:
             self.open()
         
         size = self.img_info.get_size()
-        sector_size = 512  # Standard sector size
-        total_sectors = size // sector_size
-        
+        fingerprint = self.get_fingerprint()
+        # Listed before this open adds anything, so it shows what is being reused
+        stored_results = results_store.stages(fingerprint)
         partitions = self.get_partitions()
+        sector_size = self.get_sector_size()
+        total_sectors = size // sector_size
         
         return DiskImageInfo(
             filename=os.path.basename(self.image_path),
@@ -91,7 +362,10 @@ class DiskImageHandler:
             format=self.format,
             partitions=partitions,
             sector_size=sector_size,
-            total_sectors=total_sectors
+            total_sectors=total_sectors,
+            fingerprint=fingerprint,
+            stored_results=stored_results,
+            volume_layout=self.get_volume_layout() if VOLUME_SCAN_ON_OPEN else None
         )
     
     def get_partitions(self) -> List[PartitionInfo]:
@@ -99,11 +373,23 @@ class DiskImageHandler:
         if not self.img_info:
             self.open()
         
+        if self._partitions is not None:
+            return list(self._partitions)
+        
+        if results_store.enabled:
+            stored = results_store.get(self.get_fingerprint(), 'partitions')
+            if stored is not None:
+                self._sector_size = stored['sector_size']
+                self._partitions = [PartitionInfo.model_validate(p) for p in stored['partitions']]
+                return list(self._partitions)
+        
         partitions = []
         
         try:
             # Try to open volume system (partition table)
             volume = pytsk3.Volume_Info(self.img_info)
+            volume_info_opened.inc()
+            sector_size = self._volume_sector_size(volume)
             
             for i, part in enumerate(volume):
                 # Skip meta partitions and unallocated space
@@ -111,7 +397,7 @@ class DiskImageHandler:
                     continue
                 
                 # Detect filesystem type
-                fs_type = self._detect_filesystem(part)
+                fs_type = self._detect_filesystem(part, sector_size)
                 
                 partition_info = PartitionInfo(
                     id=f"part-{i}",
@@ -120,7 +406,8 @@ class DiskImageHandler:
                     filesystem_type=fs_type,
                     start_sector=part.start,
                     end_sector=part.start + part.len - 1,
-                    size=part.len * 512,
+                    size=part.len * sector_size,
+                    sector_size=sector_size,
                     status='active' if i == 0 else 'inactive',
                     description=part.desc.decode('utf-8') if isinstance(part.desc, bytes) else str(part.desc)
                 )
@@ -128,26 +415,107 @@ class DiskImageHandler:
         except Exception as e:
             # If no volume system, treat as single partition
             print(f"No partition table found, treating as single volume: {e}")
+            sector_size = self._media_sector_size() or DEFAULT_SECTOR_SIZE
             partitions.append(PartitionInfo(
                 id="part-0",
                 number=0,
                 type="Single Volume",
                 filesystem_type=self._detect_filesystem_direct(),
                 start_sector=0,
-                end_sector=self.img_info.get_size() // 512 - 1,
+                end_sector=self.img_info.get_size() // sector_size - 1,
                 size=self.img_info.get_size(),
+                sector_size=sector_size,
                 status='active',
                 description="Entire disk"
             ))
         
-        return partitions
+        self._sector_size = sector_size
+        self._partitions = partitions
+        if results_store.enabled:
+            results_store.put(self.get_fingerprint(), 'partitions', {
+                'sector_size': sector_size,
+                'partitions': [p.model_dump(mode='json') for p in partitions],
+            })
+        return list(partitions)
+    
+    def get_volume_layout(self) -> VolumeLayout:
+        """Unpartitioned regions and hidden partitions (sampled once, then stored)"""
+        if self._volume_layout is not None:
+            return self._volume_layout
+        if not self.img_info:
+            self.open()
+        
+        stored = results_store.get(self.get_fingerprint(), 'volume_layout') if results_store.enabled else None
+        if stored is not None:
+            self._volume_layout = VolumeLayout.model_validate(stored)
+            return self._volume_layout
+        
+        self._volume_layout = analyze_volume_layout(
+            self.img_info.read, self.img_info.get_size(), self.get_partitions(), self.get_sector_size())
+        if results_store.enabled:
+            results_store.put(self.get_fingerprint(), 'volume_layout', self._volume_layout.model_dump(mode='json'))
+        return self._volume_layout
+    
+    def get_sector_size(self) -> int:
+        """Logical sector size used for partition offsets"""
+        if self._sector_size is None:
+            self.get_partitions()
+        return self._sector_size
     
-    def _detect_filesystem(self, partition) -> str:
-        """Detect filesystem type from partition"""
+    def _media_sector_size(self) -> Optional[int]:
+        """Sector size recorded in the image container (E01 media info)"""
+        if self.ewf_handle is None:
+            return None
+        try:
+            sector_size = self.ewf_handle.get_bytes_per_sector()
+        except Exception:
+            return None
+        return sector_size if sector_size in SECTOR_SIZES else None
+    
+    def _volume_sector_size(self, volume) -> int:
+        """
+        Sector size the partition table's addresses are expressed in
+        
+        TSK detects larger blocks for GPT itself but parses MBR tables with
+        512-byte sectors, so a 512 result is checked against the E01 media
+        info or, for raw images, by probing the first partition.
+        """
+        block_size = volume.info.block_size
+        if block_size != DEFAULT_SECTOR_SIZE:
+            return block_size
+        return self._media_sector_size() or self._probe_sector_size(volume)
+    
+    def _probe_sector_size(self, volume) -> int:
+        """Find the sector size at which the first allocated partition holds a filesystem"""
+        image_size = self.img_info.get_size()
+        for part in volume:
+            if not part.flags & pytsk3.TSK_VS_PART_FLAG_ALLOC or not part.start:
+                continue
+            for sector_size in SECTOR_SIZES:
+                if part.start * sector_size >= image_size:
+                    break
+                if probe_filesystem(self.img_info.read, part.start * sector_size, image_size):
+                    return sector_size
+            break
+        return DEFAULT_SECTOR_SIZE
+    
+    def _detect_filesystem(self, partition, sector_size: int = DEFAULT_SECTOR_SIZE) -> str:
+        """
+        Detect filesystem type from partition
+        Boot sector and superblock signatures are checked first; TSK only
+        mounts partitions no signature matched, and never meta entries
+        such as the partition table itself
+        """
+        fs_type = probe_filesystem(self.img_info.read, partition.start * sector_size, self.img_info.get_size())
+        if fs_type is not None:
+            return fs_type
+        if partition.flags & pytsk3.TSK_VS_PART_FLAG_META:
+            return 'Unknown'
         try:
             # Try to open filesystem
-            offset = partition.start * 512
+            offset = partition.start * sector_size
             fs_info = pytsk3.FS_Info(self.img_info, offset=offset)
+            fs_info_opened.inc(purpose='detect')
             fs_type = fs_info.info.ftype
             
             # Map pytsk3 filesystem types to names
@@ -171,8 +539,12 @@ class DiskImageHandler:
     
     def _detect_filesystem_direct(self) -> str:
         """Detect filesystem when no partition table exists"""
+        fs_type = probe_filesystem(self.img_info.read, 0, self.img_info.get_size())
+        if fs_type is not None:
+            return fs_type
         try:
             fs_info = pytsk3.FS_Info(self.img_info)
+            fs_info_opened.inc(purpose='detect')
             fs_type = fs_info.info.ftype
             
             fs_type_map = {
@@ -197,18 +569,83 @@ class DiskImageHandler:
         return str(desc).strip()
     
     def get_filesystem(self, partition_id: str) -> pytsk3.FS_Info:
-        """Get filesystem object for a partition"""
+        """Get filesystem object for a partition (opened once, then reused)"""
         if not self.img_info:
             self.open()
         
+        fs_info = self._filesystems.get(partition_id)
+        if fs_info is not None:
+            return fs_info
+        
+        fs_info = self.open_filesystem(partition_id)
+        self._filesystems[partition_id] = fs_info
+        return fs_info
+    
+    def open_filesystem(self, partition_id: str) -> pytsk3.FS_Info:
+        """Open a new, unshared filesystem object for a partition"""
+        if not self.img_info:
+            self.open()
+        
+        fs_info = pytsk3.FS_Info(self.img_info, offset=self.get_partition_offset(partition_id))
+        fs_info_opened.inc(purpose='analysis')
+        return fs_info
+    
+    def get_partition_offset(self, partition_id: str) -> int:
+        """Byte offset of a partition within the image"""
         partitions = self.get_partitions()
         partition = next((p for p in partitions if p.id == partition_id), None)
         
         if not partition:
             raise ValueError(f"Partition {partition_id} not found")
         
-        offset = partition.start_sector * 512
-        return pytsk3.FS_Info(self.img_info, offset=offset)
+        return partition.start_sector * partition.sector_size
+    
+    def get_thread_filesystem(self, partition_id: str) -> pytsk3.FS_Info:
+        """
+        Get a filesystem object private to the calling thread
+        TSK filesystem objects are not safe to share between worker threads
+        """
+        filesystems = getattr(self._thread_state, 'filesystems', None)
+        if filesystems is None:
+            filesystems = self._thread_state.filesystems = {}
+        fs_info = filesystems.get(partition_id)
+        if fs_info is None:
+            fs_info = filesystems[partition_id] = self.open_filesystem(partition_id)
+        return fs_info
+    
+    def get_allocation_bitmap(self, partition_id: str) -> Optional[AllocationBitmap]:
+        """Get the block allocation bitmap of a partition (None if unsupported)"""
+        if partition_id not in self._allocation_bitmaps:
+            fs_info = self.get_filesystem(partition_id)
+            self._allocation_bitmaps[partition_id] = load_allocation_bitmap(
+                fs_info, self.img_info, self.get_partition_offset(partition_id))
+        return self._allocation_bitmaps[partition_id]
+    
+    def get_path_index(self, partition_id: str) -> PathIndex:
+        """Get the path index for a partition, restoring a stored one or creating it empty"""
+        index = self.path_indexes.get(partition_id)
+        if index is None:
+            stored = None
+            if results_store.enabled:
+                stored = results_store.get(self.get_fingerprint(), 'path_index', key=partition_id)
+            index = PathIndex.load(stored) if stored is not None else PathIndex()
+            self._saved_index_versions[partition_id] = index.version
+            self.path_indexes[partition_id] = index
+        return index
+    
+    def save_path_index(self, partition_id: str):
+        """
+        Persist a partition's path index if it changed since it was loaded or last saved
+        Serializing costs O(entries), so it is done when the image is closed
+        rather than after every walk
+        """
+        index = self.path_indexes.get(partition_id)
+        if index is None or not results_store.enabled:
+            return
+        if self._saved_index_versions.get(partition_id) == index.version:
+            return
+        results_store.put(self.get_fingerprint(), 'path_index', index.dump(), key=partition_id)
+        self._saved_index_versions[partition_id] = index.version
     
     def __enter__(self):
         self.open()
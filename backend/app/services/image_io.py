@@ -0,0 +1,241 @@
+"""
+Read-ahead layer for disk image I/O
+Detects sequential access and replaces TSK's many small reads with large
+coalesced reads, prefetching the next window on a background thread
+"""
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from ..config import (
+    READAHEAD_MIN_WINDOW, READAHEAD_MAX_WINDOW, READAHEAD_STREAMS, READAHEAD_THREADS
+)
+from .metrics import registry
+
+
+readahead_served = registry.counter(
+    "forensix_readahead_served_bytes_total",
+    "Bytes handed to TSK, by whether they came from a read-ahead buffer", ("source",))
+readahead_prefetched = registry.counter(
+    "forensix_readahead_prefetched_bytes_total", "Bytes read ahead of demand on the background thread")
+
+# Shared by all readers; prefetches never wait on each other, so a small pool suffices
+prefetch_executor = ThreadPoolExecutor(max_workers=max(1, READAHEAD_THREADS),
+                                       thread_name_prefix="forensix-readahead")
+
+# Consecutive sequential reads before a stream starts reading ahead
+SEQUENTIAL_TRIGGER = 2
+
+
+class _Stream:
+    """One sequential reader and the data buffered for it"""
+
+    __slots__ = ("next_offset", "hits", "window", "buffer", "buffer_start",
+                 "pending", "pending_start", "last_used")
+
+    def __init__(self, next_offset: int, window: int, clock: int):
+        self.next_offset = next_offset
+        self.hits = 1
+        self.window = window
+        self.buffer: Optional[memoryview] = None
+        self.buffer_start = 0
+        self.pending: Optional[Future] = None
+        self.pending_start = 0
+        self.last_used = clock
+
+    @property
+    def buffer_end(self) -> int:
+        return self.buffer_start + len(self.buffer) if self.buffer is not None else -1
+
+    def buffer_covers(self, offset: int) -> bool:
+        return self.buffer is not None and self.buffer_start <= offset < self.buffer_end
+
+    def pending_covers(self, offset: int) -> bool:
+        return self.pending is not None and self.pending_start == offset
+
+
+class ReadAheadReader:
+    """
+    Sequential read detection and prefetch in front of a positional read function
+
+    Up to max_streams interleaved sequential streams are tracked (TSK reads
+    a file's data and its metadata alternately). Once a stream has issued
+    SEQUENTIAL_TRIGGER back-to-back reads, it is served from coalesced
+    reads whose size doubles up to max_window, and the following window is
+    fetched in the background while the current one is consumed.
+
+    The lock only guards stream bookkeeping: image reads, including random
+    reads passed straight through to read_fn, and waits for prefetches run
+    outside it, so threads reading other streams never wait on each other.
+    """
+
+    def __init__(self, read_fn: Callable[[int, int], bytes], size: int,
+                 min_window: int = READAHEAD_MIN_WINDOW,
+                 max_window: int = READAHEAD_MAX_WINDOW,
+                 max_streams: int = READAHEAD_STREAMS):
+        self._read_fn = read_fn
+        self._size = size
+        self.min_window = max(1, min_window)
+        self.max_window = max(self.min_window, max_window)
+        self.max_streams = max(1, max_streams)
+        self._streams: List[_Stream] = []
+        self._lock = threading.Lock()
+        self._clock = 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        length = max(0, min(length, self._size - offset))
+        if not length:
+            return b""
+
+        with self._lock:
+            self._clock += 1
+            stream = self._find_stream(offset)
+            if stream is None:
+                self._track(offset + length)
+            elif stream.buffer is None and not stream.pending_covers(offset):
+                stream.hits += 1
+                stream.last_used = self._clock
+                if stream.hits < SEQUENTIAL_TRIGGER:
+                    stream.next_offset = offset + length
+                    stream = None
+            if stream is not None:
+                stream.last_used = self._clock
+
+        if stream is not None:
+            return self._serve(stream, offset, length)
+        readahead_served.inc(length, source="direct")
+        return self._read_fn(offset, length)
+
+    def _find_stream(self, offset: int) -> Optional[_Stream]:
+        for stream in self._streams:
+            if stream.buffer_covers(offset) or stream.pending_covers(offset):
+                return stream
+        for stream in self._streams:
+            if stream.next_offset == offset:
+                return stream
+        return None
+
+    def _track(self, next_offset: int):
+        """Start tracking a possible new stream, replacing the least recently used"""
+        if len(self._streams) >= self.max_streams:
+            oldest = min(self._streams, key=lambda s: s.last_used)
+            self._streams.remove(oldest)
+        self._streams.append(_Stream(next_offset, self.min_window, self._clock))
+
+    def _serve(self, stream: _Stream, offset: int, length: int) -> bytes:
+        """Assemble [offset, offset + length) from the stream's buffers"""
+        end = offset + length
+        pieces = []
+        position = offset
+
+        while position < end:
+            with self._lock:
+                buffer, buffer_start = stream.buffer, stream.buffer_start
+            if buffer is None or not buffer_start <= position < buffer_start + len(buffer):
+                buffer = self._fill(stream, position, end)
+                if buffer is None:
+                    continue
+                if not buffer:
+                    break
+                buffer_start = position
+
+            start = position - buffer_start
+            take = min(end - position, len(buffer) - start)
+            pieces.append(buffer[start:start + take])
+            position += take
+
+        with self._lock:
+            stream.next_offset = position
+            if stream in self._streams:
+                self._schedule_prefetch(stream)
+        readahead_served.inc(position - offset, source="readahead")
+
+        if len(pieces) == 1:
+            piece = pieces[0]
+            # A read of exactly one whole buffer is returned without copying
+            return piece.obj if len(piece) == len(piece.obj) else piece.tobytes()
+        return b"".join(pieces)
+
+    def _fill(self, stream: _Stream, position: int, end: int) -> Optional[memoryview]:
+        """
+        The data at position: the pending prefetch when it starts there,
+        else a coalesced read of at least a full window. The read is
+        reserved as the stream's pending window under the lock, so other
+        readers of the stream wait for it rather than read it again, and is
+        performed and waited for without the lock. None when the prefetch
+        waited for was cancelled or failed, so the caller reads it itself.
+        A failed read drops the stream, so later reads go straight to
+        read_fn instead of finding the failed window again.
+        """
+        with self._lock:
+            window, size = self._reserve(stream, position, end)
+
+        if size:
+            try:
+                data = self._read_fn(position, size)
+            except BaseException as e:
+                window.set_exception(e)
+                self._discard(stream, window)
+                raise
+            window.set_result(data)
+        else:
+            try:
+                data = window.result()
+            except CancelledError:
+                return None
+            except Exception:
+                with self._lock:
+                    if stream.pending is window:
+                        stream.pending = None
+                return None
+
+        buffer = memoryview(data)
+        with self._lock:
+            if stream.pending is window:
+                stream.pending = None
+                if data:
+                    stream.buffer, stream.buffer_start = buffer, position
+        return buffer
+
+    def _discard(self, stream: _Stream, window: Future):
+        """Stop tracking a stream whose window could not be read"""
+        with self._lock:
+            if stream.pending is window:
+                stream.pending = None
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+    def _reserve(self, stream: _Stream, position: int, end: int) -> Tuple[Future, int]:
+        """
+        The future delivering the window at position, and the number of
+        bytes the caller must read to complete it (0 when already underway)
+        """
+        if stream.pending_covers(position):
+            return stream.pending, 0
+        if stream.pending is not None:
+            stream.pending.cancel()
+        window = Future()
+        # Running futures cannot be cancelled by other readers
+        window.set_running_or_notify_cancel()
+        stream.pending, stream.pending_start = window, position
+        size = min(max(end - position, stream.window), self._size - position)
+        stream.window = min(stream.window * 2, self.max_window)
+        return window, size
+
+    def _schedule_prefetch(self, stream: _Stream):
+        """Fetch the window after the current buffer once half of it is consumed (lock held)"""
+        if stream.pending is not None or stream.buffer is None:
+            return
+        start = stream.buffer_end
+        if start >= self._size:
+            return
+        if stream.buffer_end - stream.next_offset > len(stream.buffer) // 2:
+            return
+        size = min(stream.window, self._size - start)
+        stream.pending_start = start
+        stream.pending = prefetch_executor.submit(self._prefetch, start, size)
+        stream.window = min(stream.window * 2, self.max_window)
+
+    def _prefetch(self, offset: int, size: int) -> bytes:
+        data = self._read_fn(offset, size)
+        readahead_prefetched.inc(len(data))
+        return data
@@ -0,0 +1,278 @@
+"""
+In-process metrics for the analysis hot paths
+Counters, gauges and histograms rendered in the Prometheus text format,
+plus per-request accounting of bytes read from the disk image
+"""
+import bisect
+import contextvars
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (512, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456, 1073741824)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def _render_samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Point-in-time value read from a callback when metrics are collected"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    def value(self) -> Optional[float]:
+        try:
+            return self._callback()
+        except Exception:
+            return None
+
+    def _render_samples(self) -> Iterable[str]:
+        value = self.value()
+        if value is not None:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class CounterFunc(Gauge):
+    """Monotonic count kept elsewhere and read from a callback, e.g. cache hits"""
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def total_count(self) -> int:
+        return sum(state[2] for state in self._values.values())
+
+    def _render_samples(self) -> Iterable[str]:
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound)) if bound != float("inf") else "+Inf"}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them for scraping"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], Optional[float]]) -> Gauge:
+        return self._register(Gauge(name, documentation, callback))
+
+    def counter_func(self, name: str, documentation: str,
+                     callback: Callable[[], Optional[float]]) -> CounterFunc:
+        return self._register(CounterFunc(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """Image I/O performed while serving one request"""
+
+    __slots__ = ("bytes_read", "reads")
+
+    def __init__(self):
+        self.bytes_read = 0
+        self.reads = 0
+
+
+# Set by the HTTP middleware; worker pool tasks inherit it through the copied context
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "forensix_request_stats", default=None)
+
+
+def start_request() -> Tuple[RequestStats, contextvars.Token]:
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token: contextvars.Token):
+    _request_stats.reset(token)
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "forensix_http_request_duration_seconds",
+    "Time spent serving HTTP requests, including streamed bodies",
+    ("method", "route", "status"))
+http_request_image_bytes = registry.histogram(
+    "forensix_http_request_image_bytes",
+    "Bytes read from disk images while serving one HTTP request",
+    ("route",), buckets=SIZE_BUCKETS)
+image_reads = registry.counter(
+    "forensix_image_reads_total", "Reads issued against disk images", ("format",))
+image_read_bytes = registry.counter(
+    "forensix_image_read_bytes_total", "Bytes read from disk images", ("format",))
+ewf_read_size = registry.histogram(
+    "forensix_ewf_read_size_bytes", "Size of individual reads from E01 images",
+    buckets=SIZE_BUCKETS)
+fs_info_opened = registry.counter(
+    "forensix_fs_info_opened_total", "pytsk3 FS_Info objects constructed", ("purpose",))
+volume_info_opened = registry.counter(
+    "forensix_volume_info_opened_total", "pytsk3 Volume_Info objects constructed")
+path_index_lookups = registry.counter(
+    "forensix_path_index_lookups_total", "Recursive listings answered from the path index or by a walk",
+    ("result",))
+
+
+def record_image_read(image_format: str, size: int):
+    """Account a read that went through a Python-level image handle"""
+    image_reads.inc(format=image_format)
+    image_read_bytes.inc(size, format=image_format)
+    if image_format == "e01":
+        ewf_read_size.observe(size)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.bytes_read += size
+        stats.reads += 1
+
+
+def register_cache(name: str, cache) -> None:
+    """Expose hit / miss counts and size of an LRUCache"""
+    registry.counter_func(f"forensix_{name}_cache_hits_total", f"Hits of the {name} cache",
+                          lambda: cache.hits)
+    registry.counter_func(f"forensix_{name}_cache_misses_total", f"Misses of the {name} cache",
+                          lambda: cache.misses)
+    registry.gauge(f"forensix_{name}_cache_entries", f"Entries held by the {name} cache", lambda: len(cache))
+    registry.gauge(f"forensix_{name}_cache_hit_ratio", f"Hit ratio of the {name} cache", cache.hit_ratio)
+
+
+def register_worker_pool(pool) -> None:
+    """Expose queue depth and busy workers of a WorkerPool"""
+    registry.gauge("forensix_worker_queue_depth", "Tasks waiting for a worker thread",
+                   lambda: pool.queue_depth)
+    registry.gauge("forensix_worker_active", "Worker threads currently running a task",
+                   lambda: pool.active)
+    registry.gauge("forensix_worker_threads", "Size of the worker thread pool",
+                   lambda: pool.max_workers)
+
+
+def snapshot() -> Dict:
+    """Compact summary of the most useful metrics for the health endpoint"""
+    summary = {
+        "http_requests": http_request_duration.total_count(),
+        "image_reads": int(image_reads.total()),
+        "image_bytes_read": int(image_read_bytes.total()),
+        "fs_info_opened": int(fs_info_opened.total()),
+        "volume_info_opened": int(volume_info_opened.total()),
+    }
+    for name in ("directory_cache_hit_ratio", "worker_queue_depth", "worker_active"):
+        gauge = registry.get(f"forensix_{name}")
+        if gauge is not None:
+            summary[name] = gauge.value()
+    return summary
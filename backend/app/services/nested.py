@@ -0,0 +1,363 @@
+"""
+Nested evidence: containers found inside a partition opened as images
+A VHD/VHDX, E01 or raw image stored as a file (possibly inside a ZIP
+archive), or a volume shadow copy of an NTFS partition, is read in place
+through its parent's filesystem and analyzed like any other image. Nothing
+is extracted to disk.
+
+Nested images are addressed by a virtual image path:
+    <parent image path>::<partition id>:<inode>            file in a partition
+    <parent image path>::<partition id>:<inode>!<member>   stored ZIP member
+    <parent image path>::<partition id>:vss<n>             shadow copy n
+The parent may itself be nested.
+"""
+import os
+import re
+import struct
+import zipfile
+import pyewf
+from typing import List, NamedTuple, Optional, Tuple
+from ..models.schemas import ContainerInfo, DiskImageInfo
+from .containers import (
+    LockedReader, ReadFunction, ReaderFile, SliceReader, VHDReader, VHDXReader,
+    VHD_COOKIE, VHD_FOOTER_SIZE, VHDX_SIGNATURE
+)
+from .extents import ExtentReader, build_extent_map, data_attribute
+from .filesystem_analyzer import FilesystemAnalyzer
+from .image_handler import (
+    DiskImageHandler, ContainerImageHandle, EWFImageHandle,
+    EWF_SIGNATURES, VMDK_SIGNATURES, QCOW_SIGNATURE
+)
+from .path_index import normalize_path
+from .results_store import results_store
+
+try:
+    import pyvshadow
+except ImportError:
+    pyvshadow = None
+
+
+NESTED_PATH_PATTERN = re.compile(
+    r"^(?P<parent>.+)::(?P<partition>[\w-]+):(?P<locator>vss\d+|\d+(?:!.+)?)$")
+
+# Bytes read from a candidate file to identify it
+SNIFF_SIZE = 4096
+# Files at least this large are checked for container signatures whatever their name
+MIN_SNIFF_SIZE = 1024 * 1024
+CONTAINER_EXTENSIONS = {
+    '.e01', '.ex01', '.vhd', '.vhdx', '.vmdk', '.qcow2',
+    '.dd', '.raw', '.img', '.bin', '.001', '.iso', '.zip',
+}
+RAW_EXTENSIONS = {'.dd', '.raw', '.img', '.bin', '.001', '.iso'}
+# Formats a nested image can be opened as
+NESTED_FORMATS = ('e01', 'vhd', 'vhdx', 'raw')
+
+ZIP_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+ZIP_LOCAL_SIGNATURE = b"PK\x03\x04"
+
+
+class ContainerSource(NamedTuple):
+    """Bytes of a nested container and a display name for it"""
+    read: object  # read(offset, size) -> bytes
+    size: int
+    name: str
+
+
+def nested_image_path(parent_path: str, partition_id: str, locator: str) -> str:
+    return f"{parent_path}::{partition_id}:{locator}"
+
+
+def parse_nested_path(image_path: str) -> Optional[Tuple[str, str, str]]:
+    """(parent path, partition id, locator) of a nested image path, None for image files"""
+    match = NESTED_PATH_PATTERN.match(image_path)
+    if not match or os.path.exists(image_path):
+        return None
+    return match.group("parent"), match.group("partition"), match.group("locator")
+
+
+def _has_boot_record(header: bytes) -> bool:
+    """Partition table or filesystem boot sector at the start of the data"""
+    if len(header) >= 512 and header[510:512] == b"\x55\xaa":
+        return True
+    if header[512:520] == b"EFI PART":
+        return True
+    # ext2/3/4 superblock magic at 1024 + 56
+    return len(header) >= 1082 and header[1080:1082] == b"\x53\xef"
+
+
+def sniff_container(header: bytes, tail: bytes, name: str) -> Optional[str]:
+    """
+    Identify a container from its first SNIFF_SIZE and last 512 bytes
+    Returns an image format, 'zip', or None for ordinary files
+    """
+    extension = os.path.splitext(name)[1].lower()
+    if header.startswith(EWF_SIGNATURES):
+        return 'e01'
+    if header.startswith(VHDX_SIGNATURE):
+        return 'vhdx'
+    if header.startswith(VHD_COOKIE) or tail.startswith(VHD_COOKIE):
+        return 'vhd'
+    if header.startswith(VMDK_SIGNATURES):
+        return 'vmdk'
+    if header.startswith(QCOW_SIGNATURE):
+        return 'qcow2'
+    if header.startswith(ZIP_LOCAL_SIGNATURE) and extension == '.zip':
+        return 'zip'
+    if extension in RAW_EXTENSIONS and (_has_boot_record(header) or extension == '.iso'):
+        return 'raw'
+    return None
+
+
+def _sniff_source(read, size: int, name: str) -> Optional[str]:
+    header = read(0, min(SNIFF_SIZE, size))
+    tail = read(size - VHD_FOOTER_SIZE, VHD_FOOTER_SIZE) if size >= VHD_FOOTER_SIZE else b""
+    return sniff_container(header, tail, name)
+
+
+def _stored_member(read, size: int, member: str) -> SliceReader:
+    """Byte range of an uncompressed ZIP member within the archive"""
+    with zipfile.ZipFile(ReaderFile(read, size)) as archive:
+        info = archive.getinfo(member)
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"ZIP member {member} is compressed and cannot be read in place; extract it first")
+    local = read(info.header_offset, ZIP_LOCAL_HEADER.size)
+    fields = ZIP_LOCAL_HEADER.unpack(local)
+    if fields[0] != ZIP_LOCAL_SIGNATURE:
+        raise ValueError(f"Corrupt ZIP local header for {member}")
+    name_length, extra_length = fields[-2], fields[-1]
+    data_offset = info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+    return SliceReader(read, data_offset, info.file_size)
+
+
+class NestedImageHandler(DiskImageHandler):
+    """
+    Image handler for a container inside another image
+
+    Reads go through a filesystem object private to this handler, so
+    browsing the nested image does not contend with the parent's own
+    analysis. Results are stored under the nested image's own fingerprint.
+    """
+
+    def __init__(self, parent: DiskImageHandler, partition_id: str, locator: str):
+        self.parent = parent
+        self.partition_id = partition_id
+        self.locator = locator
+        self._source: Optional[ContainerSource] = None
+        super().__init__(nested_image_path(parent.image_path, partition_id, locator))
+
+    def _open_source(self) -> ContainerSource:
+        if self._source is not None:
+            return self._source
+
+        if self.locator.startswith('vss'):
+            self._source = self._open_shadow_copy(int(self.locator[3:]))
+            return self._source
+
+        inode, _, member = self.locator.partition('!')
+        # TSK file objects must not outlive their filesystem object
+        self._source_filesystem = self.parent.open_filesystem(self.partition_id)
+        file_obj = self._source_filesystem.open_meta(inode=int(inode))
+        read = self._file_reader(file_obj)
+        size = file_obj.info.meta.size
+        path = self.parent.get_path_index(self.partition_id).path_for_inode(int(inode))
+        name = os.path.basename(path) if path else f"inode-{inode}"
+
+        if member:
+            slice_reader = _stored_member(read, size, member)
+            read, size, name = slice_reader.read, slice_reader.size, os.path.basename(member)
+        self._source = ContainerSource(read, size, name)
+        return self._source
+
+    def _file_reader(self, file_obj) -> ReadFunction:
+        """
+        Read function over the container file
+        Goes straight to the parent image along the file's extents when it
+        can; a container is read in small random pieces, for which TSK
+        would walk the file's run list on every call
+        """
+        attr = data_attribute(file_obj)
+        if attr is not None:
+            try:
+                extent_map = build_extent_map(file_obj, attr, self._source_filesystem,
+                                              self.parent.get_partition_offset(self.partition_id),
+                                              self.parent.img_info.read)
+                if extent_map.direct:
+                    return ExtentReader(self.parent.img_info.read, extent_map).read
+            except Exception as e:
+                print(f"Could not map extents of inode {file_obj.info.meta.addr}: {e}")
+        return LockedReader(file_obj.read_random).read
+
+    def _open_shadow_copy(self, store_index: int) -> ContainerSource:
+        if pyvshadow is None:
+            raise ValueError("Volume shadow copies need pyvshadow (libvshadow-python)")
+        partition = next((p for p in self.parent.get_partitions() if p.id == self.partition_id), None)
+        if partition is None:
+            raise ValueError(f"Partition {self.partition_id} not found")
+        volume_reader = SliceReader(self.parent.img_info.read,
+                                    self.parent.get_partition_offset(self.partition_id), partition.size)
+        volume = pyvshadow.volume()
+        volume.open_file_object(ReaderFile(volume_reader.read, volume_reader.size))
+        store = volume.get_store(store_index)
+        read = LockedReader(lambda offset, size: store.read_buffer_at_offset(size, offset)).read
+        # Keep the volume alive as long as the store is in use
+        self._shadow_volume = volume
+        return ContainerSource(read, store.volume_size, f"{partition.id} shadow copy {store_index}")
+
+    def _detect_format(self) -> str:
+        source = self._open_source()
+        if self.locator.startswith('vss'):
+            return 'raw'
+        return _sniff_source(source.read, source.size, source.name) or 'raw'
+
+    def open(self):
+        """Open the nested container as an image"""
+        source = self._open_source()
+        if self.format == 'e01':
+            # Single-segment E01 only; further segments would be sibling files
+            self.ewf_handle = pyewf.handle()
+            self.ewf_handle.open_file_objects([ReaderFile(source.read, source.size)])
+            self.img_info = EWFImageHandle(self.ewf_handle)
+        elif self.format == 'vhd':
+            reader = VHDReader(source.read, source.size)
+            self.img_info = ContainerImageHandle(reader, reader.size, 'nested')
+        elif self.format == 'vhdx':
+            reader = VHDXReader(source.read)
+            self.img_info = ContainerImageHandle(reader, reader.size, 'nested')
+        elif self.format == 'raw':
+            self.img_info = ContainerImageHandle(SliceReader(source.read, 0, source.size), source.size, 'nested')
+        else:
+            raise ValueError(f"Nested {self.format.upper()} containers are not supported")
+        return self.img_info
+
+    def get_image_info(self) -> DiskImageInfo:
+        info = super().get_image_info()
+        return info.model_copy(update={'filename': self._open_source().name})
+
+
+class ContainerFinder:
+    """
+    Finds containers in a partition that can be opened as nested images
+
+    Candidates are files with a container extension or of at least
+    MIN_SNIFF_SIZE bytes; each is identified from its first and last bytes.
+    Results are kept in the results store, so the scan runs once per image.
+    """
+
+    def __init__(self, image_handler: DiskImageHandler):
+        self.image_handler = image_handler
+        self.analyzer = FilesystemAnalyzer(image_handler)
+
+    def find(self, partition_id: str, path: str = "/", max_files: int = 100000) -> List[ContainerInfo]:
+        path = normalize_path(path)
+        key = f"{partition_id}:{path}:{max_files}"
+        fingerprint = self.image_handler.get_fingerprint() if results_store.enabled else None
+        stored = results_store.get(fingerprint, 'containers', key=key) if fingerprint else None
+        if stored is not None:
+            return [ContainerInfo.model_validate(item) for item in stored]
+
+        files = self.analyzer.list_files(partition_id, path, max_files, include_deleted=True)
+        fs_info = self.image_handler.get_filesystem(partition_id)
+        found = []
+
+        for file_meta in files:
+            extension = os.path.splitext(file_meta.name)[1].lower()
+            if file_meta.inode is None or file_meta.size < 512:
+                continue
+            if extension not in CONTAINER_EXTENSIONS and file_meta.size < MIN_SNIFF_SIZE:
+                continue
+            try:
+                file_obj = fs_info.open_meta(inode=file_meta.inode)
+                container_type = _sniff_source(file_obj.read_random, file_meta.size, file_meta.name)
+            except Exception as e:
+                print(f"Could not examine {file_meta.path}: {e}")
+                continue
+            if container_type == 'zip':
+                found.extend(self._zip_members(partition_id, file_meta, file_obj))
+            elif container_type is not None:
+                found.append(self._container(partition_id, file_meta, container_type))
+
+        if path == "/":
+            found.extend(self._shadow_copies(partition_id))
+
+        if fingerprint:
+            results_store.put(fingerprint, 'containers', [c.model_dump(mode='json') for c in found], key=key)
+        return found
+
+    def _container(self, partition_id: str, file_meta, container_type: str,
+                   member: Optional[str] = None, error: Optional[str] = None,
+                   size: Optional[int] = None) -> ContainerInfo:
+        supported = container_type in NESTED_FORMATS and error is None
+        if container_type not in NESTED_FORMATS and error is None:
+            error = f"{container_type.upper()} containers are not supported"
+        locator = f"{file_meta.inode}!{member}" if member else str(file_meta.inode)
+        return ContainerInfo(
+            path=f"{file_meta.path}!{member}" if member else file_meta.path,
+            inode=file_meta.inode,
+            size=file_meta.size if size is None else size,
+            type=container_type,
+            is_deleted=file_meta.is_deleted,
+            member=member,
+            image_path=nested_image_path(self.image_handler.image_path, partition_id, locator) if supported else None,
+            error=error
+        )
+
+    def _zip_members(self, partition_id: str, file_meta, file_obj) -> List[ContainerInfo]:
+        """Image-like members of a ZIP archive; only stored members can be opened in place"""
+        members = []
+        try:
+            archive = zipfile.ZipFile(ReaderFile(file_obj.read_random, file_meta.size))
+        except (zipfile.BadZipFile, OSError) as e:
+            print(f"Could not read ZIP archive {file_meta.path}: {e}")
+            return members
+
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or info.file_size < 512:
+                    continue
+                if os.path.splitext(info.filename)[1].lower() not in CONTAINER_EXTENSIONS:
+                    continue
+                try:
+                    with archive.open(info) as member:
+                        header = member.read(SNIFF_SIZE)
+                    container_type = sniff_container(header, b"", info.filename)
+                    if container_type is None and info.compress_type == zipfile.ZIP_STORED:
+                        member_reader = _stored_member(file_obj.read_random, file_meta.size, info.filename)
+                        container_type = _sniff_source(member_reader.read, member_reader.size, info.filename)
+                except Exception as e:
+                    print(f"Could not examine {file_meta.path}!{info.filename}: {e}")
+                    continue
+                if container_type in (None, 'zip'):
+                    continue
+                error = None
+                if info.compress_type != zipfile.ZIP_STORED:
+                    error = "Compressed ZIP member; extract it to analyze"
+                members.append(self._container(partition_id, file_meta, container_type,
+                                               member=info.filename, error=error, size=info.file_size))
+        return members
+
+    def _shadow_copies(self, partition_id: str) -> List[ContainerInfo]:
+        """Volume shadow copies of an NTFS partition (needs pyvshadow)"""
+        if pyvshadow is None:
+            return []
+        partition = next((p for p in self.image_handler.get_partitions() if p.id == partition_id), None)
+        if partition is None or partition.filesystem_type != 'NTFS':
+            return []
+        reader = SliceReader(self.image_handler.img_info.read,
+                             self.image_handler.get_partition_offset(partition_id), partition.size)
+        try:
+            volume = pyvshadow.volume()
+            volume.open_file_object(ReaderFile(reader.read, reader.size))
+            count = volume.number_of_stores
+        except Exception as e:
+            print(f"Could not read volume shadow copies of {partition_id}: {e}")
+            return []
+
+        return [
+            ContainerInfo(
+                path=f"[shadow copy {index}]",
+                size=partition.size,
+                type='vss',
+                image_path=nested_image_path(self.image_handler.image_path, partition_id, f"vss{index}")
+            )
+            for index in range(count)
+        ]
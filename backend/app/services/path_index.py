@@ -0,0 +1,218 @@
+"""
+Path index for fast path-to-inode resolution
+Built as a side effect of directory walks so later path-based reads and
+subdirectory listings do not need TSK to resolve paths again
+"""
+import itertools
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from ..models.schemas import FileMetadata
+
+
+class PathIndexEntry(NamedTuple):
+    """A single indexed filesystem entry"""
+    path: str
+    inode: int
+    attr_id: Optional[int]
+    is_directory: bool
+    is_deleted: bool
+    metadata: Optional[FileMetadata]
+
+
+def normalize_path(path: str) -> str:
+    """Normalize a filesystem path to the form used as index key"""
+    if not path:
+        return "/"
+    path = "/" + path.strip("/")
+    while "//" in path:
+        path = path.replace("//", "/")
+    return path
+
+
+class PathIndex:
+    """
+    Maps full paths to (inode, attribute id) for one partition
+
+    Directories are tracked as complete once all of their entries have been
+    seen by a walk, which allows listing any fully walked subtree straight
+    from the index.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, PathIndexEntry] = {}
+        self._paths_by_inode: Dict[int, str] = {}
+        self._children: Dict[str, List[PathIndexEntry]] = {}
+        # Directory path -> whether deleted entries were included when walked
+        self._complete: Dict[str, bool] = {}
+        # Bumped on every change so callers can tell when to persist the index
+        self.version = 0
+        # Metadata of entries added and removed since take_changes was last called
+        self._added: List[FileMetadata] = []
+        self._removed: List[FileMetadata] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, path: str, inode: int, attr_id: Optional[int] = None,
+            is_directory: bool = False, is_deleted: bool = False,
+            metadata: Optional[FileMetadata] = None) -> PathIndexEntry:
+        """Add an entry to the index"""
+        path = normalize_path(path)
+        entry = PathIndexEntry(path, inode, attr_id, is_directory, is_deleted, metadata)
+        self.version += 1
+
+        parent = path.rsplit("/", 1)[0] or "/"
+        siblings = self._children.setdefault(parent, [])
+        if path != "/":
+            siblings.append(entry)
+            if metadata:
+                self._added.append(metadata)
+
+        # Deleted entries never shadow an allocated entry with the same path
+        existing = self._entries.get(path)
+        if existing is None or existing.is_deleted or not is_deleted:
+            self._entries[path] = entry
+            if attr_id is None:
+                self._paths_by_inode[inode] = path
+        return entry
+
+    def discard_subtree(self, path: str):
+        """Forget everything indexed below a directory before it is re-walked"""
+        path = normalize_path(path)
+        prefix = path.rstrip("/") + "/"
+
+        self.version += 1
+
+        def below(key: str) -> bool:
+            return key == path or key.startswith(prefix)
+
+        for mapping in (self._entries, self._children, self._complete):
+            for key in [k for k in mapping if below(k)]:
+                if mapping is self._entries and key == path:
+                    continue
+                removed = mapping.pop(key)
+                if mapping is self._children:
+                    self._removed.extend(child.metadata for child in removed if child.metadata)
+                if mapping is self._entries and self._paths_by_inode.get(removed.inode) == key:
+                    del self._paths_by_inode[removed.inode]
+
+    def reset_directory(self, path: str):
+        """Forget the indexed children of a single directory before re-reading it"""
+        path = normalize_path(path)
+        self._removed.extend(child.metadata for child in self._children.get(path, []) if child.metadata)
+        self._children[path] = []
+        self._complete.pop(path, None)
+        self.version += 1
+
+    def children(self, path: str) -> List[PathIndexEntry]:
+        """Indexed immediate children of a directory"""
+        return list(self._children.get(normalize_path(path), []))
+
+    def mark_complete(self, path: str, include_deleted: bool):
+        """Record that every entry of a directory has been indexed"""
+        self._complete[normalize_path(path)] = include_deleted
+        self.version += 1
+
+    def is_complete(self, path: str, include_deleted: bool = True) -> bool:
+        """Check whether a directory listing can be served from the index"""
+        walked_deleted = self._complete.get(normalize_path(path))
+        if walked_deleted is None:
+            return False
+        return walked_deleted or not include_deleted
+
+    def take_changes(self) -> Tuple[List[FileMetadata], List[FileMetadata]]:
+        """Metadata of the entries (added, removed) since the last call"""
+        added, self._added = self._added, []
+        removed, self._removed = self._removed, []
+        return added, removed
+
+    def metadata(self) -> Iterator[FileMetadata]:
+        """Metadata of every indexed entry below the root, in no particular order"""
+        for children in self._children.values():
+            for child in children:
+                if child.metadata:
+                    yield child.metadata
+
+    def dump(self) -> Dict[str, Any]:
+        """JSON-serializable form of the index, restored with PathIndex.load"""
+        def record(entry: PathIndexEntry) -> list:
+            metadata = entry.metadata.model_dump(mode="json", exclude_none=True) if entry.metadata else None
+            return [entry.path, entry.inode, entry.attr_id, entry.is_directory, entry.is_deleted, metadata]
+
+        # Children in walk order; re-adding them in this order rebuilds every mapping
+        entries = [record(child) for children in self._children.values() for child in children]
+        root = self._entries.get("/")
+        if root is not None:
+            entries.insert(0, record(root))
+        return {"entries": entries, "complete": dict(self._complete)}
+
+    @classmethod
+    def load(cls, data: Dict[str, Any]) -> "PathIndex":
+        index = cls()
+        for path, inode, attr_id, is_directory, is_deleted, metadata in data["entries"]:
+            index.add(path, inode, attr_id, is_directory, is_deleted,
+                      FileMetadata.model_validate(metadata) if metadata else None)
+        index._complete.update(data["complete"])
+        index.version = 0
+        index.take_changes()
+        return index
+
+    def lookup(self, path: str) -> Optional[PathIndexEntry]:
+        """Resolve a path to its index entry"""
+        return self._entries.get(normalize_path(path))
+
+    def path_for_inode(self, inode: int) -> Optional[str]:
+        """Reverse lookup of the indexed path for an inode"""
+        return self._paths_by_inode.get(inode)
+
+    def is_subtree_complete(self, path: str, include_deleted: bool = True) -> bool:
+        """Check whether every directory below a path has been fully walked"""
+        stack = [normalize_path(path)]
+        visited = set()
+        while stack:
+            current = stack.pop()
+            if current in visited:
+                continue
+            visited.add(current)
+            if not self.is_complete(current, include_deleted):
+                return False
+            for child in self._children.get(current, []):
+                if child.is_directory and (include_deleted or not child.is_deleted):
+                    stack.append(child.path)
+        return True
+
+    def list_prefix(self, path: str, max_files: int = 1000,
+                    include_deleted: bool = True,
+                    include_directories: bool = False) -> Optional[List[FileMetadata]]:
+        """
+        List everything below a directory from the index
+
+        Entries are returned in the same order a directory walk produces.
+        Returns None if any directory in the subtree has not been fully
+        walked, in which case the caller has to traverse the filesystem.
+        """
+        # Verify the whole subtree first so a partial listing is never returned
+        if not self.is_subtree_complete(path, include_deleted):
+            return None
+        return list(itertools.islice(self.iter_prefix(path, include_deleted, include_directories), max_files))
+
+    def iter_prefix(self, path: str, include_deleted: bool = True,
+                    include_directories: bool = False) -> Iterator[FileMetadata]:
+        """
+        Lazily yield the indexed entries below a directory, depth-first in
+        walk order; parts of the subtree not walked yet are left out
+        """
+        path = normalize_path(path)
+        visited = {path}
+        stack = [iter(self._children.get(path, []))]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                continue
+            if child.is_deleted and not include_deleted:
+                continue
+            if child.metadata and (include_directories or not child.is_directory):
+                yield child.metadata
+            if child.is_directory and child.path not in visited:
+                visited.add(child.path)
+                stack.append(iter(self._children.get(child.path, [])))
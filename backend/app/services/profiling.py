@@ -0,0 +1,133 @@
+"""
+Opt-in per-request profiling
+Requests sending the X-Forensix-Profile header (or every request when
+FORENSIX_PROFILE_ALL_REQUESTS is set) run under cProfile, including the
+tasks they hand to the worker pool. Profiles are kept by request id so a
+slow image can be profiled once and the result downloaded afterwards.
+"""
+import contextvars
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from ..config import PROFILE_STORE_SIZE
+from .cache import LRUCache
+
+
+PROFILE_HEADER = "x-forensix-profile"
+PROFILE_ID_HEADER = "X-Forensix-Profile-Id"
+
+# Native modules whose calls are broken out separately in summaries
+NATIVE_MODULES = ("pytsk3", "pyewf")
+
+
+class RequestProfile:
+    """cProfile data collected for one request across all threads it used"""
+
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.duration: Optional[float] = None
+        self.status: Optional[int] = None
+        self._profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profiler: cProfile.Profile):
+        with self._lock:
+            self._profilers.append(profiler)
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Run fn under a profiler of its own (used for worker threads)"""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            self.add(profiler)
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profilers = list(self._profilers)
+        if not profilers:
+            return None
+        stats = pstats.Stats(profilers[0], stream=io.StringIO())
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+    def dump(self) -> bytes:
+        """Profile in the pstats file format (readable by pstats, snakeviz, ...)"""
+        stats = self.stats()
+        return marshal.dumps(stats.stats if stats else {})
+
+    def text(self, sort: str = "cumulative", limit: int = 60) -> str:
+        stats = self.stats()
+        if stats is None:
+            return "No profile data\n"
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def summary(self, limit: int = 20) -> Dict:
+        """Top functions plus the time spent inside pytsk3 / pyewf calls"""
+        result = {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "started": self.started,
+            "duration": self.duration,
+            "status": self.status,
+            "threads": len(self._profilers),
+            "functions": [],
+            "native_calls": [],
+        }
+        stats = self.stats()
+        if stats is None:
+            return result
+
+        rows = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": name if filename == "~" else f"{filename}:{line}({name})",
+                "calls": calls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+                # C methods show up as "<method 'read_random' of 'pytsk3.File' objects>"
+                "native": filename == "~" and any(module in name for module in NATIVE_MODULES),
+            })
+        rows.sort(key=lambda row: row["cumtime"], reverse=True)
+        result["functions"] = [{k: v for k, v in row.items() if k != "native"} for row in rows[:limit]]
+        result["native_calls"] = [
+            {k: v for k, v in row.items() if k != "native"}
+            for row in sorted((r for r in rows if r["native"]), key=lambda r: r["tottime"], reverse=True)
+        ]
+        result["native_time"] = sum(row["tottime"] for row in rows if row["native"])
+        return result
+
+
+_active_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "forensix_active_profile", default=None)
+
+
+def activate(profile: RequestProfile) -> contextvars.Token:
+    return _active_profile.set(profile)
+
+
+def deactivate(token: contextvars.Token):
+    _active_profile.reset(token)
+
+
+def profile_in_context(context: contextvars.Context) -> Optional[RequestProfile]:
+    """Profile of the request a worker task was submitted from, if any"""
+    return context.get(_active_profile)
+
+
+# Finished profiles keyed by request id
+profile_store = LRUCache(PROFILE_STORE_SIZE)
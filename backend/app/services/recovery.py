@@ -0,0 +1,212 @@
+"""
+Deleted and orphan file recovery using a direct metadata walk
+Finds unallocated MFT entries / inodes even when no directory entry
+points to them any more
+"""
+import pytsk3
+from typing import Generator, Iterator, List, Optional, Tuple
+from ..config import ORPHAN_SCAN_BATCH_SIZE
+from ..models.schemas import RecoveredFile
+from .allocation import AllocationBitmap
+from .extents import DATA_ATTR_TYPES
+from .filesystem_analyzer import FilesystemAnalyzer
+from .image_handler import DiskImageHandler
+from .results_store import results_store
+from .workers import worker_pool
+
+
+NTFS_FILE_NAME_TYPE = 0x30
+
+SKIPPED_RUN_FLAGS = pytsk3.TSK_FS_ATTR_RUN_FLAG_SPARSE | pytsk3.TSK_FS_ATTR_RUN_FLAG_FILLER
+
+
+class OrphanScanner:
+    """
+    Walks the inode / MFT range of a partition in batches
+
+    Batches are spread over the shared worker pool, each worker using its
+    own filesystem object, and results are yielded as batches finish.
+    """
+
+    def __init__(self, image_handler: DiskImageHandler):
+        self.image_handler = image_handler
+        self.analyzer = FilesystemAnalyzer(image_handler)
+
+    def scan(self, partition_id: str, batch_size: Optional[int] = None,
+             min_recoverability: Optional[float] = None,
+             include_named: bool = True) -> Generator[RecoveredFile, None, None]:
+        """
+        Stream unallocated-but-intact metadata records of a partition
+
+        Args:
+            partition_id: Partition identifier
+            batch_size: Inodes examined per worker task
+            min_recoverability: Skip records scoring below this value
+            include_named: Include records a directory walk already found
+        """
+        index = self.image_handler.get_path_index(partition_id)
+        fingerprint = self.image_handler.get_content_fingerprint() if results_store.enabled else None
+        batch_size = max(1, batch_size or ORPHAN_SCAN_BATCH_SIZE)
+
+        # Batches are stored as they finish, keyed by their first inode; the
+        # list of batches is stored last, so only complete scans are replayed.
+        # named is recomputed since the path index may have grown since
+        stored = results_store.get(fingerprint, 'orphan_scan', key=f"{partition_id}:batches") if fingerprint else None
+        if stored is not None:
+            batches = self._stored_batches(fingerprint, partition_id, stored)
+        else:
+            batches = self._scan_batches(partition_id, batch_size)
+
+        starts = []
+        for start, batch in batches:
+            if fingerprint and stored is None and batch:
+                results_store.put(fingerprint, 'orphan_scan', [record.model_dump(mode='json') for record in batch],
+                                  key=f"{partition_id}:{batch_size}:{start}")
+                starts.append(start)
+            for record in batch:
+                record.named = index.path_for_inode(record.inode) is not None
+                if record.named and not include_named:
+                    continue
+                if min_recoverability is not None and (
+                        record.recoverability is None or record.recoverability < min_recoverability):
+                    continue
+                yield record
+
+        # Only reached when the consumer read the whole scan
+        if fingerprint and stored is None:
+            results_store.put(fingerprint, 'orphan_scan', {'batch_size': batch_size, 'starts': sorted(starts)},
+                              key=f"{partition_id}:batches")
+
+    def _stored_batches(self, fingerprint: str, partition_id: str,
+                        stored: dict) -> Iterator[Tuple[int, List[RecoveredFile]]]:
+        """Batches of a complete scan, read from the store one at a time"""
+        for start in stored['starts']:
+            records = results_store.get(fingerprint, 'orphan_scan',
+                                        key=f"{partition_id}:{stored['batch_size']}:{start}") or []
+            yield start, [RecoveredFile.model_validate(record) for record in records]
+
+    def _scan_batches(self, partition_id: str, batch_size: Optional[int]
+                      ) -> Generator[Tuple[int, List[RecoveredFile]], None, None]:
+        """
+        Scan the partition's metadata range on the worker pool, yielding
+        (first inode, records) per batch as batches finish
+        """
+        fs_info = self.image_handler.get_filesystem(partition_id)
+        first_inum = fs_info.info.first_inum
+        last_inum = fs_info.info.last_inum
+        batch_size = max(1, batch_size or ORPHAN_SCAN_BATCH_SIZE)
+        bitmap = self.image_handler.get_allocation_bitmap(partition_id)
+
+        ranges = (
+            (start, min(start + batch_size, last_inum + 1))
+            for start in range(first_inum, last_inum + 1, batch_size)
+        )
+
+        def scan_batch(inode_range: Tuple[int, int]) -> Tuple[int, List[RecoveredFile]]:
+            return inode_range[0], self._scan_range(partition_id, inode_range[0], inode_range[1], bitmap)
+
+        yield from worker_pool.map_unordered(scan_batch, ranges)
+
+    def _scan_range(self, partition_id: str, start: int, end: int,
+                    bitmap: Optional[AllocationBitmap]) -> List[RecoveredFile]:
+        """Examine the inodes in [start, end) on a worker thread"""
+        fs_info = self.image_handler.get_thread_filesystem(partition_id)
+        found = []
+
+        for inode in range(start, end):
+            try:
+                file_obj = fs_info.open_meta(inode=inode)
+            except Exception:
+                # Unreadable or corrupt record
+                continue
+
+            meta = file_obj.info.meta
+            if meta is None:
+                continue
+            if not meta.flags & pytsk3.TSK_FS_META_FLAG_UNALLOC:
+                continue
+            if meta.flags & pytsk3.TSK_FS_META_FLAG_UNUSED:
+                continue
+            # Never-used slots (zeroed FAT directory entries) carry nothing to recover
+            if not meta.size and not meta.mtime and not meta.crtime:
+                continue
+
+            try:
+                found.append(self._build_record(file_obj, meta, bitmap))
+            except Exception as e:
+                print(f"Error examining inode {inode}: {e}")
+
+        return found
+
+    def _build_record(self, file_obj, meta, bitmap: Optional[AllocationBitmap]) -> RecoveredFile:
+        """Describe one unallocated record and score how much data survives"""
+        total_blocks = 0
+        unallocated_blocks = 0
+        resident = False
+
+        for attr in file_obj:
+            info = attr.info
+            if int(info.type) not in DATA_ATTR_TYPES or info.name:
+                continue
+            if info.flags & pytsk3.TSK_FS_ATTR_RES:
+                resident = True
+                break
+            for run in attr:
+                if run.flags & SKIPPED_RUN_FLAGS:
+                    continue
+                total_blocks += run.len
+                if bitmap is not None:
+                    unallocated_blocks += bitmap.count_unallocated(run.addr, run.len)
+            break
+
+        # Resident data lives inside the record itself, which is still intact
+        if resident:
+            recoverability = 1.0
+        elif total_blocks and bitmap is not None:
+            recoverability = unallocated_blocks / total_blocks
+        else:
+            recoverability = None
+
+        name, parent_inode = self._read_ntfs_file_name(file_obj)
+
+        if meta.type == pytsk3.TSK_FS_META_TYPE_DIR:
+            file_type = 'directory'
+        elif meta.type == pytsk3.TSK_FS_META_TYPE_REG:
+            file_type = 'file'
+        else:
+            file_type = 'other'
+
+        return RecoveredFile(
+            inode=meta.addr,
+            name=name,
+            parent_inode=parent_inode,
+            type=file_type,
+            size=meta.size,
+            timestamps=self.analyzer._extract_timestamps(meta),
+            resident=resident,
+            total_blocks=total_blocks,
+            unallocated_blocks=unallocated_blocks,
+            recoverability=recoverability
+        )
+
+    def _read_ntfs_file_name(self, file_obj) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Recover name and parent directory from an NTFS $FILE_NAME attribute
+        Long (Win32) names are preferred over DOS 8.3 names
+        """
+        best = (None, None)
+        for attr in file_obj:
+            info = attr.info
+            if int(info.type) != NTFS_FILE_NAME_TYPE:
+                continue
+            try:
+                data = file_obj.read_random(0, info.size, info.type, info.id)
+                parent_inode = int.from_bytes(data[0:6], 'little')
+                name_length, namespace = data[0x40], data[0x41]
+                name = data[0x42:0x42 + name_length * 2].decode('utf-16-le', errors='ignore')
+            except Exception:
+                continue
+            best = (name, parent_inode)
+            if namespace != 2:
+                break
+        return best
@@ -0,0 +1,160 @@
+"""
+File slack and unallocated space as a stream of image regions
+Keyword and carving passes read these instead of building their own block
+maps: unallocated runs come from the allocation bitmap in one pass, slack
+from the runs of allocated files, and nearby regions are read together
+"""
+import heapq
+from typing import Generator, Iterable, List, NamedTuple, Optional, Tuple
+from ..config import REGION_READ_SIZE
+from .extents import COALESCE_GAP, data_attribute, slack_extents
+from .filesystem_analyzer import FilesystemAnalyzer
+from .image_handler import DiskImageHandler
+from .results_store import results_store
+from .workers import worker_pool
+
+
+REGION_KINDS = ('unallocated', 'slack')
+
+# Files examined per worker task when locating slack
+SLACK_BATCH_SIZE = 512
+
+
+class Region(NamedTuple):
+    """A byte range of the image that holds no live file content"""
+    kind: str  # 'unallocated' or 'slack'
+    offset: int  # Byte offset within the image
+    length: int
+    inode: Optional[int] = None  # File whose slack this is
+
+
+class RegionChunk(NamedTuple):
+    """Content of (part of) a region"""
+    offset: int  # Byte offset within the image
+    data: bytes
+    region: Region
+
+
+class RegionSource:
+    """
+    Slack and unallocated regions of a partition, and their content
+
+    Regions come in image order. Reads cover whole regions up to
+    REGION_READ_SIZE, and regions less than COALESCE_GAP apart share one
+    read, so slack scattered over many small files costs few reads.
+    """
+
+    def __init__(self, image_handler: DiskImageHandler):
+        self.image_handler = image_handler
+        self.analyzer = FilesystemAnalyzer(image_handler)
+
+    def regions(self, partition_id: str, kinds: Iterable[str] = REGION_KINDS,
+                min_length: int = 0, max_files: int = 1000000) -> Generator[Region, None, None]:
+        """
+        Regions of the requested kinds in image order
+
+        Args:
+            partition_id: Partition identifier
+            kinds: Any of 'unallocated' and 'slack'
+            min_length: Skip regions shorter than this many bytes
+            max_files: Files examined for slack
+        """
+        kinds = set(kinds)
+        unknown = kinds - set(REGION_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown region kinds: {', '.join(sorted(unknown))}")
+
+        streams = []
+        if 'unallocated' in kinds:
+            streams.append(self.unallocated_regions(partition_id))
+        if 'slack' in kinds:
+            streams.append(iter(self.slack_regions(partition_id, max_files)))
+        for region in heapq.merge(*streams, key=lambda region: region.offset):
+            if region.length >= min_length:
+                yield region
+
+    def unallocated_regions(self, partition_id: str) -> Generator[Region, None, None]:
+        """Runs of unallocated blocks, adjacent runs merged"""
+        bitmap = self.image_handler.get_allocation_bitmap(partition_id)
+        if bitmap is None:
+            raise ValueError(f"Allocation state of partition {partition_id} cannot be read")
+        block_size = self.image_handler.get_filesystem(partition_id).info.block_size
+        fs_offset = self.image_handler.get_partition_offset(partition_id)
+        for block, count in bitmap.unallocated_runs():
+            yield Region('unallocated', fs_offset + block * block_size, count * block_size)
+
+    def slack_regions(self, partition_id: str, max_files: int = 1000000) -> List[Region]:
+        """
+        Slack of every allocated file, sorted by image offset
+        Stored by image fingerprint, as it takes a walk and a look at every file
+        """
+        key = f"{partition_id}:{max_files}"
+        fingerprint = self.image_handler.get_content_fingerprint() if results_store.enabled else None
+        stored = results_store.get(fingerprint, 'slack', key=key) if fingerprint else None
+        if stored is not None:
+            return [Region('slack', offset, length, inode) for offset, length, inode in stored]
+
+        files = self.analyzer.list_files(partition_id, "/", max_files, include_deleted=False)
+        inodes = sorted({f.inode for f in files if f.type == 'file' and f.inode is not None and f.size})
+        batches = (inodes[i:i + SLACK_BATCH_SIZE] for i in range(0, len(inodes), SLACK_BATCH_SIZE))
+
+        def scan_batch(batch: List[int]) -> List[Region]:
+            return self._file_slack(partition_id, batch)
+
+        regions = sorted(
+            (region for found in worker_pool.map_unordered(scan_batch, batches) for region in found),
+            key=lambda region: region.offset)
+        if fingerprint:
+            results_store.put(fingerprint, 'slack',
+                              [[region.offset, region.length, region.inode] for region in regions], key=key)
+        return regions
+
+    def _file_slack(self, partition_id: str, inodes: List[int]) -> List[Region]:
+        """Slack of a batch of files, on a worker thread"""
+        fs_info = self.image_handler.get_thread_filesystem(partition_id)
+        fs_offset = self.image_handler.get_partition_offset(partition_id)
+        found = []
+        for inode in inodes:
+            try:
+                # The attribute must not outlive its file object
+                file_obj = fs_info.open_meta(inode=inode)
+                attr = data_attribute(file_obj)
+                if attr is None:
+                    continue
+                for extent in slack_extents(attr, fs_info, fs_offset):
+                    found.append(Region('slack', extent.physical_offset, extent.length, inode))
+            except Exception as e:
+                print(f"Error locating slack of inode {inode}: {e}")
+        return found
+
+    def iter_data(self, partition_id: str, kinds: Iterable[str] = REGION_KINDS,
+                  min_length: int = 0, max_files: int = 1000000,
+                  read_size: int = REGION_READ_SIZE) -> Generator[RegionChunk, None, None]:
+        """
+        Content of the requested regions in image order
+        Regions longer than read_size come in several chunks
+        """
+        read = self.image_handler.img_info.read
+        batch: List[Tuple[int, int, Region]] = []
+        batch_start = batch_end = 0
+
+        for region in self.regions(partition_id, kinds, min_length, max_files):
+            for offset in range(region.offset, region.offset + region.length, read_size):
+                length = min(read_size, region.offset + region.length - offset)
+                if batch and (offset - batch_end > COALESCE_GAP or offset + length - batch_start > read_size):
+                    yield from _split_batch(read, batch, batch_start, batch_end)
+                    batch = []
+                if not batch:
+                    batch_start = batch_end = offset
+                batch.append((offset, length, region))
+                batch_end = max(batch_end, offset + length)
+        if batch:
+            yield from _split_batch(read, batch, batch_start, batch_end)
+
+
+def _split_batch(read, batch: List[Tuple[int, int, Region]], start: int,
+                 end: int) -> Generator[RegionChunk, None, None]:
+    """Read a batch of nearby pieces at once and hand each piece its bytes"""
+    data = memoryview(read(start, end - start))
+    for offset, length, region in batch:
+        yield RegionChunk(offset, bytes(data[offset - start:offset - start + length]), region)
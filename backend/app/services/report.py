@@ -0,0 +1,234 @@
+"""
+Forensic reports streamed from indexed results
+Sections are written one after another straight from the path index, the
+stored hashes and the risk counters; files are hashed on the worker pool as
+their manifest rows are written, so no section is held in memory whole
+"""
+import heapq
+import itertools
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Tuple
+from ..models.schemas import FileMetadata, PartitionInfo, ReportRequest
+from .filesystem_analyzer import FilesystemAnalyzer
+from .image_handler import DiskImageHandler
+from .risk import risk_index
+
+
+REPORT_FORMATS = ("json", "text")
+REPORT_SECTIONS = ("case", "image", "partitions", "findings", "timeline", "hashes")
+
+# Output is handed to the response in pieces of about this size
+FLUSH_SIZE = 64 * 1024
+
+TIMESTAMP_EVENTS = ("created", "modified", "accessed", "changed")
+
+_RULE = "═" * 51 + "\n"
+_SECTION_RULE = "─" * 51 + "\n"
+
+
+def _buffered(pieces: Iterable[str], size: int = FLUSH_SIZE) -> Iterator[str]:
+    """Join small pieces of output into chunks of about size characters"""
+    buffer: List[str] = []
+    length = 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class ReportBuilder:
+    """
+    Streams the report of an open image in JSON or text
+
+    The request is checked when the builder is created, so bad requests fail
+    before any output. Partitions are walked into the path index when the
+    findings, timeline or hash sections need files that were not listed yet.
+    """
+
+    def __init__(self, image_handler: DiskImageHandler, request: ReportRequest):
+        if request.format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {request.format}")
+        unknown = [section for section in request.sections if section not in REPORT_SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown report sections: {', '.join(unknown)}")
+        if request.timeline_limit < 0 or request.max_files < 1:
+            raise ValueError("timeline_limit must not be negative and max_files must be positive")
+
+        self.image_handler = image_handler
+        self.analyzer = FilesystemAnalyzer(image_handler)
+        self.request = request
+        self.sections = set(request.sections)
+        partitions = image_handler.get_partitions()
+        if request.partition_id:
+            self.partitions = [p for p in partitions if p.id == request.partition_id]
+            if not self.partitions:
+                raise ValueError(f"Unknown partition: {request.partition_id}")
+        else:
+            self.partitions = [p for p in partitions if not p.filesystem_type.startswith('Unknown')]
+
+    def stream(self) -> Generator[str, None, None]:
+        """The report in the requested format, in chunks"""
+        pieces = self._json() if self.request.format == "json" else self._text()
+        return _buffered(pieces)
+
+    def _index(self):
+        """Walk partitions whose files are not all in the path index yet"""
+        for partition in self.partitions:
+            index = self.image_handler.get_path_index(partition.id)
+            if not index.is_subtree_complete("/", self.request.include_deleted):
+                self.analyzer.list_files(partition.id, "/", self.request.max_files,
+                                         include_deleted=self.request.include_deleted)
+
+    def _files(self, partition: PartitionInfo) -> Iterator[FileMetadata]:
+        """Regular files of a partition, lazily from the path index"""
+        index = self.image_handler.get_path_index(partition.id)
+        files = (f for f in index.iter_prefix("/", self.request.include_deleted) if f.type == 'file')
+        return itertools.islice(files, self.request.max_files)
+
+    def _timeline(self) -> List[Tuple[str, str, str, str, int]]:
+        """
+        The most recent timeline_limit events, oldest first, as
+        (timestamp, event, partition id, path, inode)
+        """
+        limit = self.request.timeline_limit
+        recent: List[Tuple[str, str, str, str, int]] = []
+        if not limit:
+            return recent
+        for partition in self.partitions:
+            for f in self._files(partition):
+                for event in TIMESTAMP_EVENTS:
+                    timestamp = getattr(f.timestamps, event)
+                    if not timestamp:
+                        continue
+                    item = (timestamp, event, partition.id, f.path, f.inode or 0)
+                    if len(recent) < limit:
+                        heapq.heappush(recent, item)
+                    elif item > recent[0]:
+                        heapq.heapreplace(recent, item)
+        return sorted(recent)
+
+    def _manifest(self, row: Callable[[str, FileMetadata, Any, str], str],
+                  totals: Dict[str, int]) -> Iterator[str]:
+        """
+        One row per allocated file in the order hashing completes; hashes
+        stored earlier are reused. Counts hashed and failed files in totals.
+        """
+        for partition in self.partitions:
+            files = (f for f in self._files(partition) if not f.is_deleted and f.inode is not None)
+            for file_meta, result, error in self.analyzer.hash_files(partition.id, files):
+                totals['failed' if error else 'hashed'] += 1
+                yield row(partition.id, file_meta, result, error)
+
+    def _findings(self):
+        fingerprint = self.image_handler.get_fingerprint()
+        return risk_index.assess(fingerprint, [p.id for p in self.partitions])
+
+    def _json(self) -> Iterator[str]:
+        dumps = json.dumps
+        yield '{"report_generated": ' + dumps(datetime.now().isoformat())
+        if "case" in self.sections and self.request.case is not None:
+            yield ', "case": ' + dumps(self.request.case)
+        if "image" in self.sections:
+            info = self.image_handler.get_image_info()
+            yield ', "image": ' + info.model_dump_json(exclude={"partitions", "stored_results"})
+        if "partitions" in self.sections:
+            yield ', "partitions": [' + ", ".join(p.model_dump_json() for p in self.partitions) + ']'
+
+        if self.sections & {"findings", "timeline", "hashes"}:
+            self._index()
+        if "findings" in self.sections:
+            yield ', "findings": ' + self._findings().model_dump_json()
+        if "timeline" in self.sections:
+            yield ', "timeline": ['
+            for i, (timestamp, event, partition_id, path, inode) in enumerate(self._timeline()):
+                yield (", " if i else "") + dumps({"timestamp": timestamp, "event": event,
+                                                   "partition_id": partition_id, "path": path, "inode": inode})
+            yield ']'
+        if "hashes" in self.sections:
+            def row(partition_id: str, f: FileMetadata, result, error) -> str:
+                record = {"partition_id": partition_id, "path": f.path, "inode": f.inode, "size": f.size}
+                if error:
+                    record["error"] = error
+                else:
+                    record.update(md5=result.md5, sha1=result.sha1, sha256=result.sha256)
+                return dumps(record)
+
+            totals = {'hashed': 0, 'failed': 0}
+            yield ', "hash_manifest": ['
+            for i, line in enumerate(self._manifest(row, totals)):
+                yield (", " if i else "") + line
+            yield '], "hash_summary": ' + dumps(totals)
+        yield '}\n'
+
+    def _text(self) -> Iterator[str]:
+        yield _RULE + "           FORENSICX - FORENSIC REPORT            \n" + _RULE + "\n"
+        yield f"Report Generated: {datetime.now().isoformat(sep=' ', timespec='seconds')}\n\n"
+
+        if "case" in self.sections and self.request.case:
+            yield _section("CASE METADATA")
+            for key, value in self.request.case.items():
+                yield f"{key + ':':<20}{value}\n"
+            yield "\n"
+        if "image" in self.sections:
+            info = self.image_handler.get_image_info()
+            yield _section("IMAGE")
+            yield (f"File:          {info.filename}\n"
+                   f"Format:        {info.format}\n"
+                   f"Size:          {info.size} bytes ({info.total_sectors} sectors of {info.sector_size})\n"
+                   f"Fingerprint:   {info.fingerprint or 'N/A'}\n\n")
+        if "partitions" in self.sections:
+            yield _section("PARTITIONS")
+            for p in self.partitions:
+                yield (f"  {p.id}: {p.filesystem_type} ({p.size // (1024 * 1024)} MB), "
+                       f"sectors {p.start_sector}-{p.end_sector}, {p.status}\n")
+            yield "\n"
+
+        if self.sections & {"findings", "timeline", "hashes"}:
+            self._index()
+        if "findings" in self.sections:
+            assessment = self._findings()
+            cia, mitre = assessment.cia, assessment.mitre
+            yield _section("CIA TRIAD ASSESSMENT")
+            yield (f"Overall Score:   {cia.overall_score}/100 ({cia.risk_level})\n"
+                   f"Confidentiality: {cia.confidentiality_score}/100\n"
+                   f"Integrity:       {cia.integrity_score}/100\n"
+                   f"Availability:    {cia.availability_score}/100\n\n"
+                   f"Summary: {cia.summary}\n\n")
+            if cia.critical_findings:
+                yield "Critical Findings:\n" + "".join(f"  ! {f}\n" for f in cia.critical_findings) + "\n"
+            if cia.recommendations:
+                yield "Recommendations:\n" + "".join(
+                    f"  {i}. {r}\n" for i, r in enumerate(cia.recommendations, 1)) + "\n"
+            if mitre.findings:
+                yield _section("MITRE ATT&CK MAPPING")
+                yield f"{mitre.attack_chain_summary}\n\n"
+                for finding in mitre.findings:
+                    yield (f"  [{finding.confidence}] {finding.tactic}\n"
+                           f"           {finding.technique} ({finding.count} file(s))\n"
+                           + "".join(f"           -> {e}\n" for e in finding.evidence) + "\n")
+        if "timeline" in self.sections:
+            yield _section(f"TIMELINE (LAST {self.request.timeline_limit} EVENTS)")
+            for timestamp, event, partition_id, path, inode in self._timeline():
+                yield f"  {timestamp}  {event:<9} {partition_id}:{path}\n"
+            yield "\n"
+        if "hashes" in self.sections:
+            def row(partition_id: str, f: FileMetadata, result, error) -> str:
+                if error:
+                    return f"  ERROR {error}  {partition_id}:{f.path}\n"
+                return f"  {result.sha256}  {result.md5}  {f.size:>12}  {partition_id}:{f.path}\n"
+
+            totals = {'hashed': 0, 'failed': 0}
+            yield _section("HASH MANIFEST (SHA-256, MD5, SIZE, PATH)")
+            yield from self._manifest(row, totals)
+            yield f"\n  {totals['hashed']} file(s) hashed, {totals['failed']} failed\n\n"
+
+        yield _RULE + "              END OF FORENSIC REPORT               \n" + _RULE
+
+
+def _section(title: str) -> str:
+    return _SECTION_RULE + f"  {title}\n" + _SECTION_RULE
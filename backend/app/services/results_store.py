@@ -0,0 +1,121 @@
+"""
+Persistent store of analysis results keyed by image fingerprint
+Lets a re-opened image (after a restart, or opened by another analyst)
+reuse partition lists, path indexes, hashes and scan results instead of
+recomputing them; only stages missing from the store run again
+"""
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, List, Optional
+from ..config import RESULTS_DB
+from .metrics import registry
+
+
+# Bump when the shape of a stored result changes; older rows are dropped
+STORE_VERSION = 1
+
+results_lookups = registry.counter(
+    "forensix_results_store_lookups_total",
+    "Persistent results store lookups, by stage and whether a stored result was found",
+    ("stage", "result"))
+
+
+class ResultsStore:
+    """
+    SQLite table of (fingerprint, stage, key) -> JSON result
+
+    Values are zlib-compressed JSON. Each thread uses its own connection;
+    WAL mode lets readers proceed while another thread or server process
+    writes. An empty path disables the store.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path or None
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._init_lock:
+                if not self._initialized:
+                    self._create_schema(connection)
+                    self._initialized = True
+        return connection
+
+    def _create_schema(self, connection: sqlite3.Connection):
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != STORE_VERSION:
+            connection.execute("DROP TABLE IF EXISTS results")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " fingerprint TEXT NOT NULL,"
+            " stage TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " value BLOB NOT NULL,"
+            " PRIMARY KEY (fingerprint, stage, key))"
+        )
+        connection.execute(f"PRAGMA user_version={STORE_VERSION}")
+
+    def get(self, fingerprint: str, stage: str, key: str = "") -> Optional[Any]:
+        """Stored result of a stage, or None when it has to be computed"""
+        if not self.enabled or not fingerprint:
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM results WHERE fingerprint = ? AND stage = ? AND key = ?",
+                (fingerprint, stage, key)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Results store lookup failed: {e}")
+            row = None
+        results_lookups.inc(stage=stage, result="hit" if row else "miss")
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def put(self, fingerprint: str, stage: str, value: Any, key: str = ""):
+        """Store (or replace) the result of a stage"""
+        if not self.enabled or not fingerprint:
+            return
+        blob = zlib.compress(json.dumps(value, separators=(",", ":")).encode(), 6)
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO results (fingerprint, stage, key, created, value)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (fingerprint, stage, key, time.time(), blob))
+        except sqlite3.Error as e:
+            # A full disk or locked database must not fail the analysis itself
+            print(f"Results store write failed: {e}")
+
+    def stages(self, fingerprint: str) -> List[str]:
+        """Stages with at least one stored result for an image"""
+        if not self.enabled or not fingerprint:
+            return []
+        rows = self._connection().execute(
+            "SELECT DISTINCT stage FROM results WHERE fingerprint = ? ORDER BY stage",
+            (fingerprint,)).fetchall()
+        return [row[0] for row in rows]
+
+    def forget(self, fingerprint: str) -> int:
+        """Drop every stored result of an image; returns the number removed"""
+        if not self.enabled:
+            return 0
+        cursor = self._connection().execute(
+            "DELETE FROM results WHERE fingerprint = ?", (fingerprint,))
+        return cursor.rowcount
+
+
+results_store = ResultsStore(RESULTS_DB)
@@ -0,0 +1,374 @@
+"""
+CIA and MITRE ATT&CK risk assessment from aggregates
+Counters and capped evidence lists are kept per partition: one set from the
+path index, updated by the entries each directory walk adds and removes,
+and one per rule set, refreshed when a rule scan finishes. Assessments combine these aggregates,
+so their cost does not grow with the number of files in the case.
+"""
+import copy
+import threading
+import weakref
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from ..models.schemas import (
+    CIAAssessment, FileMetadata, MitreFinding, MitreMapping, RiskAssessment, RuleMatch
+)
+from .path_index import PathIndex
+from .results_store import results_store
+
+
+# Paths kept per counter as evidence
+EVIDENCE_LIMIT = 25
+
+EXECUTABLE_EXTENSIONS = {'.exe', '.dll', '.sys', '.bat', '.cmd', '.ps1', '.vbs', '.js'}
+SENSITIVE_EXTENSIONS = {'.pem', '.key', '.pfx', '.p12', '.cer', '.crt'}
+ARCHIVE_EXTENSIONS = {'.zip', '.rar', '.7z', '.tar'}
+LOG_EXTENSIONS = {'.evtx'}
+
+# Rule tag marking files whose content does not match their extension
+SPOOFING_TAG = "T1036.008"
+# Rule tag for credentials stored in files
+CREDENTIAL_TAG_PREFIX = "T1552"
+
+# Tactic and name of the techniques the built-in rules are tagged with
+TECHNIQUES = {
+    "T1003.001": ("TA0006 - Credential Access", "OS Credential Dumping: LSASS Memory"),
+    "T1027": ("TA0005 - Defense Evasion", "Obfuscated Files or Information"),
+    "T1036.008": ("TA0005 - Defense Evasion", "Masquerading: Masquerade File Type"),
+    "T1059.001": ("TA0002 - Execution", "Command and Scripting Interpreter: PowerShell"),
+    "T1070.001": ("TA0005 - Defense Evasion", "Indicator Removal: Clear Windows Event Logs"),
+    "T1552.004": ("TA0006 - Credential Access", "Unsecured Credentials: Private Keys"),
+    "T1560.001": ("TA0009 - Collection", "Archive Collected Data: Archive via Utility"),
+    "T1564.001": ("TA0005 - Defense Evasion", "Hide Artifacts: Hidden Files and Directories"),
+    "T1566.001": ("TA0001 - Initial Access", "Phishing: Spearphishing Attachment"),
+}
+
+
+def _tally() -> Dict[str, Any]:
+    return {"count": 0, "evidence": []}
+
+
+def _count(tally: Dict[str, Any], evidence: str):
+    tally["count"] += 1
+    if len(tally["evidence"]) < EVIDENCE_LIMIT:
+        tally["evidence"].append(evidence)
+
+
+def _merge(tallies: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = _tally()
+    for tally in tallies:
+        merged["count"] += tally["count"]
+        merged["evidence"].extend(tally["evidence"][:EVIDENCE_LIMIT - len(merged["evidence"])])
+    return merged
+
+
+def _timestamp_anomaly(file_meta: FileMetadata) -> bool:
+    """Created after last modified"""
+    created, modified = file_meta.timestamps.created, file_meta.timestamps.modified
+    if not created or not modified:
+        return False
+    try:
+        return datetime.fromisoformat(created) > datetime.fromisoformat(modified)
+    except ValueError:
+        return False
+
+
+FILE_COUNTERS = ('deleted', 'hidden', 'sensitive', 'deleted_executables', 'deleted_logs', 'archives',
+                 'timestamp_anomalies')
+
+
+def _file_counters(f: FileMetadata) -> Iterator[Tuple[str, str]]:
+    """(counter, evidence) pairs a file index entry contributes to"""
+    extension = f.extension.lower()
+    if f.is_deleted:
+        yield 'deleted', f.path
+        if extension in EXECUTABLE_EXTENSIONS:
+            yield 'deleted_executables', f.path
+        if extension in LOG_EXTENSIONS or 'log' in f.name.lower():
+            yield 'deleted_logs', f.path
+    if f.is_hidden:
+        yield 'hidden', f.path
+    if extension in SENSITIVE_EXTENSIONS:
+        yield 'sensitive', f.path
+    if extension in ARCHIVE_EXTENSIONS:
+        yield 'archives', f"{f.path} ({f.size} bytes)"
+    if _timestamp_anomaly(f):
+        yield 'timestamp_anomalies', f.path
+
+
+def file_aggregate(files: Iterable[FileMetadata]) -> Dict[str, Any]:
+    """Counters over file index entries, in one pass"""
+    aggregate = {name: _tally() for name in FILE_COUNTERS}
+    aggregate['total'] = 0
+    apply_file_changes(aggregate, files, ())
+    return aggregate
+
+
+def apply_file_changes(aggregate: Dict[str, Any], added: Iterable[FileMetadata],
+                       removed: Iterable[FileMetadata]):
+    """Update file counters in place for entries added to and removed from the index"""
+    for f in removed:
+        if f.type != 'file':
+            continue
+        aggregate['total'] -= 1
+        for name, evidence in _file_counters(f):
+            tally = aggregate[name]
+            tally["count"] -= 1
+            if evidence in tally["evidence"]:
+                tally["evidence"].remove(evidence)
+    for f in added:
+        if f.type != 'file':
+            continue
+        aggregate['total'] += 1
+        for name, evidence in _file_counters(f):
+            _count(aggregate[name], evidence)
+
+
+def signature_aggregate(matches: Iterable[RuleMatch]) -> Dict[str, Any]:
+    """Counters over the matches of one rule scan"""
+    aggregate = {'spoofed': _tally(), 'spoofed_critical': _tally(), 'credentials': _tally(),
+                 'critical': {}, 'techniques': {}}
+    for match in matches:
+        evidence = f"{match.path} ({match.rule})"
+        if SPOOFING_TAG in match.tags:
+            _count(aggregate['spoofed'], evidence)
+            if match.severity == 'CRITICAL':
+                _count(aggregate['spoofed_critical'], evidence)
+        elif match.severity == 'CRITICAL':
+            _count(aggregate['critical'].setdefault(match.rule, _tally()), match.path)
+        if any(tag.startswith(CREDENTIAL_TAG_PREFIX) for tag in match.tags):
+            _count(aggregate['credentials'], evidence)
+        for tag in match.tags:
+            _count(aggregate['techniques'].setdefault(tag, _tally()), evidence)
+    return aggregate
+
+
+class RiskIndex:
+    """
+    Per-partition risk aggregates, kept in memory and in the results store
+    ('risk' stage) under the image fingerprint
+    """
+
+    def __init__(self):
+        self._aggregates: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # Path indexes whose entries the file counters account for
+        self._counted: "weakref.WeakSet[PathIndex]" = weakref.WeakSet()
+
+    def _put(self, fingerprint: str, partition_id: str, kind: str, aggregate: Dict[str, Any]):
+        aggregate['updated_at'] = datetime.now().isoformat()
+        with self._lock:
+            self._aggregates[(fingerprint, partition_id, kind)] = aggregate
+        if results_store.enabled:
+            results_store.put(fingerprint, 'risk', aggregate, key=f"{partition_id}:{kind}")
+
+    def _get(self, fingerprint: str, partition_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            aggregate = self._aggregates.get((fingerprint, partition_id, kind))
+        if aggregate is None and results_store.enabled:
+            aggregate = results_store.get(fingerprint, 'risk', key=f"{partition_id}:{kind}")
+            if aggregate is not None:
+                with self._lock:
+                    self._aggregates[(fingerprint, partition_id, kind)] = aggregate
+        return aggregate
+
+    def update_files(self, fingerprint: str, partition_id: str, index: PathIndex):
+        """
+        Bring a partition's file counters up to date after a walk, from the
+        entries it added to and removed from the path index; the whole index
+        is counted once per loaded index, as stored counters may include walks
+        the stored index lost
+        """
+        added, removed = index.take_changes()
+        with self._lock:
+            aggregate = self._aggregates.get((fingerprint, partition_id, 'files'))
+            counted = index in self._counted
+            self._counted.add(index)
+        if aggregate is None or not counted:
+            aggregate = file_aggregate(index.metadata())
+        elif added or removed:
+            aggregate = copy.deepcopy(aggregate)
+            apply_file_changes(aggregate, added, removed)
+        else:
+            return
+        self._put(fingerprint, partition_id, 'files', aggregate)
+
+    def update_signatures(self, fingerprint: str, partition_id: str, rule_set: str,
+                          matches: Iterable[RuleMatch]):
+        """Replace a partition's counters for one rule set (after a scan finished)"""
+        signatures = dict(self._get(fingerprint, partition_id, 'signatures') or {})
+        signatures.pop('updated_at', None)
+        signatures[rule_set] = signature_aggregate(matches)
+        self._put(fingerprint, partition_id, 'signatures', signatures)
+
+    def assess(self, fingerprint: str, partition_ids: List[str]) -> RiskAssessment:
+        """CIA assessment and ATT&CK mapping over the stored aggregates of some partitions"""
+        file_aggregates = [a for a in (self._get(fingerprint, p, 'files') for p in partition_ids) if a]
+        signature_sets = [a for a in (self._get(fingerprint, p, 'signatures') for p in partition_ids) if a]
+        scans = [scan for signatures in signature_sets
+                 for rule_set, scan in signatures.items() if rule_set != 'updated_at']
+
+        files = {name: _merge(a[name] for a in file_aggregates) for name in FILE_COUNTERS}
+        total = sum(a['total'] for a in file_aggregates)
+        signatures = {name: _merge(scan[name] for scan in scans)
+                      for name in ('spoofed', 'spoofed_critical', 'credentials')}
+        critical: Dict[str, List[Dict[str, Any]]] = {}
+        techniques: Dict[str, List[Dict[str, Any]]] = {}
+        for scan in scans:
+            for rule, tally in scan['critical'].items():
+                critical.setdefault(rule, []).append(tally)
+            for tag, tally in scan['techniques'].items():
+                techniques.setdefault(tag, []).append(tally)
+
+        updated = [a['updated_at'] for a in file_aggregates + signature_sets]
+        return RiskAssessment(
+            files_indexed=total,
+            rule_scans=len(scans),
+            updated_at=max(updated) if updated else None,
+            cia=_cia_assessment(total, files, signatures,
+                                {rule: _merge(tallies) for rule, tallies in critical.items()}),
+            mitre=_mitre_mapping(files, signatures,
+                                 {tag: _merge(tallies) for tag, tallies in techniques.items()})
+        )
+
+    def discard(self, fingerprint: str):
+        """Forget the in-memory aggregates of an image"""
+        with self._lock:
+            for key in [key for key in self._aggregates if key[0] == fingerprint]:
+                del self._aggregates[key]
+
+
+def _cia_assessment(total: int, files: Dict[str, Dict[str, Any]], signatures: Dict[str, Dict[str, Any]],
+                    critical: Dict[str, Dict[str, Any]]) -> CIAAssessment:
+    """The client's CIA scoring, applied to counters"""
+    confidentiality = integrity = availability = 100
+    confidentiality_findings: List[str] = []
+    integrity_findings: List[str] = []
+    availability_findings: List[str] = []
+    critical_findings: List[str] = []
+    recommendations: List[str] = []
+
+    # Confidentiality
+    sensitive = files['sensitive']['count']
+    if sensitive:
+        confidentiality -= sensitive * 10
+        confidentiality_findings.append(
+            f"Found {sensitive} unencrypted sensitive file(s) (keys, certificates)")
+        recommendations.append('Encrypt all sensitive key files and certificates')
+    credentials = signatures['credentials']['count']
+    if credentials:
+        confidentiality -= credentials * 10
+        confidentiality_findings.append(f"{credentials} file(s) containing unprotected credentials")
+        recommendations.append('Rotate credentials and keys found in files')
+    hidden = files['hidden']['count']
+    if hidden:
+        confidentiality_findings.append(f"{hidden} hidden file(s) detected")
+
+    # Integrity
+    spoofed = signatures['spoofed']['count']
+    if spoofed:
+        integrity -= spoofed * 10
+        integrity_findings.append(f"{spoofed} file(s) with extension/signature mismatch")
+        spoofed_critical = signatures['spoofed_critical']['count']
+        if spoofed_critical:
+            critical_findings.append(f"{spoofed_critical} executable(s) disguised as documents")
+            recommendations.append('Immediately quarantine all spoofed executable files')
+    anomalies = files['timestamp_anomalies']['count']
+    if anomalies:
+        integrity -= anomalies * 5
+        integrity_findings.append(f"{anomalies} file(s) with impossible timestamp combinations")
+        recommendations.append('Investigate files with timestamp anomalies for evidence of tampering')
+    for rule, tally in sorted(critical.items()):
+        critical_findings.append(f"{tally['count']} file(s) matching critical rule {rule}")
+
+    # Availability
+    deleted = files['deleted']['count']
+    if deleted:
+        availability -= min(deleted * 5, 40)
+        availability_findings.append(f"{deleted} file(s) recently deleted")
+        recommendations.append('Review deleted files for evidence of data destruction')
+    deleted_executables = files['deleted_executables']['count']
+    if deleted_executables:
+        availability -= deleted_executables * 10
+        availability_findings.append(
+            f"{deleted_executables} executable(s) deleted (possible malware cleanup)")
+        critical_findings.append('Deleted executables suggest malware removal attempt')
+
+    confidentiality = max(0, min(100, confidentiality))
+    integrity = max(0, min(100, integrity))
+    availability = max(0, min(100, availability))
+    overall = confidentiality * 0.35 + integrity * 0.35 + availability * 0.30
+
+    if overall >= 90:
+        risk_level = 'LOW RISK'
+    elif overall >= 70:
+        risk_level = 'MEDIUM RISK'
+    elif overall >= 50:
+        risk_level = 'HIGH RISK'
+    else:
+        risk_level = 'CRITICAL RISK'
+
+    return CIAAssessment(
+        confidentiality_score=confidentiality,
+        integrity_score=integrity,
+        availability_score=availability,
+        overall_score=round(overall, 1),
+        risk_level=risk_level,
+        summary=(f"System analysis reveals {risk_level.lower()} status. "
+                 f"{spoofed} spoofed file(s), {deleted} deleted file(s), "
+                 f"{hidden} hidden file(s) detected across {total} total files analyzed."),
+        confidentiality_findings=confidentiality_findings,
+        integrity_findings=integrity_findings,
+        availability_findings=availability_findings,
+        critical_findings=critical_findings,
+        recommendations=recommendations,
+        timestamp=datetime.now().isoformat()
+    )
+
+
+def _finding(tactic: str, technique: str, tally: Dict[str, Any], confidence: str,
+             label: str = "") -> MitreFinding:
+    return MitreFinding(tactic=tactic, technique=technique, confidence=confidence, count=tally['count'],
+                        evidence=[f"{label}{evidence}" for evidence in tally['evidence']])
+
+
+def _mitre_mapping(files: Dict[str, Dict[str, Any]], signatures: Dict[str, Dict[str, Any]],
+                   techniques: Dict[str, Dict[str, Any]]) -> MitreMapping:
+    """The client's ATT&CK mapping applied to counters, plus the techniques rule matches are tagged with"""
+    findings: List[MitreFinding] = []
+    actions: List[str] = []
+
+    def technique(tag: str) -> Tuple[str, str]:
+        tactic, name = TECHNIQUES.get(tag, ("Unknown tactic", tag))
+        return tactic, f"{tag} - {name}"
+
+    if signatures['spoofed_critical']['count']:
+        findings.append(_finding(*technique("T1566.001"), signatures['spoofed_critical'], 'HIGH',
+                                 "Spoofed executable: "))
+        actions.append('Investigate email logs for spearphishing campaigns')
+    if files['deleted_logs']['count']:
+        findings.append(_finding(*technique("T1070.001"), files['deleted_logs'], 'HIGH', "Deleted log file: "))
+        actions.append('Check network logs for data exfiltration')
+    if files['hidden']['count']:
+        findings.append(_finding(*technique("T1564.001"), files['hidden'], 'MEDIUM', "Hidden file: "))
+        actions.append('Review all hidden files for malicious content')
+    if files['archives']['count']:
+        findings.append(_finding(*technique("T1560.001"), files['archives'], 'LOW', "Archive file: "))
+        actions.append('Examine archive contents for sensitive data')
+
+    # Techniques named by rule tags; rule matches are content evidence
+    reported = {finding.technique.split(' - ')[0] for finding in findings}
+    for tag, tally in sorted(techniques.items()):
+        if tag in reported:
+            continue
+        findings.append(_finding(*technique(tag), tally, 'HIGH', "Rule match: "))
+
+    summary = (f"Evidence suggests potential compromise involving {len(findings)} MITRE ATT&CK technique(s). "
+               + ", ".join(dict.fromkeys(finding.tactic.split(' - ')[-1] for finding in findings))
+               + " tactics identified."
+               if findings else 'No significant MITRE ATT&CK indicators detected.')
+    return MitreMapping(findings=findings, attack_chain_summary=summary, recommended_actions=actions)
+
+
+# Aggregates of every image analyzed by this process
+risk_index = RiskIndex()
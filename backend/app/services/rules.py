@@ -0,0 +1,464 @@
+"""
+Rule scanning of file contents (in the manner of YARA)
+Rules made of byte, text and regex strings joined by a condition are
+compiled once into a RuleSet; a partition is then scanned as one job on
+the worker pool. Files are filtered by size and extension from the file
+index before anything is read, rules whose strings sit at fixed offsets
+are decided from the file header alone, and streaming stops as soon as
+every rule applying to a file is decided
+"""
+import hashlib
+import json
+import re
+from typing import Callable, Dict, FrozenSet, Generator, Iterable, List, NamedTuple, Optional, Set, Tuple
+from ..config import RULE_SCAN_BATCH_SIZE
+from ..models.schemas import FileMetadata, RuleMatch, RuleString, ScanRule
+from .cache import LRUCache
+from .filesystem_analyzer import FilesystemAnalyzer
+from .image_handler import DiskImageHandler
+from .results_store import results_store
+from .risk import risk_index
+from .workers import worker_pool
+
+
+# Bytes read first from every file; strings with an offset must lie within it
+HEADER_SIZE = 4096
+# Regex matches spanning a chunk boundary are found up to this length
+REGEX_OVERLAP = 4096
+STRING_TYPES = ('text', 'hex', 'regex')
+
+_PE_EXTENSIONS = ['.exe', '.dll', '.sys', '.scr', '.ocx', '.cpl', '.drv', '.efi', '.mui', '.com',
+                  '.ax', '.acm', '.tlb', '.tsp', '.winmd', '.node', '.pyd', '.msstyles']
+_ZIP_EXTENSIONS = ['.zip', '.docx', '.xlsx', '.pptx', '.jar', '.apk', '.odt', '.ods', '.odp',
+                   '.epub', '.xpi', '.whl', '.nupkg', '.vsix', '.kmz', '.ipa', '.aar', '.war', '.ear']
+
+# Rules used when a scan names none; tags carry MITRE ATT&CK technique ids
+BUILTIN_RULES = [
+    ScanRule(
+        name="disguised_pe_executable",
+        description="Windows executable with a non-executable extension",
+        severity="CRITICAL",
+        tags=["T1036.008"],
+        strings=[RuleString(id="mz", type="hex", value="4D5A", offset=0)],
+        condition="$mz",
+        exclude_extensions=_PE_EXTENSIONS,
+    ),
+    ScanRule(
+        name="disguised_elf_or_macho",
+        description="ELF or Mach-O binary with an unrelated extension",
+        severity="CRITICAL",
+        tags=["T1036.008"],
+        strings=[
+            RuleString(id="elf", type="hex", value="7F454C46", offset=0),
+            RuleString(id="macho32", type="hex", value="FEEDFACE", offset=0),
+            RuleString(id="macho64", type="hex", value="FEEDFACF", offset=0),
+        ],
+        condition="any of them",
+        exclude_extensions=['.elf', '.so', '.o', '.ko', '.dylib', '.bundle', ''],
+    ),
+    ScanRule(
+        name="disguised_archive",
+        description="ZIP, RAR or 7-Zip archive with an unrelated extension",
+        severity="HIGH",
+        tags=["T1036.008", "T1560.001"],
+        strings=[
+            RuleString(id="zip", type="hex", value="504B0304", offset=0),
+            RuleString(id="rar", type="hex", value="526172211A07", offset=0),
+            RuleString(id="sevenzip", type="hex", value="377ABCAF271C", offset=0),
+        ],
+        condition="($zip or $rar or $sevenzip)",
+        exclude_extensions=_ZIP_EXTENSIONS + ['.rar', '.7z'],
+    ),
+    ScanRule(
+        name="private_key_material",
+        description="Unencrypted private key in PEM form",
+        severity="HIGH",
+        tags=["T1552.004"],
+        strings=[
+            RuleString(id="pem", type="regex", value=r"-----BEGIN (RSA |EC |DSA |OPENSSH )?PRIVATE KEY-----"),
+            RuleString(id="encrypted", type="text", value="ENCRYPTED"),
+        ],
+        condition="$pem and not $encrypted",
+        max_size=1024 * 1024,
+    ),
+    ScanRule(
+        name="credential_dumping_tool",
+        description="Strings of common credential dumping tools",
+        severity="CRITICAL",
+        tags=["T1003.001"],
+        strings=[
+            RuleString(id="logonpasswords", type="text", value="sekurlsa::logonpasswords", nocase=True),
+            RuleString(id="mimikatz", type="text", value="mimikatz", nocase=True),
+            RuleString(id="lsadump", type="text", value="lsadump::", nocase=True),
+        ],
+        condition="2 of them",
+    ),
+    ScanRule(
+        name="encoded_powershell",
+        description="PowerShell started with a base64 encoded command",
+        severity="HIGH",
+        tags=["T1059.001", "T1027"],
+        strings=[
+            RuleString(id="encoded", type="regex",
+                       value=r"(?i)powershell(\.exe)?[^\r\n]{0,100}\s-e(nc|ncodedcommand)?\s+[A-Za-z0-9+/=]{40,}"),
+        ],
+        condition="$encoded",
+        max_size=16 * 1024 * 1024,
+    ),
+]
+
+
+class _Pattern(NamedTuple):
+    """A compiled rule string"""
+    needle: bytes  # Literal to find (lowercased for nocase strings); empty for regexes
+    regex: Optional["re.Pattern"]
+    nocase: bool
+    offset: Optional[int]  # Must start exactly here when set
+
+
+class CompiledRule(NamedTuple):
+    rule: ScanRule
+    patterns: Dict[str, int]  # String id -> index into the rule set's patterns
+    condition: Callable[[FrozenSet[str]], bool]
+    monotone: bool  # Condition cannot turn false once true (no 'not')
+    header_only: bool  # Every string has an offset inside the header
+    extensions: Optional[FrozenSet[str]]
+    exclude_extensions: FrozenSet[str]
+
+    def applies_to(self, size: int, extension: str) -> bool:
+        rule = self.rule
+        if rule.min_size is not None and size < rule.min_size:
+            return False
+        if rule.max_size is not None and size > rule.max_size:
+            return False
+        if self.extensions is not None and extension not in self.extensions:
+            return False
+        return extension not in self.exclude_extensions
+
+
+class RuleSet:
+    """
+    Rules compiled for scanning
+    Strings shared by several rules are searched once; literals are found
+    with bytes.find and regexes with one compiled pattern each, and a
+    string is no longer searched for once found in a file
+    """
+
+    def __init__(self, rules: List[ScanRule]):
+        self.rules: List[CompiledRule] = []
+        self.fingerprint = rules_fingerprint(rules)
+        pattern_ids: Dict[_Pattern, int] = {}
+        names = set()
+
+        for rule in rules:
+            if rule.name in names:
+                raise ValueError(f"Duplicate rule name: {rule.name}")
+            names.add(rule.name)
+            ids = {}
+            anchored = True
+            for string in rule.strings:
+                if string.id in ids:
+                    raise ValueError(f"Rule {rule.name}: duplicate string ${string.id}")
+                pattern = _compile_string(rule.name, string)
+                ids[string.id] = pattern_ids.setdefault(pattern, len(pattern_ids))
+                anchored = anchored and pattern.offset is not None
+            if not ids:
+                raise ValueError(f"Rule {rule.name} has no strings")
+            condition, monotone = _compile_condition(rule.name, rule.condition, list(ids))
+            self.rules.append(CompiledRule(
+                rule=rule,
+                patterns=ids,
+                condition=condition,
+                monotone=monotone,
+                header_only=anchored,
+                extensions=frozenset(_normalize_extension(e) for e in rule.extensions)
+                if rule.extensions is not None else None,
+                exclude_extensions=frozenset(_normalize_extension(e) for e in rule.exclude_extensions)
+            ))
+        self.patterns: List[_Pattern] = sorted(pattern_ids, key=pattern_ids.get)
+        # Carried from one chunk to the next so matches across the boundary are found
+        floating = [pattern for pattern in self.patterns if pattern.offset is None]
+        self.overlap = max([REGEX_OVERLAP if pattern.regex is not None else len(pattern.needle) - 1
+                            for pattern in floating], default=0)
+
+    def applicable(self, size: int, extension: str) -> List[CompiledRule]:
+        """Rules that apply to a file, from its index entry alone"""
+        extension = _normalize_extension(extension)
+        return [rule for rule in self.rules if rule.applies_to(size, extension)]
+
+    def scan(self, rules: List[CompiledRule], header: bytes,
+             chunks: Callable[[], Iterable[bytes]]) -> List[Tuple[CompiledRule, List[str]]]:
+        """
+        Evaluate rules against one file
+        header holds the file's first HEADER_SIZE bytes; chunks is only
+        called when a rule needs more than the header, and is read until
+        every rule is decided. Returns (rule, matched string ids) per match.
+        """
+        wanted = {index for rule in rules for index in rule.patterns.values()}
+        found: Set[int] = set()
+        anchored = {index for index in wanted if self.patterns[index].offset is not None}
+        for index in anchored:
+            if _match_at(self.patterns[index], header):
+                found.add(index)
+        remaining = wanted - anchored
+
+        def undecided() -> bool:
+            for rule in rules:
+                if rule.header_only:
+                    continue
+                open_patterns = set(rule.patterns.values()) & remaining
+                if not open_patterns:
+                    continue
+                if not (rule.monotone and rule.condition(_found_ids(rule, found))):
+                    return True
+            return False
+
+        if remaining and undecided():
+            tail = b""
+            for chunk in chunks():
+                data = tail + chunk
+                lowered = None
+                for index in list(remaining):
+                    pattern = self.patterns[index]
+                    if pattern.regex is not None:
+                        hit = pattern.regex.search(data) is not None
+                    elif pattern.nocase:
+                        if lowered is None:
+                            lowered = data.lower()
+                        hit = pattern.needle in lowered
+                    else:
+                        hit = pattern.needle in data
+                    if hit:
+                        found.add(index)
+                        remaining.discard(index)
+                if not remaining or not undecided():
+                    break
+                tail = data[-self.overlap:] if self.overlap else b""
+
+        matches = []
+        for rule in rules:
+            ids = _found_ids(rule, found)
+            if rule.condition(ids):
+                matches.append((rule, sorted(ids)))
+        return matches
+
+
+def _found_ids(rule: CompiledRule, found: Set[int]) -> FrozenSet[str]:
+    return frozenset(string_id for string_id, index in rule.patterns.items() if index in found)
+
+
+def _match_at(pattern: _Pattern, header: bytes) -> bool:
+    if pattern.regex is not None:
+        return pattern.regex.match(header, pattern.offset) is not None
+    data = header[pattern.offset:pattern.offset + len(pattern.needle)]
+    return (data.lower() if pattern.nocase else data) == pattern.needle
+
+
+def _normalize_extension(extension: str) -> str:
+    extension = extension.lower()
+    return extension if not extension or extension.startswith('.') else '.' + extension
+
+
+def _compile_string(rule_name: str, string: RuleString) -> _Pattern:
+    """Check and compile one rule string"""
+    where = f"Rule {rule_name}, string ${string.id}"
+    if string.type not in STRING_TYPES:
+        raise ValueError(f"{where}: unknown type {string.type!r} (use {', '.join(STRING_TYPES)})")
+    if string.offset is not None and not 0 <= string.offset < HEADER_SIZE:
+        raise ValueError(f"{where}: offset must be within the first {HEADER_SIZE} bytes")
+
+    if string.type == 'regex':
+        try:
+            regex = re.compile(string.value.encode('utf-8'), re.IGNORECASE if string.nocase else 0)
+        except re.error as e:
+            raise ValueError(f"{where}: invalid regex: {e}")
+        return _Pattern(b"", regex, string.nocase, string.offset)
+
+    if string.type == 'hex':
+        try:
+            needle = bytes.fromhex(string.value)
+        except ValueError:
+            raise ValueError(f"{where}: invalid hex string")
+    else:
+        needle = string.value.encode('utf-8')
+    if not needle:
+        raise ValueError(f"{where}: empty string")
+    if string.offset is not None and string.offset + len(needle) > HEADER_SIZE:
+        raise ValueError(f"{where}: must end within the first {HEADER_SIZE} bytes")
+    return _Pattern(needle.lower() if string.nocase else needle, None, string.nocase, string.offset)
+
+
+_CONDITION_TOKEN = re.compile(r"\s*(?:(\$\w+)|(\d+|any|all)\s+of\s+them\b|(and|or|not)\b|([()]))", re.IGNORECASE)
+
+
+def _compile_condition(rule_name: str, condition: str,
+                       string_ids: List[str]) -> Tuple[Callable[[FrozenSet[str]], bool], bool]:
+    """
+    Compile a condition into a predicate over the set of matched string ids
+    Supports $id, 'any of them', 'all of them', '<n> of them', and, or,
+    not and parentheses. Returns (predicate, monotone).
+    """
+    tokens = []
+    position = 0
+    text = condition.strip()
+    while position < len(text):
+        match = _CONDITION_TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Rule {rule_name}: cannot parse condition at {text[position:]!r}")
+        tokens.append(match.groups())
+        position = match.end()
+        while position < len(text) and text[position].isspace():
+            position += 1
+
+    monotone = not any(keyword and keyword.lower() == 'not' for _, _, keyword, _ in tokens)
+    index = 0
+
+    def peek():
+        return tokens[index] if index < len(tokens) else (None, None, None, None)
+
+    def parse_or():
+        nonlocal index
+        terms = [parse_and()]
+        while (peek()[2] or '').lower() == 'or':
+            index += 1
+            terms.append(parse_and())
+        return terms[0] if len(terms) == 1 else (lambda ids: any(term(ids) for term in terms))
+
+    def parse_and():
+        nonlocal index
+        terms = [parse_not()]
+        while (peek()[2] or '').lower() == 'and':
+            index += 1
+            terms.append(parse_not())
+        return terms[0] if len(terms) == 1 else (lambda ids: all(term(ids) for term in terms))
+
+    def parse_not():
+        nonlocal index
+        if (peek()[2] or '').lower() == 'not':
+            index += 1
+            term = parse_not()
+            return lambda ids: not term(ids)
+        return parse_atom()
+
+    def parse_atom():
+        nonlocal index
+        string_ref, quantity, _, paren = peek()
+        index += 1
+        if string_ref:
+            string_id = string_ref[1:]
+            if string_id not in string_ids:
+                raise ValueError(f"Rule {rule_name}: condition names unknown string {string_ref}")
+            return lambda ids: string_id in ids
+        if quantity:
+            quantity = quantity.lower()
+            needed = 1 if quantity == 'any' else len(string_ids) if quantity == 'all' else int(quantity)
+            return lambda ids: len(ids) >= needed
+        if paren == '(':
+            term = parse_or()
+            if peek()[3] != ')':
+                raise ValueError(f"Rule {rule_name}: unbalanced parentheses in condition")
+            index += 1
+            return term
+        raise ValueError(f"Rule {rule_name}: incomplete condition")
+
+    if not tokens:
+        raise ValueError(f"Rule {rule_name}: empty condition")
+    predicate = parse_or()
+    if index != len(tokens):
+        raise ValueError(f"Rule {rule_name}: unexpected input in condition")
+    return predicate, monotone
+
+
+def rules_fingerprint(rules: List[ScanRule]) -> str:
+    """Short hash identifying a list of rules, under which scan results are stored"""
+    return hashlib.sha256(json.dumps([rule.model_dump(mode='json') for rule in rules],
+                                     sort_keys=True).encode()).hexdigest()[:16]
+
+
+# Rule sets compiled for recent scans, by rule set fingerprint
+_compiled_rule_sets = LRUCache(16)
+
+
+def compile_rules(rules: Optional[List[ScanRule]] = None) -> RuleSet:
+    """Compile rules (the built-in rules when None), reusing an earlier compilation of the same rules"""
+    rules = BUILTIN_RULES if rules is None else rules
+    key = rules_fingerprint(rules)
+    rule_set = _compiled_rule_sets.get(key)
+    if rule_set is None:
+        rule_set = RuleSet(rules)
+        _compiled_rule_sets.put(key, rule_set)
+    return rule_set
+
+
+class RuleScanner:
+    """
+    Scan every file of a partition against a rule set as one job
+    Files are scanned in batches on the worker pool and matches come back
+    as batches complete. A scan read to the end is stored per partition and
+    rule set, with the matches of each inode, and replayed from the store.
+    """
+
+    def __init__(self, image_handler: DiskImageHandler):
+        self.image_handler = image_handler
+        self.analyzer = FilesystemAnalyzer(image_handler)
+
+    def scan(self, partition_id: str, rule_set: RuleSet, path: str = "/", max_files: int = 1000000,
+             include_deleted: bool = False) -> Generator[RuleMatch, None, None]:
+        """Stream the matches of a partition's files"""
+        key = f"{partition_id}:{rule_set.fingerprint}:{path}:{max_files}:{int(include_deleted)}"
+        fingerprint = self.image_handler.get_content_fingerprint() if results_store.enabled else None
+        stored = results_store.get(fingerprint, 'rule_scan', key=key) if fingerprint else None
+        if stored is not None:
+            found = [RuleMatch.model_validate(match) for match in stored]
+            yield from found
+            risk_index.update_signatures(fingerprint, partition_id, rule_set.fingerprint, found)
+            return
+
+        files = [
+            f for f in self.analyzer.list_files(partition_id, path, max_files, include_deleted=include_deleted)
+            if f.type == 'file' and f.size and rule_set.applicable(f.size, f.extension)
+        ]
+        batches = (files[i:i + RULE_SCAN_BATCH_SIZE] for i in range(0, len(files), RULE_SCAN_BATCH_SIZE))
+
+        def scan_batch(batch: List[FileMetadata]) -> List[RuleMatch]:
+            return self._scan_files(partition_id, rule_set, batch)
+
+        found = []
+        for matches in worker_pool.map_unordered(scan_batch, batches):
+            for match in matches:
+                found.append(match)
+                yield match
+
+        # Only reached when the consumer read the whole scan
+        found.sort(key=lambda match: (match.inode or 0, match.rule))
+        if fingerprint:
+            results_store.put(fingerprint, 'rule_scan', [match.model_dump(mode='json') for match in found], key=key)
+        risk_index.update_signatures(self.image_handler.get_fingerprint(), partition_id, rule_set.fingerprint, found)
+
+    def _scan_files(self, partition_id: str, rule_set: RuleSet, files: List[FileMetadata]) -> List[RuleMatch]:
+        """Scan a batch of files, on a worker thread"""
+        fs_info = self.image_handler.get_thread_filesystem(partition_id)
+        matches = []
+        for file_meta in files:
+            rules = rule_set.applicable(file_meta.size, file_meta.extension)
+            try:
+                header = next(iter(self.analyzer.iter_file_chunks(
+                    partition_id, file_meta.path, file_meta.inode, chunk_size=HEADER_SIZE, fs_info=fs_info)), b"")
+
+                def chunks():
+                    return self.analyzer.iter_file_chunks(partition_id, file_meta.path, file_meta.inode,
+                                                          fs_info=fs_info)
+
+                for rule, strings in rule_set.scan(rules, header, chunks):
+                    matches.append(RuleMatch(
+                        inode=file_meta.inode,
+                        path=file_meta.path,
+                        size=file_meta.size,
+                        rule=rule.rule.name,
+                        severity=rule.rule.severity,
+                        tags=rule.rule.tags,
+                        strings=strings
+                    ))
+            except Exception as e:
+                print(f"Error scanning {file_meta.path}: {e}")
+        return matches
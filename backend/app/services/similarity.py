@@ -0,0 +1,229 @@
+"""
+Similarity digests and a near-duplicate index
+A locality-sensitive digest (in the manner of TLSH) is computed from a
+histogram of byte trigrams in the same streaming pass as the
+cryptographic hashes; digests are indexed by bands of their body, so
+near-duplicates are found without comparing every pair of files
+"""
+import math
+import random
+import threading
+from collections import Counter
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+DIGEST_PREFIX = "FX1:"
+
+BUCKETS = 128
+# Files too small or too uniform to say anything about similarity get no digest
+MIN_SIZE = 512
+MIN_NONZERO_BUCKETS = BUCKETS // 2
+
+# Trigram hashes are three byte permutations XORed together, evaluated for
+# all positions of a chunk at once with big-integer arithmetic; a second,
+# independent hash keeps one trigram in SAMPLE_RATE, chosen by content so
+# that insertions do not change which trigrams count
+SAMPLE_RATE = 4
+_random = random.Random(0x5EED)
+
+
+def _permutation() -> bytes:
+    table = list(range(256))
+    _random.shuffle(table)
+    return bytes(table)
+
+
+_BUCKET_TABLES = (_permutation(), _permutation(), _permutation())
+_SAMPLE_TABLES = (_permutation(), _permutation(), _permutation())
+_BUCKET_MASK = bytes(value % BUCKETS for value in range(256))
+# Unsampled positions get the top bit set, which the final translate deletes
+_SAMPLE_FLAG = bytes(0 if value < 256 // SAMPLE_RATE else 0x80 for value in range(256))
+_FLAGGED = bytes(range(0x80, 0x100))
+
+# Distance at or below which two files count as similar (TLSH's usual cut-off)
+DEFAULT_THRESHOLD = 100
+
+# Index bands: the body's 128 two-bit codes in BANDS groups of BAND_CODES
+BANDS = 16
+BAND_CODES = BUCKETS // BANDS
+_BODY_HEX = (BUCKETS // 4) * 2
+_HEADER_HEX = 4
+
+
+def _hash_positions(data: bytes, tables: Tuple[bytes, bytes, bytes]) -> int:
+    """Trigram hash of every position of data, one byte each, as an integer"""
+    count = len(data) - 2
+    first = int.from_bytes(data[:count].translate(tables[0]), 'little')
+    second = int.from_bytes(data[1:count + 1].translate(tables[1]), 'little')
+    third = int.from_bytes(data[2:].translate(tables[2]), 'little')
+    return first ^ second ^ third
+
+
+class SimilarityHasher:
+    """
+    Streaming similarity digest, fed with update() like hashlib objects
+    The last two bytes of each chunk are carried over, so the digest does
+    not depend on how the content was split
+    """
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._tail = b""
+        self.size = 0
+
+    def update(self, chunk: bytes):
+        self.size += len(chunk)
+        data = self._tail + bytes(chunk)
+        if len(data) < 3:
+            self._tail = data
+            return
+        self._tail = data[-2:]
+        count = len(data) - 2
+        bucket = _hash_positions(data, _BUCKET_TABLES).to_bytes(count, 'little').translate(_BUCKET_MASK)
+        flags = _hash_positions(data, _SAMPLE_TABLES).to_bytes(count, 'little').translate(_SAMPLE_FLAG)
+        sampled = (int.from_bytes(bucket, 'little') | int.from_bytes(flags, 'little')).to_bytes(count, 'little')
+        self._counts.update(sampled.translate(None, _FLAGGED))
+
+    def digest(self) -> Optional[str]:
+        """Digest of everything passed to update(), or None if the content is too small or uniform"""
+        if self.size < MIN_SIZE:
+            return None
+        counts = [self._counts.get(bucket, 0) for bucket in range(BUCKETS)]
+        if sum(1 for count in counts if count) <= MIN_NONZERO_BUCKETS:
+            return None
+
+        ordered = sorted(counts)
+        q1, q2, q3 = (ordered[BUCKETS * i // 4 - 1] for i in (1, 2, 3))
+        if not q3:
+            return None
+        body = bytearray(BUCKETS // 4)
+        for bucket, count in enumerate(counts):
+            code = 0 if count <= q1 else 1 if count <= q2 else 2 if count <= q3 else 3
+            body[bucket // 4] |= code << (2 * (bucket % 4))
+
+        length_code = min(255, int(math.log(self.size, 1.1)))
+        ratios = ((q1 * 100 // q3) % 16) << 4 | ((q2 * 100 // q3) % 16)
+        return DIGEST_PREFIX + bytes([length_code, ratios]).hex() + body.hex()
+
+
+def similarity_digest(data: bytes) -> Optional[str]:
+    """Similarity digest of a byte string"""
+    hasher = SimilarityHasher()
+    hasher.update(data)
+    return hasher.digest()
+
+
+def _parse(digest: str) -> Tuple[int, int, int, bytes]:
+    """(length code, q1 ratio, q2 ratio, body) of a digest"""
+    if not digest.startswith(DIGEST_PREFIX) or len(digest) != len(DIGEST_PREFIX) + _HEADER_HEX + _BODY_HEX:
+        raise ValueError(f"Not a similarity digest: {digest!r}")
+    raw = bytes.fromhex(digest[len(DIGEST_PREFIX):])
+    return raw[0], raw[1] >> 4, raw[1] & 0x0F, raw[2:]
+
+
+def _circular(a: int, b: int, modulus: int) -> int:
+    difference = abs(a - b)
+    return min(difference, modulus - difference)
+
+
+# Body distance of two packed bytes (four codes each); codes 0 and 3 apart weigh double
+_BYTE_DISTANCE = [
+    [sum(6 if d == 3 else d for d in (abs(((a >> s) & 3) - ((b >> s) & 3)) for s in (0, 2, 4, 6)))
+     for b in range(256)]
+    for a in range(256)
+]
+
+
+def digest_distance(first: str, second: str) -> int:
+    """
+    Distance between two digests: 0 for identical content profiles,
+    growing as files differ (scored as TLSH scores its digests)
+    """
+    length_a, q1_a, q2_a, body_a = _parse(first)
+    length_b, q1_b, q2_b, body_b = _parse(second)
+
+    distance = 0
+    difference = abs(length_a - length_b)
+    distance += difference if difference <= 1 else difference * 12
+    for a, b in ((q1_a, q1_b), (q2_a, q2_b)):
+        difference = _circular(a, b, 16)
+        distance += difference if difference <= 1 else (difference - 1) * 12
+    distance += sum(_BYTE_DISTANCE[a][b] for a, b in zip(body_a, body_b))
+    return distance
+
+
+def _bands(body: bytes) -> List[Tuple[int, bytes]]:
+    """The body split into BANDS keys of BAND_CODES codes each"""
+    width = BAND_CODES // 4
+    return [(band, body[band * width:(band + 1) * width]) for band in range(BANDS)]
+
+
+class SimilarityIndex:
+    """
+    Locality-sensitive index of similarity digests
+    Each digest is filed under its body bands; a query only scores digests
+    sharing at least one band with it, which near-duplicates almost always
+    do, instead of every digest in the case
+    """
+
+    def __init__(self):
+        self._digests: Dict[Hashable, str] = {}
+        self._bands: Dict[Tuple[int, bytes], Set[Hashable]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def add(self, item: Hashable, digest: str):
+        """File a digest under an item identifier, replacing any earlier one"""
+        bands = _bands(_parse(digest)[3])
+        with self._lock:
+            self._remove(item)
+            self._digests[item] = digest
+            for band in bands:
+                self._bands.setdefault(band, set()).add(item)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove all items matching the predicate"""
+        with self._lock:
+            items = [item for item in self._digests if predicate(item)]
+            for item in items:
+                self._remove(item)
+        return len(items)
+
+    def _remove(self, item: Hashable):
+        digest = self._digests.pop(item, None)
+        if digest is None:
+            return
+        for band in _bands(_parse(digest)[3]):
+            members = self._bands.get(band)
+            if members is not None:
+                members.discard(item)
+                if not members:
+                    del self._bands[band]
+
+    def candidates(self, digest: str) -> Set[Hashable]:
+        """Items sharing at least one band with digest"""
+        found: Set[Hashable] = set()
+        with self._lock:
+            for band in _bands(_parse(digest)[3]):
+                found |= self._bands.get(band, set())
+        return found
+
+    def query(self, digest: str, threshold: int = DEFAULT_THRESHOLD,
+              limit: Optional[int] = None) -> List[Tuple[Hashable, int]]:
+        """Items within threshold of digest as (item, distance), closest first"""
+        matches = []
+        for item in self.candidates(digest):
+            indexed = self._digests.get(item)
+            if indexed is None:
+                continue
+            distance = digest_distance(digest, indexed)
+            if distance <= threshold:
+                matches.append((item, distance))
+        matches.sort(key=lambda match: match[1])
+        return matches[:limit] if limit is not None else matches
+
+
+# Digests of the files indexed so far, across all open images
+similarity_index = SimilarityIndex()
@@ -0,0 +1,228 @@
+"""
+Resumable chunked uploads with incremental hashing
+Parts are written asynchronously with aiofiles and MD5/SHA256 are updated
+as bytes arrive, so a finished upload is already hashed
+"""
+import asyncio
+import hashlib
+import json
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+import aiofiles
+import aiofiles.os
+from ..config import UPLOAD_DIR, UPLOAD_BUFFER_SIZE
+from ..models.schemas import UploadStatus
+
+
+class UploadOffsetError(ValueError):
+    """Raised when a part does not start where the upload currently ends"""
+
+    def __init__(self, expected: int, received: int):
+        super().__init__(f"Upload is at offset {expected}, part starts at {received}")
+        self.expected = expected
+
+
+def sanitize_filename(filename: Optional[str]) -> str:
+    """Strip any directory components from a client-supplied filename"""
+    name = Path((filename or "").replace("\\", "/")).name
+    return name if name not in ("", ".", "..") else "image.bin"
+
+
+# Per-upload layout: the state file, and the data in a directory of its own so
+# no client-supplied filename can collide with the state
+STATE_FILENAME = "upload.json"
+DATA_DIRNAME = "data"
+
+
+class UploadSession:
+    """State of one upload; persisted beside the data so uploads survive restarts"""
+
+    def __init__(self, upload_id: str, filename: str, total_size: Optional[int] = None,
+                 received: int = 0, complete: bool = False,
+                 md5: Optional[str] = None, sha256: Optional[str] = None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.total_size = total_size
+        self.received = received
+        self.complete = complete
+        self.md5 = md5
+        self.sha256 = sha256
+        self.lock = asyncio.Lock()
+        self._md5 = None
+        self._sha256 = None
+        self._hashed = 0
+
+    @property
+    def directory(self) -> Path:
+        return Path(UPLOAD_DIR) / self.upload_id
+
+    @property
+    def data_directory(self) -> Path:
+        return self.directory / DATA_DIRNAME
+
+    @property
+    def part_path(self) -> Path:
+        return self.data_directory / (self.filename + ".part")
+
+    @property
+    def file_path(self) -> Path:
+        return self.data_directory / self.filename
+
+    @property
+    def state_path(self) -> Path:
+        return self.directory / STATE_FILENAME
+
+    def status(self) -> UploadStatus:
+        return UploadStatus(
+            upload_id=self.upload_id,
+            filename=self.filename,
+            total_size=self.total_size,
+            received=self.received,
+            complete=self.complete,
+            file_path=str(self.file_path) if self.complete else None,
+            md5=self.md5,
+            sha256=self.sha256
+        )
+
+    async def save(self):
+        state = {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "total_size": self.total_size,
+            "received": self.received,
+            "complete": self.complete,
+            "md5": self.md5,
+            "sha256": self.sha256,
+        }
+        async with aiofiles.open(self.state_path, "w") as f:
+            await f.write(json.dumps(state))
+
+    async def _ensure_hashers(self):
+        """Rebuild hash state from bytes already on disk (after a restart)"""
+        if self._md5 is not None and self._hashed == self.received:
+            return
+        self._md5, self._sha256, self._hashed = hashlib.md5(), hashlib.sha256(), 0
+        if not self.received:
+            return
+        async with aiofiles.open(self.part_path, "rb") as f:
+            while self._hashed < self.received:
+                chunk = await f.read(min(UPLOAD_BUFFER_SIZE, self.received - self._hashed))
+                if not chunk:
+                    break
+                await self._hash(chunk)
+        self.received = self._hashed
+
+    async def _hash(self, data: bytes):
+        # hashlib releases the GIL on large buffers, so hashing runs off the event loop
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            loop.run_in_executor(None, self._md5.update, data),
+            loop.run_in_executor(None, self._sha256.update, data),
+        )
+        self._hashed += len(data)
+
+    async def write(self, offset: int, chunks: AsyncIterator[bytes]):
+        """Append a part that starts at the current end of the upload"""
+        if self.complete:
+            raise ValueError("Upload is already complete")
+        await self._ensure_hashers()
+        if offset != self.received:
+            raise UploadOffsetError(self.received, offset)
+
+        buffer = bytearray()
+        try:
+            async with aiofiles.open(self.part_path, "r+b") as f:
+                # Drop anything an interrupted part left past the acknowledged offset
+                await f.truncate(offset)
+                await f.seek(offset)
+                async for chunk in chunks:
+                    buffer += chunk
+                    if len(buffer) >= UPLOAD_BUFFER_SIZE:
+                        await self._flush(f, buffer)
+                        buffer = bytearray()
+                if buffer:
+                    await self._flush(f, buffer)
+        finally:
+            await self.save()
+
+    async def _flush(self, f, buffer: bytearray):
+        data = bytes(buffer)
+        if self.total_size is not None and self.received + len(data) > self.total_size:
+            raise ValueError(f"Upload exceeds declared size of {self.total_size} bytes")
+        await f.write(data)
+        await self._hash(data)
+        self.received += len(data)
+
+    async def finish(self):
+        """Verify the size, move the data into place and record the digests"""
+        if self.complete:
+            return
+        await self._ensure_hashers()
+        if self.total_size is not None and self.received != self.total_size:
+            raise ValueError(f"Upload incomplete: {self.received} of {self.total_size} bytes received")
+        self.md5 = self._md5.hexdigest()
+        self.sha256 = self._sha256.hexdigest()
+        await aiofiles.os.rename(self.part_path, self.file_path)
+        self.complete = True
+        await self.save()
+
+
+class UploadManager:
+    """Creates and tracks upload sessions stored under the upload directory"""
+
+    def __init__(self):
+        self._sessions: Dict[str, UploadSession] = {}
+
+    async def create(self, filename: Optional[str], total_size: Optional[int] = None) -> UploadSession:
+        session = UploadSession(uuid.uuid4().hex, sanitize_filename(filename), total_size)
+        await aiofiles.os.makedirs(session.data_directory, exist_ok=True)
+        async with aiofiles.open(session.part_path, "wb"):
+            pass
+        await session.save()
+        self._sessions[session.upload_id] = session
+        return session
+
+    async def get(self, upload_id: str) -> UploadSession:
+        """Get a session, reloading it from disk if the server was restarted"""
+        session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        state_path = Path(UPLOAD_DIR) / upload_id / STATE_FILENAME
+        if not await aiofiles.os.path.exists(state_path):
+            raise KeyError(upload_id)
+        async with aiofiles.open(state_path, "r") as f:
+            state = json.loads(await f.read())
+        session = UploadSession(**state)
+        if not session.complete and await aiofiles.os.path.exists(session.part_path):
+            # Trust the data on disk over the last saved offset
+            session.received = (await aiofiles.os.stat(session.part_path)).st_size
+        self._sessions[upload_id] = session
+        return session
+
+    async def write(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        session = await self.get(upload_id)
+        async with session.lock:
+            await session.write(offset, chunks)
+        return session
+
+    async def complete(self, upload_id: str) -> UploadSession:
+        session = await self.get(upload_id)
+        async with session.lock:
+            await session.finish()
+        return session
+
+    async def abort(self, upload_id: str):
+        session = await self.get(upload_id)
+        async with session.lock:
+            for path in (session.part_path, session.file_path, session.state_path):
+                if await aiofiles.os.path.exists(path):
+                    await aiofiles.os.remove(path)
+            await aiofiles.os.rmdir(session.data_directory)
+            await aiofiles.os.rmdir(session.directory)
+        self._sessions.pop(upload_id, None)
+
+
+upload_manager = UploadManager()
@@ -0,0 +1,278 @@
+"""
+Volume layout analysis: unpartitioned space and hidden partitions
+Gaps before, between and after partitions are sampled for non-zero and
+high-entropy content, so data hidden outside any partition is flagged when
+an image is opened without reading the whole disk
+"""
+import math
+import re
+import struct
+import uuid
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+from ..models.schemas import FlaggedPartition, PartitionInfo, VolumeGap, VolumeLayout
+from .fs_probe import probe_filesystem
+
+
+# Gaps up to this size are read whole (the usual 1 MiB alignment gap included)
+GAP_FULL_READ = 1024 * 1024
+# Larger gaps are sampled once per GAP_SAMPLE_SPACING, between GAP_MIN_SAMPLES and
+# GAP_MAX_SAMPLES times; samples sit on GAP_ALIGN boundaries, where partitions
+# and hidden volumes usually start, and always cover the gap's first and last block
+GAP_SAMPLE_SIZE = 4096
+GAP_MIN_SAMPLES = 16
+GAP_MAX_SAMPLES = 256
+GAP_SAMPLE_SPACING = 1024 * 1024
+GAP_ALIGN = 1024 * 1024
+# Bits per byte from which a sample counts as encrypted or compressed (as the client-side sector scan)
+HIGH_ENTROPY = 7.5
+
+MBR_ENTRY_OFFSET = 0x1BE
+MBR_PROTECTIVE_TYPE = 0xEE
+MBR_HIDDEN_TYPES = {
+    0x11: 'Hidden FAT12',
+    0x14: 'Hidden FAT16 (<32MB)',
+    0x16: 'Hidden FAT16 (>32MB)',
+    0x17: 'Hidden NTFS',
+    0x1B: 'Hidden FAT32',
+    0x1C: 'Hidden FAT32 (LBA)',
+    0x1E: 'Hidden FAT16 (LBA)',
+    0x27: 'Hidden NTFS (recovery)',
+    0x84: 'Hibernation / hidden C:',
+}
+MBR_TYPE_CODE = re.compile(r'\(0x([0-9a-fA-F]{2})\)')
+# TSK descriptions of the partition table entries it lists next to partitions
+TABLE_DESCRIPTION = re.compile(r'\bTable\b|GPT Header')
+
+GPT_SIGNATURE = b"EFI PART"
+GPT_ATTR_REQUIRED = 1 << 0
+GPT_ATTR_HIDDEN = 1 << 62
+GPT_HIDDEN_TYPES = {
+    uuid.UUID("E3C9E316-0B5C-4DB8-817D-F92DF00215AE"): 'Microsoft reserved',
+    uuid.UUID("DE94BBA4-06D1-4D40-A16A-BFD50179D6AC"): 'Windows recovery',
+}
+
+
+def analyze_volume_layout(read: Callable[[int, int], bytes], media_size: int,
+                          partitions: List[PartitionInfo], sector_size: int) -> VolumeLayout:
+    """
+    Report unpartitioned regions and hidden or protective partitions
+
+    Args:
+        read: Positional read function of the image
+        media_size: Image size in bytes
+        partitions: Partitions and partition tables as listed by the image handler
+        sector_size: Unit of the partitions' sector numbers
+    """
+    mbr = _read_exact(read, 0, 512) if media_size >= 512 else b""
+    gpt_entries, backup_area = _read_gpt(read, media_size, sector_size)
+    scheme = 'GPT' if gpt_entries is not None else (
+        'MBR' if mbr[510:512] == b"\x55\xaa" and len(partitions) > 1 else 'none')
+
+    covered = [(p.start_sector * sector_size, p.start_sector * sector_size + p.size) for p in partitions]
+    data = [extent for extent, p in zip(covered, partitions)
+            if not TABLE_DESCRIPTION.search(p.description or "")]
+    if backup_area:
+        covered.append(backup_area)
+    gaps = [
+        _sample_gap(read, start, end - start, media_size, sector_size, location)
+        for start, end, location in _find_gaps(covered, data, media_size, sector_size)
+    ]
+
+    flagged = _flag_partitions(partitions, sector_size, mbr, gpt_entries)
+    return VolumeLayout(
+        scheme=scheme,
+        sector_size=sector_size,
+        media_size=media_size,
+        unpartitioned_bytes=sum(gap.length for gap in gaps),
+        gaps=gaps,
+        flagged_partitions=flagged,
+        suspicious=bool(flagged) or any(gap.status != 'EMPTY' for gap in gaps)
+    )
+
+
+def _read_exact(read: Callable[[int, int], bytes], offset: int, size: int) -> bytes:
+    try:
+        return read(offset, size)
+    except Exception:
+        return b""
+
+
+def _find_gaps(covered: List[Tuple[int, int]], data: List[Tuple[int, int]], media_size: int,
+               sector_size: int) -> List[Tuple[int, int, str]]:
+    """
+    Byte ranges no partition or table covers, as (start, end, location)
+    Locations are relative to the data partitions in data
+    """
+    gaps = []
+    position = 0
+    for start, end in sorted(covered):
+        if start - position >= sector_size:
+            gaps.append((position, min(start, media_size)))
+        position = max(position, end)
+    if media_size - position >= sector_size:
+        gaps.append((position, media_size))
+
+    first = min((start for start, _ in data), default=media_size)
+    last = max((end for _, end in data), default=0)
+    located = []
+    for start, end in gaps:
+        if end <= first:
+            location = 'before_first'
+        elif start >= last:
+            location = 'after_last'
+        else:
+            location = 'between'
+        located.append((start, end, location))
+    return located
+
+
+def _sample_offsets(offset: int, length: int) -> List[int]:
+    """Sample positions spread over a gap"""
+    if length <= GAP_FULL_READ:
+        return list(range(offset, offset + length, GAP_SAMPLE_SIZE))
+    end = offset + length
+    count = min(GAP_MAX_SAMPLES, max(GAP_MIN_SAMPLES, length // GAP_SAMPLE_SPACING))
+    align = GAP_ALIGN if length // count >= GAP_ALIGN else GAP_SAMPLE_SIZE
+    positions = {offset, (end - GAP_SAMPLE_SIZE) // GAP_SAMPLE_SIZE * GAP_SAMPLE_SIZE}
+    for i in range(count):
+        position = -(-(offset + length * i // count) // align) * align
+        if position + GAP_SAMPLE_SIZE <= end:
+            positions.add(position)
+    return sorted(position for position in positions if position >= offset)
+
+
+def _entropy(data: bytes) -> float:
+    """Shannon entropy in bits per byte"""
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def _sample_gap(read: Callable[[int, int], bytes], offset: int, length: int, media_size: int,
+                sector_size: int, location: str) -> VolumeGap:
+    """Sample a gap and classify what it holds"""
+    samples = nonzero = high_entropy = sampled = 0
+    max_entropy = 0.0
+    first_data = signature = None
+
+    if length <= GAP_FULL_READ:
+        whole = _read_exact(read, offset, length)
+        pieces = [(offset + i, whole[i:i + GAP_SAMPLE_SIZE]) for i in range(0, len(whole), GAP_SAMPLE_SIZE)]
+    else:
+        pieces = [(position, _read_exact(read, position, min(GAP_SAMPLE_SIZE, offset + length - position)))
+                  for position in _sample_offsets(offset, length)]
+
+    for position, data in pieces:
+        samples += 1
+        sampled += len(data)
+        if not data or not data.strip(b"\x00"):
+            continue
+        nonzero += 1
+        if first_data is None:
+            first_data = position + len(data) - len(data.lstrip(b"\x00"))
+        entropy = _entropy(data)
+        max_entropy = max(max_entropy, entropy)
+        if entropy >= HIGH_ENTROPY:
+            high_entropy += 1
+        if signature is None and position % sector_size == 0:
+            signature = probe_filesystem(read, position, media_size)
+
+    if signature:
+        status = 'POTENTIAL_HIDDEN_PARTITION'
+    elif high_entropy:
+        status = 'ENCRYPTED_OR_COMPRESSED'
+    elif nonzero:
+        status = 'CONTAINS_DATA'
+    else:
+        status = 'EMPTY'
+
+    return VolumeGap(
+        offset=offset,
+        length=length,
+        start_sector=offset // sector_size,
+        end_sector=(offset + length - 1) // sector_size,
+        location=location,
+        status=status,
+        samples=samples,
+        sampled_bytes=sampled,
+        nonzero_samples=nonzero,
+        high_entropy_samples=high_entropy,
+        max_entropy=round(max_entropy, 3),
+        first_data_offset=first_data,
+        signature=signature
+    )
+
+
+def _read_gpt(read: Callable[[int, int], bytes], media_size: int,
+              sector_size: int) -> Tuple[Optional[List[Tuple[int, uuid.UUID, int]]], Optional[Tuple[int, int]]]:
+    """
+    GPT entries as (first LBA, type GUID, attributes), and the byte range
+    of the backup table at the end of the disk, which no partition covers
+    Returns (None, None) without a valid primary GPT header.
+    """
+    header = _read_exact(read, sector_size, 92)
+    if len(header) < 92 or not header.startswith(GPT_SIGNATURE):
+        return None, None
+    backup_lba, = struct.unpack_from("<Q", header, 32)
+    last_usable, = struct.unpack_from("<Q", header, 48)
+    entries_lba, count, entry_size = struct.unpack_from("<QII", header, 72)
+    if entry_size < 128 or count > 4096:
+        return None, None
+
+    table = _read_exact(read, entries_lba * sector_size, count * entry_size)
+    entries = []
+    for i in range(len(table) // entry_size):
+        entry = table[i * entry_size:(i + 1) * entry_size]
+        type_guid = uuid.UUID(bytes_le=bytes(entry[0:16]))
+        if type_guid.int == 0:
+            continue
+        first_lba, _, attributes = struct.unpack_from("<QQQ", entry, 32)
+        entries.append((first_lba, type_guid, attributes))
+
+    backup_area = None
+    backup_end = (backup_lba + 1) * sector_size
+    if last_usable < backup_lba and backup_end <= media_size:
+        backup_area = ((last_usable + 1) * sector_size, backup_end)
+    return entries, backup_area
+
+
+def _flag_partitions(partitions: List[PartitionInfo], sector_size: int, mbr: bytes,
+                     gpt_entries: Optional[List[Tuple[int, uuid.UUID, int]]]) -> List[FlaggedPartition]:
+    """Partitions whose type or attributes hide them from the operating system"""
+    gpt_by_start = {first_lba: (type_guid, attributes) for first_lba, type_guid, attributes in gpt_entries or []}
+    flagged = []
+    for partition in partitions:
+        reasons = []
+        type_code = None
+        match = MBR_TYPE_CODE.search(partition.description or "")
+        if match:
+            code = int(match.group(1), 16)
+            type_code = f"0x{code:02x}"
+            if code in MBR_HIDDEN_TYPES:
+                reasons.append(f"Hidden partition type ({MBR_HIDDEN_TYPES[code]})")
+
+        # GPT LBAs are in logical sectors, as the partition's own sector numbers
+        gpt = gpt_by_start.get(partition.start_sector)
+        if gpt is not None:
+            type_guid, attributes = gpt
+            type_code = str(type_guid).upper()
+            if type_guid in GPT_HIDDEN_TYPES:
+                reasons.append(f"Hidden partition type ({GPT_HIDDEN_TYPES[type_guid]})")
+            if attributes & GPT_ATTR_HIDDEN:
+                reasons.append("GPT hidden attribute set")
+            if attributes & GPT_ATTR_REQUIRED:
+                reasons.append("GPT platform-required attribute set")
+
+        if reasons:
+            flagged.append(FlaggedPartition(partition_id=partition.id, type_code=type_code, reasons=reasons))
+
+    # A protective MBR entry covers the disk for tools that do not know GPT
+    if mbr[510:512] == b"\x55\xaa":
+        for slot in range(4):
+            entry = mbr[MBR_ENTRY_OFFSET + slot * 16:MBR_ENTRY_OFFSET + (slot + 1) * 16]
+            if entry[4] == MBR_PROTECTIVE_TYPE:
+                reason = "Protective MBR entry" if gpt_entries is not None else \
+                    "Protective MBR entry without a valid GPT"
+                flagged.append(FlaggedPartition(partition_id=None, type_code="0xee",
+                                                reasons=[f"{reason} (MBR slot {slot})"]))
+    return flagged
@@ -0,0 +1,101 @@
+"""
+Shared worker pool for parallel disk analysis
+"""
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Generator, Iterable, Optional
+from ..config import WORKER_THREADS
+from .metrics import register_worker_pool
+from .profiling import profile_in_context
+
+
+class WorkerPool:
+    """
+    Thread pool that keeps track of queued and running tasks
+
+    Tasks run with a copy of the caller's context so per-request state
+    follows the work onto the pool. Tasks must not submit to the same pool
+    and wait on the result, as that can exhaust the workers.
+    """
+
+    def __init__(self, max_workers: int, name: str = "forensix"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Tasks submitted but not yet started"""
+        return self._pending
+
+    @property
+    def active(self) -> int:
+        """Tasks currently running"""
+        return self._running
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Submit a task to the pool"""
+        context = contextvars.copy_context()
+
+        def run():
+            with self._lock:
+                self._pending -= 1
+                self._running += 1
+            try:
+                # Tasks of a profiled request are profiled on the worker thread too
+                profile = profile_in_context(context)
+                if profile is not None:
+                    return context.run(profile.run, fn, *args, **kwargs)
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(run)
+
+    def map_unordered(self, fn: Callable[[Any], Any], items: Iterable[Any],
+                      max_in_flight: Optional[int] = None) -> Generator[Any, None, None]:
+        """
+        Apply fn to every item, yielding results as they complete
+
+        At most max_in_flight tasks are outstanding at any time, so large
+        inputs are consumed lazily and results never pile up in memory.
+        """
+        max_in_flight = max_in_flight or self.max_workers * 2
+        items = iter(items)
+        in_flight = set()
+
+        try:
+            for item in items:
+                in_flight.add(self.submit(fn, item))
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # Consumer stopped early (e.g. client disconnected)
+            for future in in_flight:
+                self.cancel(future)
+
+    def cancel(self, future: Future) -> bool:
+        """Cancel a task that has not started yet"""
+        cancelled = future.cancel()
+        if cancelled:
+            with self._lock:
+                self._pending -= 1
+        return cancelled
+
+
+# Pool shared by all services
+worker_pool = WorkerPool(WORKER_THREADS)
+register_worker_pool(worker_pool)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the ForensiX backend
+Builds (or reuses) deterministic synthetic images, times the core analysis
+operations and HTTP endpoints, and compares the results with a baseline
+
+Every measurement runs in a freshly spawned process so peak RSS and cold
+caches are measured per benchmark rather than accumulated over the run.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional
+
+# Cold-path timings must not be served from results stored by earlier runs;
+# set before spawning so the benchmark processes inherit it
+os.environ["FORENSIX_RESULTS_DB"] = ""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.synthetic_image import build_image, parse_size  # noqa: E402
+
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "forensix_bench_images")
+MAX_FILES = 10 ** 9
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks (run inside the child process)
+# ---------------------------------------------------------------------------
+
+def _open(image_path: str):
+    from app.services.image_handler import DiskImageHandler
+    from app.services.filesystem_analyzer import FilesystemAnalyzer
+
+    handler = DiskImageHandler(image_path)
+    handler.open()
+    partition_id = _data_partition(handler.get_partitions())
+    return handler, FilesystemAnalyzer(handler), partition_id
+
+
+def _data_partition(partitions) -> str:
+    """First partition with a recognised filesystem (skips partition table entries)"""
+    for partition in partitions:
+        if partition.filesystem_type != "Unknown":
+            return partition.id
+    raise RuntimeError("No partition with a supported filesystem found")
+
+
+def _allocated_files(analyzer, partition_id: str):
+    return [f for f in analyzer.list_files(partition_id, max_files=MAX_FILES) if not f.is_deleted]
+
+
+def bench_get_partitions(image_path: str) -> Dict:
+    from app.services.image_handler import DiskImageHandler
+
+    start = time.perf_counter()
+    with DiskImageHandler(image_path) as handler:
+        partitions = handler.get_partitions()
+    return {"seconds": time.perf_counter() - start, "items": len(partitions)}
+
+
+def bench_list_files_cold(image_path: str) -> Dict:
+    handler, analyzer, partition_id = _open(image_path)
+    start = time.perf_counter()
+    files = analyzer.list_files(partition_id, max_files=MAX_FILES)
+    elapsed = time.perf_counter() - start
+    handler.close()
+    return {"seconds": elapsed, "items": len(files)}
+
+
+def bench_list_files_warm(image_path: str) -> Dict:
+    handler, analyzer, partition_id = _open(image_path)
+    analyzer.list_files(partition_id, max_files=MAX_FILES)
+    start = time.perf_counter()
+    files = analyzer.list_files(partition_id, max_files=MAX_FILES)
+    elapsed = time.perf_counter() - start
+    handler.close()
+    return {"seconds": elapsed, "items": len(files)}
+
+
+def bench_read_file(image_path: str) -> Dict:
+    handler, analyzer, partition_id = _open(image_path)
+    files = _allocated_files(analyzer, partition_id)
+    total = 0
+    start = time.perf_counter()
+    for item in files:
+        total += len(analyzer.read_file(partition_id, item.path))
+    elapsed = time.perf_counter() - start
+    handler.close()
+    return {"seconds": elapsed, "items": len(files), "bytes": total}
+
+
+def bench_calculate_file_hash(image_path: str) -> Dict:
+    handler, analyzer, partition_id = _open(image_path)
+    files = _allocated_files(analyzer, partition_id)
+    start = time.perf_counter()
+    for item in files:
+        analyzer.calculate_file_hash(partition_id, item.path)
+    elapsed = time.perf_counter() - start
+    handler.close()
+    return {"seconds": elapsed, "items": len(files), "bytes": sum(item.size for item in files)}
+
+
+def bench_http_endpoints(image_path: str) -> Dict:
+    """open-image, extract-files and read-file for every file through the ASGI app"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    api = "/api/forensics"
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        info = client.post(f"{api}/open-image", json={"file_path": image_path})
+        _check(info)
+        partition_id = _data_partition_json(info.json()["partitions"])
+
+        listing = client.post(f"{api}/extract-files", json={
+            "image_path": image_path, "partition_id": partition_id,
+            "max_files": MAX_FILES, "include_deleted": False
+        })
+        _check(listing)
+        files = listing.json()
+
+        total = 0
+        for item in files:
+            response = client.post(f"{api}/read-file", json={
+                "image_path": image_path, "partition_id": partition_id,
+                "file_path": item["path"], "inode": item["inode"]
+            })
+            _check(response)
+            total += len(response.content)
+        elapsed = time.perf_counter() - start
+        client.post(f"{api}/close-image", json={"file_path": image_path})
+    return {"seconds": elapsed, "items": len(files) + 2, "bytes": total}
+
+
+def _check(response):
+    # httpx errors do not pickle, so report failures as plain exceptions
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.url.path}: {response.status_code} {response.text[:500]}")
+
+
+def _data_partition_json(partitions: List[Dict]) -> str:
+    for partition in partitions:
+        if partition["filesystem_type"] != "Unknown":
+            return partition["id"]
+    raise RuntimeError("No partition with a supported filesystem found")
+
+
+BENCHMARKS: Dict[str, Callable[[str], Dict]] = {
+    "get_partitions": bench_get_partitions,
+    "list_files_cold": bench_list_files_cold,
+    "list_files_warm": bench_list_files_warm,
+    "read_file": bench_read_file,
+    "calculate_file_hash": bench_calculate_file_hash,
+    "http_endpoints": bench_http_endpoints,
+}
+
+
+def _run_in_child(name: str, image_path: str) -> Dict:
+    result = BENCHMARKS[name](image_path)
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def run_once(name: str, image_path: str) -> Dict:
+    """Run one benchmark in a fresh spawned process"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(_run_in_child, name, image_path).result()
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    seconds = statistics.median(run["seconds"] for run in runs)
+    summary = {
+        "seconds": seconds,
+        "min_seconds": min(run["seconds"] for run in runs),
+        "items": runs[0].get("items", 0),
+        "peak_rss_bytes": max(run["peak_rss_bytes"] for run in runs),
+        "repeat": len(runs),
+    }
+    if summary["items"] and seconds:
+        summary["items_per_second"] = summary["items"] / seconds
+    if "bytes" in runs[0]:
+        summary["bytes"] = runs[0]["bytes"]
+        summary["mb_per_second"] = runs[0]["bytes"] / (1024 * 1024) / seconds if seconds else None
+    return summary
+
+
+def ensure_image(cache_dir: str, fs_type: str, size: int, num_files: int,
+                 deleted_ratio: float, seed: int, fragment_run: int) -> Optional[Dict]:
+    """Build an image once per parameter set and reuse it on later runs"""
+    name = f"{fs_type}-{size}-{num_files}-{deleted_ratio}-{seed}-{fragment_run}"
+    image_path = os.path.join(cache_dir, name + ".img")
+    info_path = os.path.join(cache_dir, name + ".json")
+    if os.path.exists(image_path) and os.path.exists(info_path):
+        with open(info_path) as f:
+            return json.load(f)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    print(f"Building {fs_type} image ({size} bytes, {num_files} files)...", flush=True)
+    info = build_image(image_path, fs_type, size, num_files,
+                       deleted_ratio=deleted_ratio, seed=seed, fragment_run=fragment_run)
+    if info is None:
+        return None
+    info.pop("files", None)
+    info["key"] = name
+    with open(info_path, "w") as f:
+        json.dump(info, f)
+    return info
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """List benchmarks that got slower or bigger than the baseline allows"""
+    regressions = []
+    for key, current in results["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous:
+            continue
+        if current["seconds"] > previous["seconds"] * (1 + threshold):
+            regressions.append(
+                f"{key}: {previous['seconds']:.3f}s -> {current['seconds']:.3f}s "
+                f"(+{(current['seconds'] / previous['seconds'] - 1) * 100:.0f}%)"
+            )
+        if current["peak_rss_bytes"] > previous["peak_rss_bytes"] * (1 + threshold):
+            regressions.append(
+                f"{key}: peak RSS {previous['peak_rss_bytes'] // 2 ** 20} MiB -> "
+                f"{current['peak_rss_bytes'] // 2 ** 20} MiB"
+            )
+    return regressions
+
+
+def print_table(results: Dict):
+    print()
+    print(f"{'benchmark':58} {'median s':>10} {'items/s':>10} {'MB/s':>9} {'peak RSS':>10}")
+    print("-" * 101)
+    for key, row in results["results"].items():
+        items_rate = f"{row['items_per_second']:.0f}" if row.get("items_per_second") else "-"
+        mb_rate = f"{row['mb_per_second']:.1f}" if row.get("mb_per_second") else "-"
+        print(f"{key:58} {row['seconds']:>10.4f} {items_rate:>10} {mb_rate:>9} "
+              f"{row['peak_rss_bytes'] / 2 ** 20:>7.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ForensiX backend benchmarks")
+    parser.add_argument("--fs", default="fat32", help="Comma separated filesystems (fat32, ext4)")
+    parser.add_argument("--sizes", default="100M", help="Comma separated image sizes, e.g. 100M,1G,20G")
+    parser.add_argument("--files", type=int, default=1000, help="Files per image")
+    parser.add_argument("--deleted-ratio", type=float, default=0.1)
+    parser.add_argument("--fragment-run", type=int, default=0, help="Clusters per fragment (FAT32)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the median is reported")
+    parser.add_argument("--only", default="", help="Comma separated benchmark names")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where generated images are kept")
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--baseline", help="Baseline results JSON to compare against")
+    parser.add_argument("--save-baseline", help="Write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown / memory growth before a regression is reported")
+    args = parser.parse_args()
+
+    names = [n for n in args.only.split(",") if n] or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "images": {},
+        "results": {},
+    }
+
+    for fs_type in [f for f in args.fs.split(",") if f]:
+        for size_text in [s for s in args.sizes.split(",") if s]:
+            info = ensure_image(args.cache_dir, fs_type, parse_size(size_text), args.files,
+                                args.deleted_ratio, args.seed, args.fragment_run)
+            if info is None:
+                print(f"Skipping {fs_type}: image cannot be built on this system")
+                continue
+            results["images"][info["key"]] = info
+            for name in names:
+                print(f"Running {name} on {info['key']}...", flush=True)
+                runs = [run_once(name, info["path"]) for _ in range(max(1, args.repeat))]
+                results["results"][f"{info['key']}/{name}"] = summarize(runs)
+
+    print_table(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
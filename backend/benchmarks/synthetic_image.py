@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic disk images for benchmarking
+Builds MBR + FAT32 images in pure Python (with deleted entries and optional
+fragmentation) or ext4 filesystems through mkfs.ext4 when it is available
+"""
+import argparse
+import os
+import random
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+from array import array
+from typing import Dict, List, Optional
+
+
+SECTOR_SIZE = 512
+PARTITION_START = 2048  # sectors, 1 MiB aligned like modern partitioning tools
+FAT32_EOC = 0x0FFFFFFF
+DELETED_MARKER = 0xE5
+FIXED_UUID = "6f8f6c1e-5a0b-4c39-9d41-3e2a1f0b7c55"
+FIXED_TIME = 1609459200  # 2021-01-01 00:00:00 UTC
+
+
+def parse_size(value: str) -> int:
+    """Parse sizes like 100M, 2G or 512K"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class SyntheticFile:
+    """A file planned for a synthetic image"""
+
+    def __init__(self, directory: str, name: str, size: int, deleted: bool, seed: int):
+        self.directory = directory
+        self.name = name
+        self.size = size
+        self.deleted = deleted
+        self.seed = seed
+        self.clusters: List[int] = []
+
+    @property
+    def path(self) -> str:
+        return f"/{self.directory}/{self.name}"
+
+    def content(self) -> bytes:
+        return random.Random(self.seed).randbytes(self.size)
+
+
+def plan_files(num_files: int, data_budget: int, deleted_ratio: float,
+               num_dirs: int, seed: int) -> List[SyntheticFile]:
+    """Choose deterministic names, sizes and deleted flags"""
+    rng = random.Random(seed)
+    extensions = ["BIN", "TXT", "JPG", "PDF", "DOC", "EXE", "ZIP", "DB"]
+    mean = max(1, data_budget // max(1, num_files))
+    files = []
+    for i in range(num_files):
+        # Log-normal-ish spread around the mean, like real file systems
+        size = int(min(mean * 8, max(0, rng.expovariate(1 / mean))))
+        directory = f"DIR{i % num_dirs:05d}"
+        name = f"F{i:07d}.{extensions[i % len(extensions)]}"
+        files.append(SyntheticFile(directory, name, size, rng.random() < deleted_ratio, seed * 1000003 + i))
+    return files
+
+
+def _fat_datetime(timestamp: int):
+    year, month, day, hour, minute, second = time.gmtime(timestamp)[:6]
+    date = ((year - 1980) << 9) | (month << 5) | day
+    time_value = (hour << 11) | (minute << 5) | (second // 2)
+    return date, time_value
+
+
+def _dir_entry(name: str, attr: int, cluster: int, size: int, timestamp: int, deleted: bool = False) -> bytes:
+    base, _, ext = name.partition(".")
+    short = base[:8].ljust(8).encode("ascii") + ext[:3].ljust(3).encode("ascii")
+    if deleted:
+        short = bytes([DELETED_MARKER]) + short[1:]
+    date, time_value = _fat_datetime(timestamp)
+    return struct.pack("<11sBBBHHHHHHHI", short, attr, 0, 0, time_value, date, date,
+                       cluster >> 16, time_value, date, cluster & 0xFFFF, size)
+
+
+def _sectors_per_cluster(volume_sectors: int) -> int:
+    """Cluster size table used by Windows for FAT32"""
+    size = volume_sectors * SECTOR_SIZE
+    if size <= 260 * 1024 ** 2:
+        return 1
+    if size <= 8 * 1024 ** 3:
+        return 8
+    if size <= 16 * 1024 ** 3:
+        return 16
+    if size <= 32 * 1024 ** 3:
+        return 32
+    return 64
+
+
+def build_fat32_image(path: str, size: int, files: List[SyntheticFile],
+                      fragment_run: int = 0, timestamp: int = FIXED_TIME) -> Dict:
+    """
+    Write an MBR-partitioned FAT32 image
+
+    Deleted files keep their data and directory entry (first byte 0xE5)
+    but their cluster chain is freed, as FAT drivers do. With fragment_run
+    set, file data is laid out in runs of that many clusters separated by a
+    free cluster.
+    """
+    total_sectors = size // SECTOR_SIZE
+    volume_sectors = total_sectors - PARTITION_START
+    spc = _sectors_per_cluster(volume_sectors)
+    cluster_size = spc * SECTOR_SIZE
+    reserved, num_fats = 32, 2
+    fat_size = -(-(volume_sectors - reserved) // ((256 * spc + num_fats) // 2))
+    first_data_sector = reserved + num_fats * fat_size
+    clusters = (volume_sectors - first_data_sector) // spc
+    if clusters < 65525:
+        raise ValueError("Image too small for FAT32 at this cluster size")
+
+    fat = array("I", [0]) * (clusters + 2)
+    fat[0], fat[1] = 0x0FFFFFF8, FAT32_EOC
+    next_cluster = [2]
+
+    def allocate(count: int, fragment: bool) -> List[int]:
+        chain = []
+        while len(chain) < count:
+            if next_cluster[0] >= clusters + 2:
+                raise ValueError("Image is too small for the planned files")
+            chain.append(next_cluster[0])
+            next_cluster[0] += 1
+            if fragment and fragment_run and len(chain) % fragment_run == 0:
+                next_cluster[0] += 1  # leave a free cluster between runs
+        for current, following in zip(chain, chain[1:]):
+            fat[current] = following
+        if chain:
+            fat[chain[-1]] = FAT32_EOC
+        return chain
+
+    by_dir: Dict[str, List[SyntheticFile]] = {}
+    for item in files:
+        by_dir.setdefault(item.directory, []).append(item)
+
+    # Directory clusters first so metadata sits at the start of the volume
+    root_entries = 1 + len(by_dir)
+    root_chain = allocate(-(-(root_entries * 32) // cluster_size), False)
+    dir_chains = {}
+    for directory, members in by_dir.items():
+        dir_chains[directory] = allocate(-(-((len(members) + 2) * 32) // cluster_size), False)
+
+    for item in files:
+        item.clusters = allocate(-(-item.size // cluster_size), True)
+
+    # Deleted files: data stays, the FAT chain is released
+    for item in files:
+        if item.deleted:
+            for cluster in item.clusters:
+                fat[cluster] = 0
+
+    volume_offset = PARTITION_START * SECTOR_SIZE
+
+    def cluster_offset(cluster: int) -> int:
+        return volume_offset + (first_data_sector + (cluster - 2) * spc) * SECTOR_SIZE
+
+    def write_chain(f, chain: List[int], data: bytes):
+        for i, cluster in enumerate(chain):
+            f.seek(cluster_offset(cluster))
+            f.write(data[i * cluster_size:(i + 1) * cluster_size])
+
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+        # MBR with a single FAT32 (LBA) partition
+        entry = struct.pack("<B3sB3sII", 0x80, b"\x00\x02\x00", 0x0C, b"\xfe\xff\xff",
+                            PARTITION_START, volume_sectors)
+        mbr = bytearray(SECTOR_SIZE)
+        struct.pack_into("<I", mbr, 440, 0x46524E58)
+        mbr[446:462] = entry
+        mbr[510:512] = b"\x55\xaa"
+        f.seek(0)
+        f.write(mbr)
+
+        boot = bytearray(SECTOR_SIZE)
+        boot[0:3] = b"\xeb\x58\x90"
+        boot[3:11] = b"MSWIN4.1"
+        struct.pack_into("<HBHBHHBHHHII", boot, 11, SECTOR_SIZE, spc, reserved, num_fats,
+                         0, 0, 0xF8, 0, 63, 255, PARTITION_START, volume_sectors)
+        struct.pack_into("<IHHIHH", boot, 36, fat_size, 0, 0, 2, 1, 6)
+        struct.pack_into("<BBBI11s8s", boot, 64, 0x80, 0, 0x29, 0x20210101,
+                         b"FORENSIXBNC", b"FAT32   ")
+        boot[510:512] = b"\x55\xaa"
+
+        fsinfo = bytearray(SECTOR_SIZE)
+        struct.pack_into("<I", fsinfo, 0, 0x41615252)
+        struct.pack_into("<III", fsinfo, 484, 0x61417272, sum(1 for v in fat[2:] if v == 0), next_cluster[0])
+        fsinfo[510:512] = b"\x55\xaa"
+
+        for sector, data in ((0, boot), (1, fsinfo), (6, boot), (7, fsinfo)):
+            f.seek(volume_offset + sector * SECTOR_SIZE)
+            f.write(data)
+
+        fat_bytes = fat.tobytes()
+        for copy in range(num_fats):
+            f.seek(volume_offset + (reserved + copy * fat_size) * SECTOR_SIZE)
+            f.write(fat_bytes)
+
+        root = bytearray(_dir_entry("FORENSIX", 0x08, 0, 0, timestamp))
+        for directory in by_dir:
+            root += _dir_entry(directory, 0x10, dir_chains[directory][0], 0, timestamp)
+        write_chain(f, root_chain, bytes(root))
+
+        for directory, members in by_dir.items():
+            chain = dir_chains[directory]
+            entries = bytearray(_dir_entry(".", 0x10, chain[0], 0, timestamp))
+            entries[0:11] = b".          "
+            dotdot = bytearray(_dir_entry("..", 0x10, 0, 0, timestamp))
+            dotdot[0:11] = b"..         "
+            entries += dotdot
+            for item in members:
+                first = item.clusters[0] if item.clusters else 0
+                entries += _dir_entry(item.name, 0x20, first, item.size,
+                                      timestamp + item.seed % 86400, item.deleted)
+            write_chain(f, chain, bytes(entries))
+
+        for item in files:
+            if item.size:
+                write_chain(f, item.clusters, item.content())
+
+    return {
+        "format": "fat32",
+        "size": size,
+        "partition_offset": volume_offset,
+        "cluster_size": cluster_size,
+        "clusters": clusters,
+    }
+
+
+def build_ext4_image(path: str, size: int, files: List[SyntheticFile]) -> Optional[Dict]:
+    """
+    Build an ext4 filesystem with mkfs.ext4 -d (no partition table)
+    Deleted files are removed with debugfs when it is installed.
+    Returns None when mkfs.ext4 is not available.
+    """
+    mkfs = shutil.which("mkfs.ext4")
+    if not mkfs:
+        return None
+
+    staging = tempfile.mkdtemp(prefix="forensix_bench_")
+    try:
+        for item in files:
+            directory = os.path.join(staging, item.directory)
+            os.makedirs(directory, exist_ok=True)
+            file_path = os.path.join(directory, item.name)
+            with open(file_path, "wb") as f:
+                f.write(item.content())
+            os.utime(file_path, (FIXED_TIME, FIXED_TIME + item.seed % 86400))
+
+        if os.path.exists(path):
+            os.remove(path)
+        env = dict(os.environ, E2FSPROGS_FAKE_TIME=str(FIXED_TIME))
+        subprocess.run(
+            [mkfs, "-q", "-F", "-U", FIXED_UUID, "-E", f"hash_seed={FIXED_UUID},root_owner=0:0",
+             "-d", staging, path, str(size // 1024)],
+            check=True, env=env, capture_output=True
+        )
+
+        debugfs = shutil.which("debugfs")
+        deleted = [item for item in files if item.deleted]
+        if debugfs and deleted:
+            commands = "\n".join(f"rm {item.path}" for item in deleted) + "\n"
+            subprocess.run([debugfs, "-w", "-f", "-", path], input=commands.encode(),
+                           check=True, env=env, capture_output=True)
+        elif deleted:
+            for item in deleted:
+                item.deleted = False
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return {"format": "ext4", "size": size, "partition_offset": 0}
+
+
+def build_image(path: str, fs_type: str, size: int, num_files: int,
+                deleted_ratio: float = 0.1, num_dirs: int = 16, seed: int = 1,
+                fill_ratio: float = 0.5, fragment_run: int = 0) -> Optional[Dict]:
+    """
+    Build a synthetic image and return its description
+
+    fill_ratio is the share of the image taken up by file data.
+    """
+    files = plan_files(num_files, int(size * fill_ratio), deleted_ratio, num_dirs, seed)
+    if fs_type == "fat32":
+        info = build_fat32_image(path, size, files, fragment_run=fragment_run)
+    elif fs_type == "ext4":
+        info = build_ext4_image(path, size, files)
+    else:
+        raise ValueError(f"Unsupported filesystem type: {fs_type}")
+    if info is None:
+        return None
+
+    info.update({
+        "path": path,
+        "num_files": num_files,
+        "deleted_files": sum(1 for item in files if item.deleted),
+        "data_bytes": sum(item.size for item in files),
+        "seed": seed,
+        "files": [
+            {"path": item.path, "size": item.size, "deleted": item.deleted}
+            for item in files
+        ],
+    })
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a deterministic synthetic disk image")
+    parser.add_argument("output", help="Image file to create")
+    parser.add_argument("--fs", choices=["fat32", "ext4"], default="fat32")
+    parser.add_argument("--size", default="100M", help="Image size, e.g. 100M or 20G")
+    parser.add_argument("--files", type=int, default=1000, help="Number of files")
+    parser.add_argument("--deleted-ratio", type=float, default=0.1)
+    parser.add_argument("--dirs", type=int, default=16)
+    parser.add_argument("--fill", type=float, default=0.5, help="Share of the image used by file data")
+    parser.add_argument("--fragment-run", type=int, default=0, help="Clusters per fragment (FAT32)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    info = build_image(args.output, args.fs, parse_size(args.size), args.files,
+                       args.deleted_ratio, args.dirs, args.seed, args.fill, args.fragment_run)
+    if info is None:
+        raise SystemExit(f"Cannot build {args.fs} images on this system")
+    print(f"Built {info['format']} image {args.output}: {info['num_files']} files "
+          f"({info['deleted_files']} deleted), {info['data_bytes']} bytes of data")
+
+
+if __name__ == "__main__":
+    main()
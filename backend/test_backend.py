@@ -145,6 +145,252 @@ def test_api():
         return False
 
 
+def test_container_readers():
+    """Test the VHD and VHDX readers on small synthetic images"""
+    print("\n" + "=" * 60)
+    print("Testing Container Readers")
+    print("=" * 60)
+    
+    import struct
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services.containers import (
+        VHDReader, VHDXReader, VHDX_BAT_REGION, VHDX_METADATA_REGION, VHDX_FILE_PARAMETERS,
+        VHDX_VIRTUAL_DISK_SIZE, VHDX_LOGICAL_SECTOR_SIZE
+    )
+    
+    def reader_of(image):
+        return lambda offset, size: bytes(image[offset:offset + size])
+    
+    def vhd_footer(size, disk_type, data_offset):
+        footer = bytearray(512)
+        footer[0:8] = b"conectix"
+        struct.pack_into(">Q", footer, 16, data_offset)
+        struct.pack_into(">Q", footer, 48, size)
+        struct.pack_into(">I", footer, 60, disk_type)
+        return bytes(footer)
+    
+    # Fixed VHD: the disk data followed by the footer
+    disk = os.urandom(8192)
+    image = disk + vhd_footer(len(disk), 2, 0xFFFFFFFFFFFFFFFF)
+    reader = VHDReader(reader_of(image), len(image))
+    assert reader.disk_type == "fixed" and reader.size == len(disk)
+    assert reader.read(1000, 3000) == disk[1000:4000]
+    assert reader.read(8000, 4096) == disk[8000:]
+    print("✓ Fixed VHD")
+    
+    # Dynamic VHD: 4 KiB blocks, block 1 never written
+    block_size = 4096
+    blocks = [os.urandom(block_size), None, os.urandom(block_size)]
+    footer = vhd_footer(block_size * len(blocks), 3, 512)
+    header = bytearray(1024)
+    header[0:8] = b"cxsparse"
+    struct.pack_into(">Q", header, 16, 1536)
+    struct.pack_into(">II", header, 28, len(blocks), block_size)
+    image = bytearray(footer + header) + bytearray(512)
+    bat = []
+    for block in blocks:
+        if block is None:
+            bat.append(0xFFFFFFFF)
+            continue
+        bat.append(len(image) // 512)
+        # One sector of bitmap, then the block data
+        image += b"\xff" * 512 + block
+    image[1536:1536 + 4 * len(bat)] = struct.pack(f">{len(bat)}I", *bat)
+    image += footer
+    reader = VHDReader(reader_of(image), len(image))
+    expected = b"".join(block or bytes(block_size) for block in blocks)
+    assert reader.disk_type == "dynamic" and reader.size == len(expected)
+    assert reader.read(0, len(expected)) == expected
+    assert reader.read(block_size - 100, 200) == expected[block_size - 100:block_size + 100]
+    print("✓ Dynamic VHD")
+    
+    # Dynamic VHDX: 1 MiB blocks, block 0 present and block 1 not
+    mib = 1024 * 1024
+    image = bytearray(2 * mib)
+    image[0:8] = b"vhdxfile"
+    image[64 * 1024:64 * 1024 + 4] = b"head"
+    struct.pack_into("<Q", image, 64 * 1024 + 8, 1)
+    table = 192 * 1024
+    image[table:table + 4] = b"regi"
+    struct.pack_into("<I", image, table + 8, 2)
+    metadata_offset, bat_offset = 256 * 1024, 320 * 1024
+    for i, (guid, offset, length) in enumerate([(VHDX_METADATA_REGION, metadata_offset, 4096),
+                                                (VHDX_BAT_REGION, bat_offset, 16)]):
+        entry = table + 16 + i * 32
+        image[entry:entry + 16] = guid
+        struct.pack_into("<QI", image, entry + 16, offset, length)
+    image[metadata_offset:metadata_offset + 8] = b"metadata"
+    struct.pack_into("<H", image, metadata_offset + 10, 3)
+    items = [(VHDX_FILE_PARAMETERS, struct.pack("<II", mib, 0)),
+             (VHDX_VIRTUAL_DISK_SIZE, struct.pack("<Q", 2 * mib)),
+             (VHDX_LOGICAL_SECTOR_SIZE, struct.pack("<I", 512))]
+    for i, (guid, value) in enumerate(items):
+        entry = metadata_offset + 32 + i * 32
+        item_offset = 1024 + i * 16
+        image[entry:entry + 16] = guid
+        struct.pack_into("<II", image, entry + 16, item_offset, len(value))
+        image[metadata_offset + item_offset:metadata_offset + item_offset + len(value)] = value
+    block = os.urandom(mib)
+    image[mib:2 * mib] = block
+    struct.pack_into("<QQ", image, bat_offset, (1 << 20) | 6, 0)
+    reader = VHDXReader(reader_of(image))
+    assert reader.size == 2 * mib and reader.block_size == mib
+    assert reader.read(0, mib) == block
+    assert reader.read(mib - 10, 20) == block[-10:] + bytes(10)
+    print("✓ Dynamic VHDX")
+    
+    print("\nContainer reader tests passed!")
+    return True
+
+
+def test_nested_containers():
+    """Test container sniffing and in-place ZIP member reads"""
+    print("\n" + "=" * 60)
+    print("Testing Nested Containers")
+    print("=" * 60)
+    
+    import io
+    import zipfile
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services.nested import sniff_container, _stored_member
+    
+    boot_sector = bytes(510) + b"\x55\xaa"
+    assert sniff_container(boot_sector, b"", "disk.img") == 'raw'
+    assert sniff_container(boot_sector, b"", "notes.txt") is None
+    assert sniff_container(bytes(512), b"", "disk.img") is None
+    assert sniff_container(bytes(512), b"conectix" + bytes(504), "disk.bin") == 'vhd'
+    assert sniff_container(b"PK\x03\x04" + bytes(60), b"", "evidence.zip") == 'zip'
+    assert sniff_container(b"PK\x03\x04" + bytes(60), b"", "report.docx") is None
+    print("✓ Container sniffing")
+    
+    member = boot_sector + os.urandom(3000)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("readme.txt", b"x" * 100, compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr(zipfile.ZipInfo("disk.img"), member, compress_type=zipfile.ZIP_STORED)
+    data = buffer.getvalue()
+    read = lambda offset, size: data[offset:offset + size]
+    
+    reader = _stored_member(read, len(data), "disk.img")
+    assert reader.size == len(member)
+    assert reader.read(0, reader.size) == member
+    assert reader.read(500, 20) == member[500:520]
+    print("✓ Stored ZIP member read in place")
+    
+    try:
+        _stored_member(read, len(data), "readme.txt")
+        raise AssertionError("compressed member was accepted")
+    except ValueError:
+        print("✓ Compressed ZIP member rejected")
+    
+    print("\nNested container tests passed!")
+    return True
+
+
+def test_rule_conditions():
+    """Test the scan rule condition parser"""
+    print("\n" + "=" * 60)
+    print("Testing Rule Conditions")
+    print("=" * 60)
+    
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services.rules import _compile_condition
+    
+    ids = ['a', 'b', 'c']
+    cases = [
+        ("any of them", [(set(), False), ({'b'}, True)], True),
+        ("all of them", [({'a', 'b'}, False), ({'a', 'b', 'c'}, True)], True),
+        ("2 of them", [({'c'}, False), ({'a', 'c'}, True)], True),
+        ("$a and ($b or $c)", [({'a'}, False), ({'a', 'c'}, True), ({'b', 'c'}, False)], True),
+        ("$a or $b and $c", [({'a'}, True), ({'b'}, False), ({'b', 'c'}, True)], True),
+        ("$a AND NOT $b", [({'a'}, True), ({'a', 'b'}, False)], False),
+    ]
+    for condition, checks, monotone in cases:
+        predicate, is_monotone = _compile_condition("test", condition, ids)
+        assert is_monotone == monotone, condition
+        for found, expected in checks:
+            assert predicate(frozenset(found)) == expected, (condition, found)
+        print(f"✓ {condition}")
+    
+    for condition in ("$d", "($a or $b", "$a $b", "", "$a and", "some of them"):
+        try:
+            _compile_condition("test", condition, ids)
+            raise AssertionError(f"invalid condition accepted: {condition!r}")
+        except ValueError:
+            pass
+    print("✓ Invalid conditions rejected")
+    
+    print("\nRule condition tests passed!")
+    return True
+
+
+def test_readahead():
+    """Test the read-ahead layer against direct reads, including a failing read"""
+    print("\n" + "=" * 60)
+    print("Testing Read-Ahead")
+    print("=" * 60)
+    
+    import random
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.services.image_io import ReadAheadReader
+    
+    data = os.urandom(4 * 1024 * 1024)
+    read_fn = lambda offset, size: data[offset:offset + size]
+    reader = ReadAheadReader(read_fn, len(data), min_window=16384, max_window=256 * 1024, max_streams=2)
+    
+    # Two interleaved sequential streams plus random reads
+    first, second = 0, 2 * 1024 * 1024
+    rng = random.Random(0)
+    for _ in range(300):
+        assert reader.read(first, 4096) == data[first:first + 4096]
+        first += 4096
+        assert reader.read(second, 1000) == data[second:second + 1000]
+        second += 1000
+        offset = rng.randrange(len(data))
+        assert reader.read(offset, 512) == data[offset:offset + 512]
+    assert reader.read(len(data) - 100, 4096) == data[-100:]
+    print("✓ Interleaved sequential and random reads")
+    
+    # One bad read, on the prefetch thread or in the caller (the first
+    # coalesced window starts at 4096); the stream keeps working afterwards
+    import threading
+    for caller_only, bad_offset in ((False, 65536), (True, 4096)):
+        failed = []
+        
+        def failing_read(offset, size):
+            in_caller = threading.current_thread() is threading.main_thread()
+            if not failed and offset >= bad_offset and (in_caller or not caller_only):
+                failed.append(offset)
+                raise IOError("bad sector")
+            return data[offset:offset + size]
+        
+        reader = ReadAheadReader(failing_read, len(data), min_window=16384, max_window=1024 * 1024)
+        failures = 0
+        offset = 0
+        for _ in range(100):
+            try:
+                assert reader.read(offset, 4096) == data[offset:offset + 4096]
+                offset += 4096
+            except IOError:
+                failures += 1
+        assert failed and failures <= 1 and (failures == 1 or not caller_only), failures
+        assert offset == (100 - failures) * 4096
+        print(f"✓ Recovered after a failed {'foreground' if caller_only else 'background'} read")
+    
+    print("\nRead-ahead tests passed!")
+    return True
+
+
+def _run(test) -> bool:
+    """Run a test that reports failures by raising"""
+    try:
+        return test()
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def main():
     """Run all tests"""
     print("\n" + "=" * 60)
@@ -159,6 +405,10 @@ def main():
     results.append(("pyewf", test_pyewf()))
     results.append(("Services", test_services()))
     results.append(("API", test_api()))
+    results.append(("Container readers", _run(test_container_readers)))
+    results.append(("Nested containers", _run(test_nested_containers)))
+    results.append(("Rule conditions", _run(test_rule_conditions)))
+    results.append(("Read-ahead", _run(test_readahead)))
     
     # Summary
     print("\n" + "=" * 60)
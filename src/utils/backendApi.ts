@@ -5,6 +5,36 @@
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
+// Listings in this media type come as columns instead of one object per record
+const COLUMNS_MEDIA_TYPE = 'application/vnd.forensix.columns+json';
+
+export interface ColumnBatch {
+  length: number;
+  columns: Record<string, unknown[]>;
+}
+
+/**
+ * Rebuild records from a column batch; dotted column names become nested objects
+ */
+export function decodeColumns<T>(batch: ColumnBatch): T[] {
+  const names = Object.keys(batch.columns);
+  const paths = names.map((name) => name.split('.'));
+  const records: T[] = [];
+  for (let i = 0; i < batch.length; i++) {
+    const record: Record<string, unknown> = {};
+    for (let c = 0; c < names.length; c++) {
+      const path = paths[c];
+      let target = record;
+      for (let p = 0; p < path.length - 1; p++) {
+        target = (target[path[p]] ??= {}) as Record<string, unknown>;
+      }
+      target[path[path.length - 1]] = batch.columns[names[c]][i];
+    }
+    records.push(record as T);
+  }
+  return records;
+}
+
 export interface DiskImageInfo {
   filename: string;
   size: number;
@@ -12,6 +42,41 @@ export interface DiskImageInfo {
   partitions: PartitionInfo[];
   sector_size: number;
   total_sectors: number;
+  fingerprint?: string;
+  stored_results?: string[];
+  volume_layout?: VolumeLayout | null;
+}
+
+export interface VolumeGap {
+  offset: number;
+  length: number;
+  start_sector: number;
+  end_sector: number;
+  location: 'before_first' | 'between' | 'after_last';
+  status: 'EMPTY' | 'CONTAINS_DATA' | 'ENCRYPTED_OR_COMPRESSED' | 'POTENTIAL_HIDDEN_PARTITION';
+  samples: number;
+  sampled_bytes: number;
+  nonzero_samples: number;
+  high_entropy_samples: number;
+  max_entropy: number;
+  first_data_offset: number | null;
+  signature: string | null;
+}
+
+export interface FlaggedPartition {
+  partition_id: string | null;
+  type_code: string | null;
+  reasons: string[];
+}
+
+export interface VolumeLayout {
+  scheme: 'MBR' | 'GPT' | 'none';
+  sector_size: number;
+  media_size: number;
+  unpartitioned_bytes: number;
+  gaps: VolumeGap[];
+  flagged_partitions: FlaggedPartition[];
+  suspicious: boolean;
 }
 
 export interface PartitionInfo {
@@ -22,6 +87,7 @@ export interface PartitionInfo {
   start_sector: number;
   end_sector: number;
   size: number;
+  sector_size: number;
   status: string;
   description?: string;
 }
@@ -46,12 +112,162 @@ export interface FileMetadata {
   permissions?: string;
   owner_uid?: number;
   owner_gid?: number;
+  child_count?: number;
+  attributes?: FileAttribute[];
+}
+
+export interface FileAttribute {
+  id: number;
+  type: number;
+  type_name: string;
+  name?: string;
+  size: number;
+  resident: boolean;
+}
+
+export interface DirectoryListing {
+  partition_id: string;
+  inode: number;
+  path: string;
+  entries: FileMetadata[];
+  cached: boolean;
 }
 
 export interface HashResult {
   md5: string;
   sha1: string;
   sha256: string;
+  similarity: string | null;
+}
+
+export interface FileExtent {
+  logical_offset: number;
+  length: number;
+  physical_offset: number | null;
+  sparse: boolean;
+}
+
+export interface FileExtentMap {
+  inode: number;
+  attr_id: number | null;
+  size: number;
+  block_size: number;
+  direct: boolean;
+  reason: string | null;
+  extents: FileExtent[];
+}
+
+export interface SimilarityIndexResult {
+  partition_id: string;
+  indexed: number;
+  without_digest: number;
+  failed: number;
+  index_size: number;
+}
+
+export interface SimilarFile {
+  image_path: string;
+  partition_id: string;
+  inode: number;
+  path: string;
+  distance: number;
+}
+
+export interface SimilaritySearchResult {
+  digest: string;
+  matches: SimilarFile[];
+}
+
+export interface RuleString {
+  id: string;
+  type?: 'text' | 'hex' | 'regex';
+  value: string;
+  nocase?: boolean;
+  offset?: number | null;
+}
+
+export interface ScanRule {
+  name: string;
+  description?: string | null;
+  severity?: 'LOW' | 'MEDIUM' | 'HIGH' | 'CRITICAL';
+  tags?: string[];
+  strings: RuleString[];
+  condition?: string;
+  extensions?: string[] | null;
+  exclude_extensions?: string[];
+  min_size?: number | null;
+  max_size?: number | null;
+}
+
+export interface RuleMatch {
+  inode: number | null;
+  path: string;
+  size: number;
+  rule: string;
+  severity: string;
+  tags: string[];
+  strings: string[];
+}
+
+export interface RiskCIAAssessment {
+  confidentiality_score: number;
+  integrity_score: number;
+  availability_score: number;
+  overall_score: number;
+  risk_level: string;
+  summary: string;
+  confidentiality_findings: string[];
+  integrity_findings: string[];
+  availability_findings: string[];
+  critical_findings: string[];
+  recommendations: string[];
+  timestamp: string;
+}
+
+export interface RiskMitreFinding {
+  tactic: string;
+  technique: string;
+  confidence: string;
+  count: number;
+  evidence: string[];
+}
+
+export interface RiskAssessment {
+  files_indexed: number;
+  rule_scans: number;
+  updated_at: string | null;
+  cia: RiskCIAAssessment;
+  mitre: {
+    findings: RiskMitreFinding[];
+    attack_chain_summary: string;
+    recommended_actions: string[];
+  };
+}
+
+export interface DuplicateLocation {
+  image_path: string;
+  partition_id: string;
+  inode: number;
+  path: string;
+}
+
+export interface DuplicateCluster {
+  size: number;
+  sha256: string;
+  count: number;
+  duplicate_bytes: number;
+  images: number;
+  locations: DuplicateLocation[];
+}
+
+export interface DuplicateReport {
+  files_considered: number;
+  size_groups: number;
+  partial_hashed: number;
+  full_hashed: number;
+  bytes_read: number;
+  duplicate_bytes: number;
+  clusters: DuplicateCluster[];
 }
 
 /**
@@ -74,6 +290,89 @@ export async function uploadDiskImage(file: File): Promise<{ success: boolean; f
   return response.json();
 }
 
+export interface UploadStatus {
+  upload_id: string;
+  filename: string;
+  total_size?: number;
+  received: number;
+  complete: boolean;
+  file_path?: string;
+  md5?: string;
+  sha256?: string;
+}
+
+const UPLOAD_PART_SIZE = 8 * 1024 * 1024;
+
+/**
+ * Upload a disk image in parts, resuming from the server's offset after failures
+ */
+export async function uploadDiskImageChunked(
+  file: File,
+  onProgress?: (received: number, total: number) => void,
+  uploadId?: string
+): Promise<UploadStatus> {
+  let status: UploadStatus;
+  if (uploadId) {
+    const response = await fetch(`${API_BASE_URL}/api/forensics/uploads/${uploadId}`);
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Failed to resume upload');
+    }
+    status = await response.json();
+  } else {
+    const response = await fetch(`${API_BASE_URL}/api/forensics/uploads`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ filename: file.name, total_size: file.size }),
+    });
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Failed to start upload');
+    }
+    status = await response.json();
+  }
+
+  while (status.received < file.size) {
+    const part = file.slice(status.received, status.received + UPLOAD_PART_SIZE);
+    const response = await fetch(
+      `${API_BASE_URL}/api/forensics/uploads/${status.upload_id}?offset=${status.received}`,
+      {
+        method: 'PUT',
+        headers: {
+          'Content-Type': 'application/octet-stream',
+        },
+        body: part,
+      }
+    );
+
+    if (response.status === 409) {
+      // Server is at a different offset (e.g. after an interrupted part)
+      const error = await response.json();
+      status = { ...status, received: error.detail.expected_offset };
+      continue;
+    }
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Failed to upload part');
+    }
+
+    status = await response.json();
+    onProgress?.(status.received, file.size);
+  }
+
+  const response = await fetch(`${API_BASE_URL}/api/forensics/uploads/${status.upload_id}/complete`, {
+    method: 'POST',
+  });
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to complete upload');
+  }
+
+  return response.json();
+}
+
 /**
  * Open a disk image and get its information
  */
@@ -101,6 +400,7 @@ export async function extractFiles(
   imagePath: string,
   partitionId: string,
   options?: {
+    path?: string;
     maxFiles?: number;
     includeDeleted?: boolean;
     includeDirectories?: boolean;
@@ -110,10 +410,12 @@ export async function extractFiles(
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
+      Accept: `${COLUMNS_MEDIA_TYPE}, application/json;q=0.9`,
     },
     body: JSON.stringify({
       image_path: imagePath,
       partition_id: partitionId,
+      path: options?.path || '/',
       max_files: options?.maxFiles || 1000,
       include_deleted: options?.includeDeleted !== false,
       include_directories: options?.includeDirectories || false,
@@ -125,6 +427,153 @@ export async function extractFiles(
     throw new Error(error.detail || 'Failed to extract files');
   }
 
+  if (response.headers.get('Content-Type')?.startsWith(COLUMNS_MEDIA_TYPE)) {
+    return decodeColumns<FileMetadata>(await response.json());
+  }
+  return response.json();
+}
+
+/**
+ * List the immediate children of a single directory (root when inode is omitted)
+ */
+export async function listDirectory(
+  imagePath: string,
+  partitionId: string,
+  options?: {
+    inode?: number;
+    path?: string;
+    includeDeleted?: boolean;
+  }
+): Promise<DirectoryListing> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/list-directory`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      image_path: imagePath,
+      partition_id: partitionId,
+      inode: options?.inode,
+      path: options?.path,
+      include_deleted: options?.includeDeleted !== false,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to list directory');
+  }
+
+  return response.json();
+}
+
+export interface ExportedFile {
+  path: string;
+  export_path: string;
+  inode?: number;
+  size: number;
+  is_deleted: boolean;
+  md5?: string;
+  sha1?: string;
+  sha256?: string;
+  error?: string;
+}
+
+export interface ExportManifest {
+  image_path: string;
+  partition_id: string;
+  created: string;
+  format: string;
+  destination?: string;
+  file_count: number;
+  total_bytes: number;
+  errors: number;
+  files: ExportedFile[];
+}
+
+/**
+ * Export many files at once. 'zip' and 'tar' return the archive (with a
+ * manifest.json member); 'directory' writes on the server and returns the manifest
+ */
+export async function exportFiles(
+  imagePath: string,
+  partitionId: string,
+  options: {
+    files?: { path: string; inode?: number }[];
+    path?: string;
+    extensions?: string[];
+    includeDeleted?: boolean;
+    deletedOnly?: boolean;
+    maxFiles?: number;
+    format?: 'zip' | 'tar' | 'directory';
+    destination?: string;
+  } = {}
+): Promise<Blob | ExportManifest> {
+  const format = options.format || 'zip';
+  const response = await fetch(`${API_BASE_URL}/api/forensics/export-files`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      image_path: imagePath,
+      partition_id: partitionId,
+      files: options.files,
+      path: options.path || '/',
+      extensions: options.extensions,
+      include_deleted: options.includeDeleted !== false,
+      deleted_only: options.deletedOnly || false,
+      max_files: options.maxFiles || 10000,
+      format,
+      destination: options.destination,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to export files');
+  }
+
+  return format === 'directory' ? response.json() : response.blob();
+}
+
+export interface ContainerInfo {
+  path: string;
+  inode?: number;
+  size: number;
+  type: string;
+  is_deleted: boolean;
+  member?: string;
+  image_path?: string;
+  error?: string;
+}
+
+/**
+ * Find images nested in a partition (VHD/VHDX, E01, raw, ZIP members, shadow copies).
+ * Pass a result's image_path to openDiskImage and the other calls to browse it
+ */
+export async function findContainers(
+  imagePath: string,
+  partitionId: string,
+  path: string = '/'
+): Promise<ContainerInfo[]> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/find-containers`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      image_path: imagePath,
+      partition_id: partitionId,
+      path,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to find containers');
+  }
+
   return response.json();
 }
 
@@ -153,9 +602,14 @@ export async function readFile(imagePath: string, partitionId: string, filePath:
 }
 
 /**
- * Calculate hash values for a file
+ * Calculate hash values for a file (with a similarity digest when asked; much slower)
  */
-export async function calculateFileHash(imagePath: string, partitionId: string, filePath: string): Promise<HashResult> {
+export async function calculateFileHash(
+  imagePath: string,
+  partitionId: string,
+  filePath: string,
+  similarity = false
+): Promise<HashResult> {
   const response = await fetch(`${API_BASE_URL}/api/forensics/calculate-hash`, {
     method: 'POST',
     headers: {
@@ -165,6 +619,7 @@ export async function calculateFileHash(imagePath: string, partitionId: string,
       image_path: imagePath,
       partition_id: partitionId,
       file_path: filePath,
+      similarity,
     }),
   });
 
@@ -176,6 +631,167 @@ export async function calculateFileHash(imagePath: string, partitionId: string,
   return response.json();
 }
 
+/**
+ * Get where a file's content lies in the image
+ */
+export async function getFileExtents(imagePath: string, partitionId: string, filePath: string, inode?: number): Promise<FileExtentMap> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/file-extents`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      image_path: imagePath,
+      partition_id: partitionId,
+      file_path: filePath,
+      inode,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to get file extents');
+  }
+
+  return response.json();
+}
+
+/**
+ * Add a partition's files to the similarity index
+ */
+export async function indexSimilarity(imagePath: string, partitionId: string, path: string = '/'): Promise<SimilarityIndexResult> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/similarity-index`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      image_path: imagePath,
+      partition_id: partitionId,
+      path,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to index files');
+  }
+
+  return response.json();
+}
+
+/**
+ * Find indexed files similar to a file, across all indexed images
+ */
+export async function findSimilarFiles(imagePath: string, partitionId: string, filePath: string, threshold: number = 100): Promise<SimilaritySearchResult> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/similar-files`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      image_path: imagePath,
+      partition_id: partitionId,
+      file_path: filePath,
+      threshold,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to find similar files');
+  }
+
+  return response.json();
+}
+
+/**
+ * Find identical files across images (every open image when none are given)
+ */
+export async function findDuplicates(
+  sources: { image_path: string; partition_id?: string }[] = [],
+  minSize: number = 1
+): Promise<DuplicateReport> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/find-duplicates`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      sources,
+      min_size: minSize,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to find duplicates');
+  }
+
+  return response.json();
+}
+
+/**
+ * Get CIA scores and the ATT&CK mapping of a partition (all partitions when omitted)
+ * from the server's file index and rule scan counters
+ */
+export async function getRiskAssessment(
+  imagePath: string,
+  partitionId?: string
+): Promise<RiskAssessment> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/risk-assessment`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      image_path: imagePath,
+      partition_id: partitionId,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to get risk assessment');
+  }
+
+  return response.json();
+}
+
+/**
+ * Get the built-in rules used by rule scans that name none
+ */
+export async function getScanRules(): Promise<ScanRule[]> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/scan-rules`);
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to get scan rules');
+  }
+
+  return response.json();
+}
+
+/**
+ * Get unpartitioned regions and hidden partitions of an open image
+ */
+export async function getVolumeLayout(filePath: string): Promise<VolumeLayout> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/volume-layout`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ file_path: filePath }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to analyze volume layout');
+  }
+
+  return response.json();
+}
+
 /**
  * Close a disk image
  */
@@ -196,6 +812,22 @@ export async function closeDiskImage(filePath: string): Promise<{ success: boole
   return response.json();
 }
 
+/**
+ * Drop the stored analysis results of an image so it is analyzed afresh
+ */
+export async function forgetStoredResults(fingerprint: string): Promise<{ success: boolean; removed: number }> {
+  const response = await fetch(`${API_BASE_URL}/api/forensics/results/${encodeURIComponent(fingerprint)}`, {
+    method: 'DELETE',
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to forget stored results');
+  }
+
+  return response.json();
+}
+
 /**
  * Health check
  */